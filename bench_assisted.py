@@ -0,0 +1,134 @@
+"""
+보조(assisted) 디코딩 벤치마크
+
+추출 프롬프트로 본 모델 단독 greedy 생성과 초안 모델 보조 생성을 비교해
+- 초안 토큰 수락률: 본 모델 출력 위치마다 초안 모델의 argmax가 같은 비율 (teacher forcing)
+- 종단 지연 시간과 속도 향상
+- 출력 일치 여부 (greedy에서는 보조 디코딩도 출력이 같아야 함)
+을 출력한다.
+
+    python bench_assisted.py --draft distilgpt2
+    python bench_assisted.py --draft distilgpt2 --inputs inputs.txt --repeat 3 --num-assistant-tokens 8
+"""
+import argparse
+import os
+import statistics
+import time
+
+SAMPLE_INPUTS = [
+    "오늘 점심 김치찌개 9000원",
+    "어제 택시비 15000원 지출",
+    "내일 오후 3시 치과 예약",
+    "다음주 월요일 10시 팀 회의",
+    "김철수 010-1234-5678 회사 동료 연락처 저장",
+    "이번달 월급 3500000원 수입",
+    "10월 25일 엄마 생신",
+    "오늘 스타벅스 아메리카노 4500원 샀어",
+    "메모: 주말에 대청소하기",
+    "금요일 저녁 7시 친구랑 약속",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="보조 디코딩 수락률/속도 벤치마크")
+    parser.add_argument("--draft", default="distilgpt2", help="초안 모델 이름 또는 경로")
+    parser.add_argument("--num-assistant-tokens", type=int, default=5)
+    parser.add_argument("--inputs", default=None, help="한 줄에 입력 하나인 파일 (기본: 내장 예시)")
+    parser.add_argument("--repeat", type=int, default=2, help="입력별 반복 횟수 (첫 회는 워밍업으로 제외)")
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    return parser.parse_args()
+
+
+args = parse_args()
+
+# server.py가 로딩 시 초안 모델을 함께 읽도록 설정 (생성 캐시는 측정을 왜곡하므로 끔)
+os.environ["DRAFT_MODEL_NAME"] = args.draft
+os.environ["DRAFT_NUM_TOKENS"] = str(args.num_assistant_tokens)
+os.environ["GENERATION_CACHE_PATH"] = ""
+
+import torch  # noqa: E402
+import server  # noqa: E402
+
+
+def timed_generate(inputs, assistant_model=None):
+    kwargs = {'assistant_model': assistant_model} if assistant_model is not None else {}
+    started = time.perf_counter()
+    with torch.no_grad():
+        outputs = server.model.generate(
+            **inputs,
+            max_new_tokens=args.max_new_tokens,
+            do_sample=False,
+            pad_token_id=server.tokenizer.eos_token_id,
+            **kwargs,
+        )
+    return outputs, time.perf_counter() - started
+
+
+def acceptance(sequence, prompt_length: int) -> tuple:
+    """본 모델 출력을 정답으로 두고 초안 모델 argmax가 일치하는 위치 수 / 전체 생성 위치 수"""
+    with torch.no_grad():
+        logits = server.draft_model(sequence).logits[0]
+    # 위치 i의 logits는 i+1번째 토큰 예측
+    predicted = logits[prompt_length - 1:-1].argmax(dim=-1)
+    target = sequence[0, prompt_length:]
+    return int((predicted == target).sum()), int(target.numel())
+
+
+def main():
+    if server.draft_model is None:
+        raise SystemExit(f"초안 모델 {args.draft}을(를) 사용할 수 없습니다")
+
+    if args.inputs:
+        with open(args.inputs, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = SAMPLE_INPUTS
+
+    current_time = server.get_current_kst_datetime()
+    accepted_total = generated_total = 0
+    base_times, assisted_times = [], []
+    mismatches = 0
+
+    print(f"{'입력':<30} {'토큰':>5} {'수락률':>7} {'단독(ms)':>10} {'보조(ms)':>10} {'배속':>6}")
+    for text in texts:
+        prompt = server.build_extraction_prompt(text, current_time)
+        inputs = server.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)
+        prompt_length = inputs['input_ids'].shape[1]
+
+        base_runs, assisted_runs = [], []
+        for run in range(args.repeat):
+            base_output, base_seconds = timed_generate(inputs)
+            assisted_output, assisted_seconds = timed_generate(inputs, server.draft_model)
+            if run > 0 or args.repeat == 1:
+                base_runs.append(base_seconds)
+                assisted_runs.append(assisted_seconds)
+
+        if not torch.equal(base_output, assisted_output):
+            mismatches += 1
+
+        accepted, generated = acceptance(base_output, prompt_length)
+        accepted_total += accepted
+        generated_total += generated
+        base_ms = statistics.median(base_runs) * 1000
+        assisted_ms = statistics.median(assisted_runs) * 1000
+        base_times.append(base_ms)
+        assisted_times.append(assisted_ms)
+        rate = accepted / generated if generated else 0.0
+        print(f"{text[:30]:<30} {generated:>5} {rate:>7.1%} {base_ms:>10.1f} {assisted_ms:>10.1f} "
+              f"{base_ms / assisted_ms:>5.2f}x")
+
+    rate = accepted_total / generated_total if generated_total else 0.0
+    k = args.num_assistant_tokens
+    # 수락률 a, 제안 길이 k일 때 본 모델 forward 한 번당 기대 진행 토큰 수
+    expected_tokens = (1 - rate ** (k + 1)) / (1 - rate) if rate < 1 else k + 1
+    print()
+    print(f"초안 모델: {args.draft}, 제안 토큰 수(초기): {k}")
+    print(f"토큰 수락률: {rate:.1%} ({accepted_total}/{generated_total})")
+    print(f"forward당 기대 토큰 수: {expected_tokens:.2f}")
+    print(f"지연 시간 합계: 단독 {sum(base_times):.0f}ms, 보조 {sum(assisted_times):.0f}ms "
+          f"→ {sum(base_times) / sum(assisted_times):.2f}x")
+    print(f"출력 불일치: {mismatches}/{len(texts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+원격 모델 위임(ESCALATION_URL) 테스트용 로컬 대역 서버
+
+    python escalation_mock.py --port 8001 --delay 0.5 --fail-rate 0.1
+    ESCALATION_URL=http://localhost:8001/escalate python server.py
+
+요청 본문({text, contextData, reason})을 받아 ProcessResponse 형태로 고정 응답을 돌려줌.
+지연과 실패율을 조절해 타임아웃/재시도/요청 병합 동작을 확인할 수 있다.
+"""
+import argparse
+import asyncio
+import random
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
+
+app = FastAPI()
+settings = {'delay': 0.0, 'fail_rate': 0.0}
+stats = {'requests': 0, 'failed': 0}
+
+
+class EscalationRequest(BaseModel):
+    text: str
+    contextData: Dict[str, Any] = Field(default_factory=dict)
+    reason: Optional[str] = None
+
+
+@app.post("/escalate")
+async def escalate(request: EscalationRequest):
+    stats['requests'] += 1
+    await asyncio.sleep(settings['delay'])
+    if random.random() < settings['fail_rate']:
+        stats['failed'] += 1
+        raise HTTPException(status_code=503, detail="mock upstream failure")
+    return {
+        'answer': f"[mock] {request.text}",
+        'dataExtraction': {'contacts': [], 'schedule': [], 'expenses': [], 'diary': []},
+        'dataModification': {'contacts': [], 'schedule': [], 'expenses': [], 'diary': []},
+        'dataDeletion': {'contacts': [], 'schedule': [], 'expenses': [], 'diary': []},
+        'usedModel': "escalation-mock",
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="원격 모델 위임 테스트용 대역 서버")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.0, help="응답 지연 (초)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="503 응답 비율 (0~1)")
+    args = parser.parse_args()
+    settings['delay'] = args.delay
+    settings['fail_rate'] = args.fail_rate
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
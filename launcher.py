@@ -0,0 +1,159 @@
+"""
+LifeONE 로컬 모델 서버 멀티 워커 실행기
+
+사용 가능한 CPU 코어를 워커 프로세스들에 나눠 배정하고, 워커마다 torch
+intra/inter-op 스레드 수를 배정된 코어 수에 맞춰 설정한다. 워커마다 torch가
+전체 코어를 쓰려고 하면서 생기는 과다 구독(oversubscription)을 막기 위함.
+
+    python launcher.py --preset throughput            # 코어 2개씩, 워커 여러 개
+    python launcher.py --preset latency --pin-cpus    # 워커 적게, 워커당 코어 많이
+    python launcher.py --workers 3 --port 8000
+
+워커가 여러 개면 /api/process와 이어지는 /api/clarify가 다른 워커로 갈 수 있으므로
+확인 질문 대기 상태는 파일 저장소로 공유한다 (RECORD_STORE_PATH나 CLARIFICATION_STORE_PATH가
+없으면 DEFAULT_CLARIFICATION_STORE_PATH 사용).
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+# 멀티 워커에서 저장 경로가 지정되지 않았을 때 워커들이 함께 쓰는 확인 질문 저장소
+DEFAULT_CLARIFICATION_STORE_PATH = "./clarifications.sqlite3"
+
+# 프리셋별 워커당 코어 수 (워커 수를 지정하지 않았을 때 사용)
+PRESETS = {
+    # 처리량 우선: 작은 워커를 많이 띄워 동시 요청을 병렬 처리
+    'throughput': {'cores_per_worker': 2, 'inter_op_threads': 1},
+    # 지연 우선: 워커당 코어를 많이 줘서 요청 하나의 generate를 빠르게
+    'latency': {'cores_per_worker': 8, 'inter_op_threads': 2},
+}
+
+
+def available_cpus() -> list:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_layout(cpus: list, preset: str, workers: int = None) -> list:
+    """코어 목록을 워커별 연속 구간으로 분할 (남는 코어는 앞 워커부터 하나씩 추가)"""
+    settings = PRESETS[preset]
+    if workers is None:
+        workers = max(1, len(cpus) // settings['cores_per_worker'])
+    workers = max(1, min(workers, len(cpus)))
+
+    base, extra = divmod(len(cpus), workers)
+    layout = []
+    start = 0
+    for index in range(workers):
+        size = base + (1 if index < extra else 0)
+        assigned = cpus[start:start + size]
+        start += size
+        layout.append({
+            'worker': index,
+            'cpus': assigned,
+            'intra_op_threads': len(assigned),
+            'inter_op_threads': min(settings['inter_op_threads'], len(assigned)),
+        })
+    return layout
+
+
+def shared_store_env(workers: int, environ) -> dict:
+    """워커 간에 공유해야 하는 저장소 경로 (워커가 하나거나 이미 지정됐으면 그대로)"""
+    if workers <= 1 or environ.get('RECORD_STORE_PATH'):
+        return {}
+    if 'CLARIFICATION_STORE_PATH' not in environ:
+        print(f"[실행기] 워커 {workers}개가 확인 질문 대기 상태를 공유하도록 "
+              f"CLARIFICATION_STORE_PATH={DEFAULT_CLARIFICATION_STORE_PATH} 사용")
+        return {'CLARIFICATION_STORE_PATH': DEFAULT_CLARIFICATION_STORE_PATH}
+    if not environ['CLARIFICATION_STORE_PATH']:
+        print("[실행기] 경고: CLARIFICATION_STORE_PATH가 비어 있어 워커마다 메모리에 저장 - "
+              "/api/clarify가 다른 워커로 가면 실패합니다")
+    return {}
+
+
+def worker_env(plan: dict, preset: str, pin_cpus: bool) -> dict:
+    env = dict(os.environ)
+    env.update({
+        'WORKER_INDEX': str(plan['worker']),
+        'WORKER_PRESET': preset,
+        'WORKER_CPUS': ','.join(map(str, plan['cpus'])),
+        'WORKER_PIN_CPUS': '1' if pin_cpus else '0',
+        'TORCH_INTRA_OP_THREADS': str(plan['intra_op_threads']),
+        'TORCH_INTER_OP_THREADS': str(plan['inter_op_threads']),
+        # OpenMP/MKL 스레드 풀도 같은 크기로 맞춤
+        'OMP_NUM_THREADS': str(plan['intra_op_threads']),
+        'MKL_NUM_THREADS': str(plan['intra_op_threads']),
+    })
+    return env
+
+
+def start_worker(plan: dict, fd: int, preset: str, pin_cpus: bool) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--fd", str(fd)],
+        env=worker_env(plan, preset, pin_cpus),
+        pass_fds=[fd],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LifeONE 로컬 모델 서버 멀티 워커 실행기")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="워커 수 (기본: 프리셋 기준 자동)")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="throughput")
+    parser.add_argument("--pin-cpus", action="store_true", help="워커를 배정된 코어에 고정 (Linux)")
+    args = parser.parse_args()
+
+    layout = plan_layout(available_cpus(), args.preset, args.workers)
+    print(f"[실행기] 프리셋: {args.preset}, 워커 {len(layout)}개, CPU 고정: {args.pin_cpus}")
+    for plan in layout:
+        print(f"[실행기] 워커 {plan['worker']}: CPU {plan['cpus']} "
+              f"(intra-op {plan['intra_op_threads']}, inter-op {plan['inter_op_threads']})")
+
+    # worker_env가 os.environ을 복사하므로 모든 워커에 같은 경로가 전달됨
+    os.environ.update(shared_store_env(len(layout), os.environ))
+
+    # 소켓은 부모가 한 번만 열고 워커들이 공유
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    print(f"[실행기] http://{args.host}:{args.port} 에서 대기")
+
+    workers = {plan['worker']: start_worker(plan, sock.fileno(), args.preset, args.pin_cpus) for plan in layout}
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in workers.values():
+            process.terminate()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    # 비정상 종료한 워커는 같은 배치로 다시 띄움
+    while not stopping:
+        time.sleep(1)
+        for plan in layout:
+            process = workers[plan['worker']]
+            if process.poll() is not None and not stopping:
+                print(f"[실행기] 워커 {plan['worker']} 종료됨 (코드 {process.returncode}) - 재시작")
+                time.sleep(1)
+                workers[plan['worker']] = start_worker(plan, sock.fileno(), args.preset, args.pin_cpus)
+
+    for process in workers.values():
+        process.wait()
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
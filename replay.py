@@ -0,0 +1,220 @@
+"""
+트래픽 재생 도구 (지연 시간 회귀 테스트)
+
+server.py를 CAPTURE_PATH로 실행해 모은 익명화 요청 로그(JSONL, .gz 가능)를
+원래 도착 간격(또는 배속)대로 다시 보내고
+- 지연 시간 p50/p90/p95/p99/최대, 처리량, 오류 수
+- 라우팅 분포 (usedModel / canHandle)
+- 두 빌드 간 출력 차이 (--compare)
+를 출력한다. 대상 서버는 FROZEN_CLOCK_ENABLED=1로 띄워야 캡처 당시 KST 기준으로
+날짜가 해석되어 빌드 간 출력 비교가 가능하다. 이때 재생 요청(X-Frozen-Time)의 추출 결과는
+대상 서버 저장소에 저장되지 않는다 (고정 시계가 꺼져 있으면 저장되므로 시작 시 경고).
+
+    python replay.py capture.jsonl --target http://localhost:8000
+    python replay.py capture.jsonl.gz --target http://new:8000 --compare http://old:8000 --speed 0 --concurrency 8
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+# contextData 종류별 더미 레코드 (캡처된 개수/크기에 맞춰 복제)
+CONTEXT_TEMPLATES = {
+    'contacts': lambda i: {'id': f"c{i}", 'name': f"연락처{i}", 'phone': f"010-0000-{i % 10000:04d}", 'group': '기타'},
+    'schedule': lambda i: {'id': f"s{i}", 'title': f"일정{i}", 'date': '2024-01-01', 'time': '09:00'},
+    'expenses': lambda i: {'id': f"e{i}", 'date': '2024-01-01', 'item': f"항목{i}", 'amount': 1000,
+                           'category': '기타', 'type': 'expense'},
+    'diary': lambda i: {'id': f"d{i}", 'date': '2024-01-01', 'entry': f"일기{i}"},
+}
+
+# 빌드 간 비교에서 무시할 필드 (서버 상태에 따라 달라지는 값, id는 서버 저장소가 발급하는 uuid)
+IGNORED_FIELDS = {'isDuplicate', 'id'}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="캡처한 /api/process 트래픽 재생")
+    parser.add_argument("capture", help="server.py CAPTURE_PATH 로그 (JSONL 또는 .gz)")
+    parser.add_argument("--target", default="http://localhost:8000", help="재생 대상 서버")
+    parser.add_argument("--compare", default=None, help="출력을 비교할 두 번째 빌드")
+    parser.add_argument("--speed", type=float, default=1.0, help="재생 배속 (0이면 간격 없이 최대 속도)")
+    parser.add_argument("--concurrency", type=int, default=16, help="동시 요청 상한")
+    parser.add_argument("--limit", type=int, default=None, help="앞에서부터 재생할 요청 수")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--diff-examples", type=int, default=5, help="출력할 출력 차이 예시 수")
+    parser.add_argument("--out", default=None, help="요청별 결과를 JSONL로 저장")
+    return parser.parse_args()
+
+
+def load_capture(path: str, limit: int = None) -> list:
+    opener = gzip.open if path.endswith('.gz') else open
+    records = []
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            records.append(json.loads(line))
+            if limit and len(records) >= limit:
+                break
+    records.sort(key=lambda record: record['ts'])
+    return records
+
+
+def synthesize_context(shape: dict) -> dict:
+    """캡처된 {종류: [개수, 바이트]}와 같은 개수/비슷한 크기의 contextData 생성"""
+    context = {kind: [] for kind in CONTEXT_TEMPLATES}
+    for kind, (count, size) in shape.items():
+        make = CONTEXT_TEMPLATES.get(kind)
+        if make is None or count <= 0:
+            continue
+        items = [make(i) for i in range(count)]
+        # 레코드당 평균 크기가 캡처보다 작으면 자유 텍스트 필드로 채움
+        padding = size // count - len(json.dumps(items[0], ensure_ascii=False).encode())
+        if padding > 0:
+            field = 'entry' if kind == 'diary' else 'memo'
+            for item in items:
+                item[field] = item.get(field, '') + 'x' * padding
+        context[kind] = items
+    return context
+
+
+def strip_ignored(value):
+    if isinstance(value, dict):
+        return {key: strip_ignored(item) for key, item in value.items() if key not in IGNORED_FIELDS}
+    if isinstance(value, list):
+        return [strip_ignored(item) for item in value]
+    return value
+
+
+def comparable(body: dict) -> dict:
+    if body is None:
+        return None
+    return strip_ignored({
+        'canHandle': body.get('canHandle'),
+        'usedModel': body.get('usedModel'),
+        'dataExtraction': body.get('dataExtraction'),
+    })
+
+
+async def send(client: httpx.AsyncClient, base_url: str, record: dict) -> dict:
+    headers = {'X-Frozen-Time': record['kst'], 'X-User-Id': record['tenant']}
+    if record.get('class'):
+        headers['X-Request-Class'] = record['class']
+    payload = {'text': record['text'], 'contextData': synthesize_context(record.get('context', {}))}
+    started = time.perf_counter()
+    try:
+        response = await client.post(f"{base_url}/api/process", json=payload, headers=headers)
+        elapsed = time.perf_counter() - started
+        body = response.json() if response.headers.get('content-type', '').startswith('application/json') else None
+        return {'status': response.status_code, 'latency': elapsed, 'body': body}
+    except httpx.HTTPError as e:
+        return {'status': None, 'latency': time.perf_counter() - started, 'body': None, 'error': repr(e)}
+
+
+async def replay(records: list, args) -> list:
+    targets = [args.target] + ([args.compare] if args.compare else [])
+    limits = httpx.Limits(max_connections=args.concurrency * len(targets), max_keepalive_connections=args.concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    results = [None] * len(records)
+
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        async def run(index: int, record: dict):
+            async with semaphore:
+                # 두 빌드에 같은 요청을 동시에 보내 부하 조건을 맞춤
+                results[index] = await asyncio.gather(*(send(client, url, record) for url in targets))
+
+        origin = records[0]['ts'] if records else 0.0
+        started = time.perf_counter()
+        tasks = []
+        for index, record in enumerate(records):
+            if args.speed > 0:
+                delay = (record['ts'] - origin) / args.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(run(index, record)))
+        await asyncio.gather(*tasks)
+    return results
+
+
+def check_targets(urls: list, timeout: float):
+    """대상 서버가 고정 시계로 떠 있는지 확인 (아니면 재생 요청이 저장소에 저장되고 날짜 해석도 달라짐)"""
+    for url in urls:
+        try:
+            metrics = httpx.get(f"{url}/api/metrics", timeout=timeout).json()
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"[재생] 경고: {url}/api/metrics 확인 실패 ({e!r})")
+            continue
+        if not metrics.get('frozen_clock'):
+            print(f"[재생] 경고: {url}은 FROZEN_CLOCK_ENABLED=1이 아니므로 재생한 요청이 저장소에 저장되고 "
+                  f"날짜가 현재 시각 기준으로 해석됩니다")
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def report(name: str, outcomes: list, wall_seconds: float):
+    latencies = [outcome['latency'] * 1000 for outcome in outcomes if outcome['status'] == 200]
+    errors = Counter(outcome['status'] or 'error' for outcome in outcomes if outcome['status'] != 200)
+    routing = Counter(
+        f"{outcome['body'].get('usedModel')} (canHandle={outcome['body'].get('canHandle')})"
+        for outcome in outcomes if outcome['status'] == 200 and outcome['body']
+    )
+    print(f"== {name}")
+    print(f"요청 {len(outcomes)}개, 성공 {len(latencies)}개, 오류 {sum(errors.values())}개 {dict(errors) or ''}")
+    print(f"처리량 {len(outcomes) / wall_seconds:.1f} req/s ({wall_seconds:.1f}s)")
+    if latencies:
+        print(f"지연(ms) p50 {percentile(latencies, 50):.1f}  p90 {percentile(latencies, 90):.1f}  "
+              f"p95 {percentile(latencies, 95):.1f}  p99 {percentile(latencies, 99):.1f}  "
+              f"최대 {max(latencies):.1f}  평균 {statistics.mean(latencies):.1f}")
+    for route, count in routing.most_common():
+        print(f"  {route:<50} {count:>6} ({count / len(outcomes):.1%})")
+
+
+def main():
+    args = parse_args()
+    records = load_capture(args.capture, args.limit)
+    if not records:
+        raise SystemExit("재생할 요청이 없습니다")
+    span = records[-1]['ts'] - records[0]['ts']
+    print(f"[재생] {len(records)}개 요청, 원본 {span:.1f}s, 배속 {args.speed or '최대'} → {args.target}")
+    check_targets([args.target] + ([args.compare] if args.compare else []), args.timeout)
+
+    started = time.perf_counter()
+    results = asyncio.run(replay(records, args))
+    wall_seconds = time.perf_counter() - started
+
+    report(args.target, [outcomes[0] for outcomes in results], wall_seconds)
+    if args.compare:
+        report(args.compare, [outcomes[1] for outcomes in results], wall_seconds)
+        differences = [
+            (record, outcomes) for record, outcomes in zip(records, results)
+            if comparable(outcomes[0]['body']) != comparable(outcomes[1]['body'])
+        ]
+        print(f"== 출력 차이 {len(differences)}/{len(records)}")
+        for record, outcomes in differences[:args.diff_examples]:
+            print(f"- {record['text'][:60]}")
+            print(f"  {args.target}: {json.dumps(comparable(outcomes[0]['body']), ensure_ascii=False)}")
+            print(f"  {args.compare}: {json.dumps(comparable(outcomes[1]['body']), ensure_ascii=False)}")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            for record, outcomes in zip(records, results):
+                f.write(json.dumps({
+                    'text': record['text'],
+                    'results': [{key: outcome.get(key) for key in ('status', 'latency', 'body', 'error')}
+                                for outcome in outcomes],
+                }, ensure_ascii=False) + "\n")
+        print(f"[재생] 요청별 결과 → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+LifeONE 로컬/원격 라우팅 분류기
+
+입력 문장의 문자 n-gram을 해싱(crc32)한 희소 특징으로 로지스틱 회귀를 학습해
+"로컬 모델이 파싱에 성공할 확률"을 예측한다. 외부 라이브러리 없이 순수 파이썬으로
+동작하며, 예측은 입력 길이에 비례하는 해시/덧셈 몇십 번이라 1ms보다 훨씬 빠르다.
+
+학습 데이터는 server.py가 ROUTING_LOG_PATH에 남기는 라우팅 결과 로그(JSONL, 전화번호 등은 가명 처리)
+    {"text": ..., "heuristic": true, "routerProb": 0.91, "outcome": "local_success"}
+- local_success       : 로컬 모델이 데이터 추출에 성공 → 1
+- local_parse_failure : 로컬 디코딩 후 파싱 실패 → 0
+- remote_hard         : 고정 규칙(OCR/수정/삭제)으로 로컬이 처리할 수 없는 요청 → 0
+- heuristic_remote    : 휴리스틱이 원격으로 보낸 요청 (웹 검색 등, 로컬 결과를 모르므로 학습에서 제외)
+- router_remote       : 분류기만 원격으로 보낸 요청 (로컬 결과를 모르므로 학습에서 제외)
+- remote              : 이전 로그 형식 (고정 규칙과 휴리스틱 판단이 섞여 있어 학습에서 제외)
+휴리스틱 판단을 라벨로 쓰면 분류기가 관측 결과 대신 휴리스틱을 따라 배우므로 실제로 로컬에서 시도한 결과만 쓴다.
+
+    python router.py train --log routing_log.jsonl --out router_weights.json
+    python router.py predict --weights router_weights.json "내일 3시 치과 예약"
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import time
+import zlib
+
+DEFAULT_DIM = 1 << 18
+DEFAULT_NGRAMS = (1, 3)
+
+# 로그 outcome → 학습 라벨
+OUTCOME_LABELS = {
+    'local_success': 1,
+    'local_parse_failure': 0,
+    'remote_hard': 0,
+}
+
+_whitespace = re.compile(r'\s+')
+_digits = re.compile(r'\d+')
+
+
+def normalize(text: str) -> str:
+    """소문자화, 공백 정리, 숫자는 자리수와 무관하게 0으로 치환 (금액/시간 일반화)"""
+    text = _whitespace.sub(' ', text.strip().lower())
+    return _digits.sub('0', text)
+
+
+def featurize(text: str, dim: int = DEFAULT_DIM, ngrams: tuple = DEFAULT_NGRAMS) -> dict:
+    """문자 n-gram 해싱 특징 (인덱스 → 값, L2 정규화)"""
+    padded = f"\x02{normalize(text)}\x03"
+    counts = {}
+    low, high = ngrams
+    for n in range(low, high + 1):
+        for i in range(len(padded) - n + 1):
+            index = zlib.crc32(padded[i:i + n].encode()) % dim
+            counts[index] = counts.get(index, 0) + 1
+    # 길이 구간도 특징으로 추가 (길고 복잡한 입력은 로컬 실패가 잦음)
+    length_bucket = min(len(text) // 20, 10)
+    index = zlib.crc32(f"#len:{length_bucket}".encode()) % dim
+    counts[index] = counts.get(index, 0) + 1
+
+    norm = math.sqrt(sum(value * value for value in counts.values())) or 1.0
+    return {index: value / norm for index, value in counts.items()}
+
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class RouterModel:
+    """해싱 특징 로지스틱 회귀 (가중치는 0이 아닌 것만 dict로 보관)"""
+
+    def __init__(self, weights: dict = None, bias: float = 0.0, dim: int = DEFAULT_DIM,
+                 ngrams: tuple = DEFAULT_NGRAMS, meta: dict = None):
+        self.weights = weights or {}
+        self.bias = bias
+        self.dim = dim
+        self.ngrams = tuple(ngrams)
+        self.meta = meta or {}
+
+    def predict_proba(self, text: str) -> float:
+        features = featurize(text, self.dim, self.ngrams)
+        weights = self.weights
+        z = self.bias
+        for index, value in features.items():
+            z += weights.get(index, 0.0) * value
+        return _sigmoid(z)
+
+    def fit(self, examples: list, epochs: int = 10, learning_rate: float = 0.5,
+            l2: float = 1e-5, seed: int = 0):
+        """SGD 학습 (examples: [(text, label)], 클래스 불균형은 가중치로 보정)"""
+        rng = random.Random(seed)
+        data = [(featurize(text, self.dim, self.ngrams), label) for text, label in examples]
+        positives = sum(label for _, label in data) or 1
+        negatives = (len(data) - positives) or 1
+        class_weight = {1: len(data) / (2 * positives), 0: len(data) / (2 * negatives)}
+
+        weights = self.weights
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            rate = learning_rate / (1 + epoch)
+            for features, label in data:
+                z = self.bias
+                for index, value in features.items():
+                    z += weights.get(index, 0.0) * value
+                gradient = (_sigmoid(z) - label) * class_weight[label]
+                self.bias -= rate * gradient
+                for index, value in features.items():
+                    w = weights.get(index, 0.0)
+                    weights[index] = w - rate * (gradient * value + l2 * w)
+        # 사실상 0인 가중치는 버려서 파일 크기 축소
+        self.weights = {index: w for index, w in weights.items() if abs(w) > 1e-6}
+        return self
+
+    def save(self, path: str):
+        payload = {
+            'dim': self.dim,
+            'ngrams': list(self.ngrams),
+            'bias': self.bias,
+            'weights': {str(index): round(w, 6) for index, w in self.weights.items()},
+            'meta': self.meta,
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> 'RouterModel':
+        with open(path, encoding='utf-8') as f:
+            payload = json.load(f)
+        return cls(
+            weights={int(index): w for index, w in payload['weights'].items()},
+            bias=payload['bias'],
+            dim=payload['dim'],
+            ngrams=tuple(payload['ngrams']),
+            meta=payload.get('meta', {}),
+        )
+
+
+def load_examples(path: str) -> list:
+    """라우팅 로그에서 (text, label) 추출 (같은 문장은 마지막 결과 사용)"""
+    latest = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            label = OUTCOME_LABELS.get(record.get('outcome'))
+            if label is None or not record.get('text'):
+                continue
+            latest[record['text']] = label
+    return list(latest.items())
+
+
+def evaluate(model: RouterModel, examples: list, threshold: float) -> dict:
+    if not examples:
+        return {'count': 0}
+    correct = 0
+    loss = 0.0
+    true_positive = false_positive = false_negative = 0
+    for text, label in examples:
+        prob = model.predict_proba(text)
+        predicted = 1 if prob >= threshold else 0
+        correct += predicted == label
+        loss -= math.log(max(prob if label else 1 - prob, 1e-12))
+        true_positive += predicted == 1 and label == 1
+        false_positive += predicted == 1 and label == 0
+        false_negative += predicted == 0 and label == 1
+    return {
+        'count': len(examples),
+        'accuracy': round(correct / len(examples), 4),
+        'log_loss': round(loss / len(examples), 4),
+        'precision': round(true_positive / ((true_positive + false_positive) or 1), 4),
+        'recall': round(true_positive / ((true_positive + false_negative) or 1), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LifeONE 라우팅 분류기")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help="라우팅 로그로 학습")
+    train_parser.add_argument('--log', required=True, help="server.py ROUTING_LOG_PATH 로그 (JSONL)")
+    train_parser.add_argument('--out', default='router_weights.json')
+    train_parser.add_argument('--epochs', type=int, default=10)
+    train_parser.add_argument('--learning-rate', type=float, default=0.5)
+    train_parser.add_argument('--l2', type=float, default=1e-5)
+    train_parser.add_argument('--dim', type=int, default=DEFAULT_DIM)
+    train_parser.add_argument('--holdout', type=float, default=0.2, help="검증용 비율")
+    train_parser.add_argument('--threshold', type=float, default=0.5)
+    train_parser.add_argument('--seed', type=int, default=0)
+
+    predict_parser = subparsers.add_parser('predict', help="문장별 로컬 처리 성공 확률 출력")
+    predict_parser.add_argument('--weights', default='router_weights.json')
+    predict_parser.add_argument('texts', nargs='+')
+
+    args = parser.parse_args()
+
+    if args.command == 'predict':
+        model = RouterModel.load(args.weights)
+        for text in args.texts:
+            print(f"{model.predict_proba(text):.3f}\t{text}")
+        return
+
+    examples = load_examples(args.log)
+    if not examples:
+        print("[라우터] 학습할 로그가 없습니다", file=sys.stderr)
+        sys.exit(1)
+    random.Random(args.seed).shuffle(examples)
+    split = int(len(examples) * (1 - args.holdout))
+    train_set, holdout_set = examples[:split], examples[split:]
+    print(f"[라우터] 학습 {len(train_set)}개, 검증 {len(holdout_set)}개 "
+          f"(성공 비율 {sum(label for _, label in examples) / len(examples):.2f})")
+
+    model = RouterModel(dim=args.dim)
+    model.fit(train_set, epochs=args.epochs, learning_rate=args.learning_rate, l2=args.l2, seed=args.seed)
+
+    train_metrics = evaluate(model, train_set, args.threshold)
+    holdout_metrics = evaluate(model, holdout_set, args.threshold)
+    started = time.perf_counter()
+    for text, _ in examples[:1000]:
+        model.predict_proba(text)
+    predict_us = (time.perf_counter() - started) / min(len(examples), 1000) * 1e6
+
+    model.meta = {
+        'trainedAt': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'examples': len(examples),
+        'train': train_metrics,
+        'holdout': holdout_metrics,
+    }
+    model.save(args.out)
+    print(f"[라우터] 학습: {train_metrics}")
+    print(f"[라우터] 검증: {holdout_metrics}")
+    print(f"[라우터] 예측 평균 {predict_us:.1f}µs, 가중치 {len(model.weights)}개 → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,65 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from fastapi.responses import ORJSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field
+from pydantic.dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Union, Literal, Annotated
+import msgpack
+import httpx
+from router import RouterModel
 import torch
 from transformers import GPT2LMHeadModel, GPT2Tokenizer
 from peft import PeftModel
 import json
 import re
-from datetime import datetime, timedelta
+import os
+import hashlib
+import tempfile
+import uuid
+import time
+import math
+import random
+import heapq
+import bisect
+import itertools
+import asyncio
+import sqlite3
+import threading
+import sys
+import hmac
+try:
+    import fcntl
+except ImportError:  # Windows: 리더 잠금 없이 단일 워커로 간주
+    fcntl = None
+import cProfile
+import pstats
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime, timedelta, date
 import pytz
 import calendar
-
-app = FastAPI()
+from dataclasses import asdict
+from contextvars import ContextVar
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 서버 저장소가 있으면 알림 타이머와 다른 워커 변경 감시 시작 (알림은 리더 워커 하나만)
+    background = []
+    if record_store is not None:
+        await run_in_threadpool(notification_scheduler.try_lead, record_store)
+        background.append(asyncio.create_task(notification_scheduler.run(record_store)))
+        if STORE_SYNC_INTERVAL > 0:
+            background.append(asyncio.create_task(sync_record_indexes()))
+    yield
+    for task in background:
+        task.cancel()
+    # 종료 시 원격 모델 연결 풀 정리
+    await escalation_client.aclose()
+
+
+# 기본 응답 직렬화를 orjson으로 (대용량 dataExtraction 인코딩 비용 절감)
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # CORS 설정 - React 앱에서 접근 가능하도록
 app.add_middleware(
@@ -22,6 +70,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+def apply_worker_cpu_layout() -> dict:
+    """
+    launcher.py가 환경변수로 지정한 CPU 배치를 모델 로딩 전에 적용
+    (CPU 고정, torch intra/inter-op 스레드 수). 단독 실행 시에는 torch 기본값 유지
+    """
+    layout = {
+        'worker': int(os.environ.get("WORKER_INDEX", "0")),
+        'pid': os.getpid(),
+        'preset': os.environ.get("WORKER_PRESET"),
+        'cpus': None,
+        'pinned': False,
+    }
+    cpus = os.environ.get("WORKER_CPUS")
+    if cpus:
+        layout['cpus'] = [int(cpu) for cpu in cpus.split(',')]
+        if os.environ.get("WORKER_PIN_CPUS") == "1" and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, layout['cpus'])
+            layout['pinned'] = True
+
+    intra_op_threads = os.environ.get("TORCH_INTRA_OP_THREADS")
+    if intra_op_threads:
+        torch.set_num_threads(int(intra_op_threads))
+    inter_op_threads = os.environ.get("TORCH_INTER_OP_THREADS")
+    if inter_op_threads:
+        # 병렬 작업이 시작되기 전에만 설정 가능하므로 모델 로딩보다 먼저 호출
+        torch.set_num_interop_threads(int(inter_op_threads))
+
+    layout['intra_op_threads'] = torch.get_num_threads()
+    layout['inter_op_threads'] = torch.get_num_interop_threads()
+    print(f"[CPU 배치] 워커 {layout['worker']} (pid {layout['pid']}): CPU {layout['cpus'] or '전체'}, "
+          f"intra-op {layout['intra_op_threads']}, inter-op {layout['inter_op_threads']}, 고정 {layout['pinned']}")
+    return layout
+
+
+cpu_layout = apply_worker_cpu_layout()
+
 # 모델 로딩
 print("Loading LoRA fine-tuned model...")
 base_model_name = "gpt2"
@@ -32,15 +117,140 @@ base_model = GPT2LMHeadModel.from_pretrained(base_model_name)
 model = PeftModel.from_pretrained(base_model, lora_adapter_path)
 model.eval()
 
+# 긴 입력의 구간 배치 생성용 (GPT-2에는 패딩 토큰이 없으므로 EOS를 쓰고 생성 쪽 반대편인 왼쪽에 채움)
+tokenizer.pad_token = tokenizer.eos_token
+tokenizer.padding_side = 'left'
+
+# 보조(assisted) 디코딩용 초안 모델 (같은 토크나이저를 쓰는 작은 모델, 빈 문자열이면 비활성화)
+DRAFT_MODEL_NAME = os.environ.get("DRAFT_MODEL_NAME", "")
+DRAFT_NUM_TOKENS = int(os.environ.get("DRAFT_NUM_TOKENS", "5"))  # 한 번에 제안하는 토큰 수 (초기값)
+
+
+def load_draft_model(name: str):
+    """초안 모델 로딩 - 어휘가 본 모델과 다르면 사용하지 않음"""
+    if not name:
+        return None
+    print(f"Loading draft model {name}...")
+    draft = GPT2LMHeadModel.from_pretrained(name)
+    if draft.config.vocab_size != base_model.config.vocab_size:
+        print(f"[보조 디코딩] {name}의 어휘 크기가 달라 비활성화 "
+              f"({draft.config.vocab_size} != {base_model.config.vocab_size})")
+        return None
+    draft.eval()
+    # 수락률에 따라 제안 길이를 자동 조절 (전부 수락되면 +2, 아니면 -1)
+    draft.generation_config.num_assistant_tokens = DRAFT_NUM_TOKENS
+    draft.generation_config.num_assistant_tokens_schedule = "heuristic"
+    return draft
+
+
+draft_model = load_draft_model(DRAFT_MODEL_NAME)
+
+
+def compute_adapter_version(path: str) -> str:
+    """어댑터 설정/가중치 파일 내용으로 버전 해시 계산 (캐시 키에 사용)"""
+    hasher = hashlib.sha256()
+    for name in sorted(os.listdir(path)):
+        if name.startswith('adapter_'):
+            hasher.update(name.encode())
+            with open(os.path.join(path, name), 'rb') as f:
+                hasher.update(f.read())
+    return hasher.hexdigest()[:16]
+
+
+adapter_version = compute_adapter_version(lora_adapter_path)
+
 print("Model loaded successfully!")
 
 # 한국 시간대 설정
 KST = pytz.timezone('Asia/Seoul')
 
+# 재현용 고정 시계 (FROZEN_CLOCK_ENABLED=1일 때 X-Frozen-Time 헤더로 요청별 현재 시각 지정)
+FROZEN_CLOCK_ENABLED = os.environ.get("FROZEN_CLOCK_ENABLED", "0") == "1"
+frozen_now: ContextVar[Optional[datetime]] = ContextVar('frozen_now', default=None)
+
+
+def current_kst() -> datetime:
+    """요청 처리용 현재 한국 시간 (고정 시계가 지정된 요청이면 그 시각)"""
+    return frozen_now.get() or datetime.now(KST)
+
+
+if FROZEN_CLOCK_ENABLED:
+    @app.middleware("http")
+    async def frozen_clock_middleware(request: Request, call_next):
+        """replay.py가 보낸 X-Frozen-Time(ISO 8601)을 이 요청의 현재 시각으로 사용"""
+        frozen = request.headers.get('x-frozen-time')
+        if not frozen:
+            return await call_next(request)
+        try:
+            value = datetime.fromisoformat(frozen)
+        except ValueError:
+            return ORJSONResponse({"detail": "X-Frozen-Time은 ISO 8601 형식이어야 합니다"}, status_code=422)
+        value = KST.localize(value) if value.tzinfo is None else value.astimezone(KST)
+        token = frozen_now.set(value)
+        try:
+            return await call_next(request)
+        finally:
+            frozen_now.reset(token)
+
+
+# contextData 레코드 타입 (types.ts 미러)
+# 서버가 실제로 읽는 필드만 검증하고 나머지(id, imageUrl, checklistItems 등)는 무시
+RECORD_CONFIG = ConfigDict(extra='ignore')
+
+
+@dataclass(slots=True, config=RECORD_CONFIG)
+class Contact:
+    name: str = ''
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    group: Optional[str] = None
+
+
+@dataclass(slots=True, config=RECORD_CONFIG)
+class ScheduleItem:
+    title: str = ''
+    date: str = ''
+    time: Optional[str] = None
+
+
+@dataclass(slots=True, config=RECORD_CONFIG)
+class Expense:
+    date: str = ''
+    item: str = ''
+    amount: Union[int, float] = 0
+    type: str = 'expense'
+    category: Optional[str] = None
+    imageUrl: Optional[str] = None  # Base64 원본 대신 이미지 저장소 참조 (sha256:...)
+
+
+@dataclass(slots=True, config=RECORD_CONFIG)
+class DiaryEntry:
+    date: str = ''
+    entry: str = ''
+    group: Optional[str] = None
+    imageUrl: Optional[str] = None  # Base64 원본 대신 이미지 저장소 참조 (sha256:...)
+
+
+# 요청 크기 상한 (메모리 사용량 제한, 넘으면 413/422)
+MAX_INPUT_CHARS = int(os.environ.get("MAX_INPUT_CHARS", "20000"))
+MAX_CONTEXT_RECORDS = int(os.environ.get("MAX_CONTEXT_RECORDS", "10000"))  # contextData 종류별 레코드 수
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", str(8 * 1024 * 1024)))  # 이미지 필드를 걸러낸 JSON 본문 크기
+# msgpack은 이미지가 본문에 포함된 채로 메모리에 올라오므로 원본 크기로 제한
+MAX_MSGPACK_BYTES = int(os.environ.get("MAX_MSGPACK_BYTES", str(32 * 1024 * 1024)))
+
+
+class ContextData(BaseModel):
+    model_config = RECORD_CONFIG
+
+    contacts: List[Contact] = Field(default_factory=list, max_length=MAX_CONTEXT_RECORDS)
+    schedule: List[ScheduleItem] = Field(default_factory=list, max_length=MAX_CONTEXT_RECORDS)
+    expenses: List[Expense] = Field(default_factory=list, max_length=MAX_CONTEXT_RECORDS)
+    diary: List[DiaryEntry] = Field(default_factory=list, max_length=MAX_CONTEXT_RECORDS)
+
 
 class ProcessRequest(BaseModel):
-    text: str
-    contextData: Dict[str, List[Any]]
+    text: str = Field(max_length=MAX_INPUT_CHARS)
+    contextData: ContextData = Field(default_factory=ContextData)
 
 
 class ProcessResponse(BaseModel):
@@ -52,6 +262,1764 @@ class ProcessResponse(BaseModel):
     processingDetails: str
     clarificationNeeded: Optional[bool] = False
     clarificationOptions: Optional[List[str]] = None
+    clarificationId: Optional[str] = None
+    # 원격 모델 위임 응답에만 채워짐 (types.ts ConversationalResponse와 같은 형태)
+    dataModification: Optional[Dict[str, List[Any]]] = None
+    dataDeletion: Optional[Dict[str, List[str]]] = None
+    webSearchSources: Optional[List[Dict[str, str]]] = None
+
+
+class ClarifyRequest(BaseModel):
+    clarificationId: str
+    option: str
+
+
+# msgpack 콘텐츠 타입 (JSON 대신 선택적으로 사용)
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, use_bin_type=True)
+
+
+# 이미지 저장소 설정
+# contextData의 imageUrl(Base64)은 요청마다 전체가 전송되지만 서버는 읽지 않으므로
+# 본문을 스트리밍하면서 디스크에 내용 주소(sha256)로 저장하고 참조만 남김
+# (이미지 하나는 값이 끝날 때까지 메모리에 모아 해시를 계산하고, 이미 있는 이미지는 다시 쓰지 않음)
+IMAGE_STORE_DIR = os.environ.get("IMAGE_STORE_DIR", "./image_store")
+IMAGE_STORE_MAX_BYTES = int(os.environ.get("IMAGE_STORE_MAX_BYTES", str(2 * 1024 ** 3)))  # 넘으면 오래 쓰지 않은 이미지부터 삭제
+IMAGE_REF_PREFIX = "sha256:"
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))  # 이미지 값 하나 (디코딩 후)
+MAX_REQUEST_IMAGE_BYTES = int(os.environ.get("MAX_REQUEST_IMAGE_BYTES", str(32 * 1024 * 1024)))  # 요청 하나의 이미지 합계
+IMAGE_FIELD_PATTERN = re.compile(rb'"imageUrl"\s*:\s*"')
+
+
+class PayloadTooLarge(Exception):
+    """요청 본문이나 이미지가 크기 상한을 넘음 (413)"""
+
+
+class ImageStore:
+    """
+    이미지 데이터를 sha256 해시 기반 경로에 저장하는 내용 주소 저장소
+    같은 이미지는 한 번만 저장되고, 전체 크기가 max_bytes를 넘으면 수정 시각이 오래된 파일부터 삭제
+    (클라이언트 LocalStorage에 원본이 있으므로 삭제된 이미지는 다음 요청 때 다시 저장됨)
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._total = sum(size for _, _, size in self._files())
+        self.evicted = 0
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _files(self):
+        """저장된 이미지 (경로, 수정 시각, 크기) - 기록 중인 임시 파일은 제외"""
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.startswith("tmp-"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def put(self, data: bytes) -> str:
+        """해시 경로에 저장하고 참조 문자열 반환 (이미 있으면 다시 쓰지 않고 수정 시각만 갱신)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            os.utime(path)  # 다시 쓰인 이미지는 삭제 순서에서 뒤로
+            return IMAGE_REF_PREFIX + digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix="tmp-", delete=False) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+        with self._lock:
+            self._total += len(data)
+            over_limit = self._total > self.max_bytes
+        if over_limit:
+            self._evict()
+        return IMAGE_REF_PREFIX + digest
+
+    def _evict(self):
+        """최대 크기의 90%까지 오래된 이미지 삭제 (다른 워커가 쓴 파일도 포함해 디스크 기준으로 다시 계산)"""
+        with self._lock:
+            files = sorted(self._files(), key=lambda file: file[1])
+            total = sum(size for _, _, size in files)
+            target = self.max_bytes * 0.9
+            for path, _, size in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evicted += 1
+            self._total = total
+
+    def read(self, digest: str) -> Optional[bytes]:
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def snapshot(self) -> dict:
+        return {'bytes': self._total, 'max_bytes': self.max_bytes, 'evicted': self.evicted}
+
+
+image_store = ImageStore(IMAGE_STORE_DIR, IMAGE_STORE_MAX_BYTES)
+
+
+def _unescape_json(sequence: bytes) -> bytes:
+    """JSON 문자열 이스케이프 시퀀스 하나(\\/, \\n, \\uXXXX 등)를 UTF-8 바이트로 변환"""
+    return json.loads(b'"' + sequence + b'"').encode('utf-8', 'surrogatepass')
+
+
+class ImageFieldStripper:
+    """
+    JSON 요청 본문을 청크 단위로 받아 imageUrl 문자열 값을 이미지 저장소로 보내고
+    본문에는 해시 참조만 남김. 이미지 값은 파이썬 문자열로 만들어지지 않음
+    이스케이프를 풀어 디코딩된 값으로 저장하므로 msgpack으로 보낸 같은 이미지와 해시가 같음
+    이미지 하나가 max_image_bytes, 요청의 이미지 합계가 max_total_bytes를 넘으면 PayloadTooLarge
+    파일 기록이 있으므로 이벤트 루프가 아닌 스레드풀에서 호출
+    """
+
+    # 청크 경계에 걸친 "imageUrl" 키를 놓치지 않도록 남겨두는 바이트 수
+    TAIL_BYTES = 64
+
+    def __init__(self, store: ImageStore, max_image_bytes: int = MAX_IMAGE_BYTES,
+                 max_total_bytes: int = MAX_REQUEST_IMAGE_BYTES):
+        self.store = store
+        self.max_image_bytes = max_image_bytes
+        self.max_total_bytes = max_total_bytes
+        self._buffer = bytearray()
+        self._image = None  # 소비 중인 이미지 값 (디코딩된 바이트)
+        self._total = 0
+
+    def feed(self, chunk: bytes) -> bytes:
+        self._buffer += chunk
+        out = bytearray()
+        while True:
+            if self._image is not None:
+                if not self._consume_image(out):
+                    break
+                continue
+
+            match = IMAGE_FIELD_PATTERN.search(self._buffer)
+            if match is None:
+                flush = max(len(self._buffer) - self.TAIL_BYTES, 0)
+                out += self._buffer[:flush]
+                del self._buffer[:flush]
+                break
+
+            # 키와 여는 따옴표까지는 그대로 내보내고 값부터 저장소로 보냄
+            out += self._buffer[:match.end()]
+            del self._buffer[:match.end()]
+            self._image = bytearray()
+        return bytes(out)
+
+    def _consume_image(self, out: bytearray) -> bool:
+        """이미지 값을 닫는 따옴표까지 이스케이프를 풀며 소비. 값이 끝나면 True"""
+        buffer = self._buffer
+        decoded = bytearray()
+        pos = 0
+        end = -1
+        while pos < len(buffer):
+            if buffer[pos] == 0x5C:
+                # 이스케이프 시퀀스는 통째로 버퍼에 들어온 뒤에 해석
+                # (\uXXXX는 6바이트, 서로게이트 쌍 \uD83D\uDE00은 한 글자이므로 12바이트를 함께 해석)
+                length = 2
+                if buffer[pos + 1:pos + 2] == b'u':
+                    length = 6
+                    if buffer[pos + 2:pos + 4].lower() in (b'd8', b'd9', b'da', b'db') and \
+                            buffer[pos + 6:pos + 8] in (b'\\u', b'\\', b''):
+                        length = 12
+                if pos + length > len(buffer):
+                    break
+                decoded += _unescape_json(bytes(buffer[pos:pos + length]))
+                pos += length
+                continue
+            quote = buffer.find(b'"', pos)
+            backslash = buffer.find(b'\\', pos, quote if quote != -1 else len(buffer))
+            stop = backslash if backslash != -1 else (quote if quote != -1 else len(buffer))
+            decoded += buffer[pos:stop]
+            pos = stop
+            if backslash == -1 and quote != -1:
+                end = quote
+                break
+
+        self._image += decoded
+        self._total += len(decoded)
+        if len(self._image) > self.max_image_bytes or self._total > self.max_total_bytes:
+            self.abort()
+            raise PayloadTooLarge("이미지가 너무 큽니다")
+        if end == -1:
+            del buffer[:pos]
+            return False
+
+        del buffer[:end + 1]
+        # 빈 문자열은 저장하지 않음
+        if self._image:
+            out += self.store.put(bytes(self._image)).encode()
+        out += b'"'
+        self._image = None
+        return True
+
+    def close(self) -> bytes:
+        if self._image is not None:
+            self.abort()
+            raise ValueError("imageUrl 문자열이 닫히지 않았습니다")
+        rest = bytes(self._buffer)
+        self._buffer.clear()
+        return rest
+
+    def abort(self):
+        """모으던 이미지 값 버림 (요청이 중간에 실패한 경우)"""
+        self._image = None
+
+
+def _store_msgpack_image(obj: dict) -> dict:
+    """msgpack 디코딩 중 맵마다 호출되어 imageUrl 값을 저장소 참조로 치환"""
+    value = obj.get('imageUrl')
+    if isinstance(value, str) and value and not value.startswith(IMAGE_REF_PREFIX):
+        data = value.encode('utf-8', 'surrogatepass')
+        if len(data) > MAX_IMAGE_BYTES:
+            raise PayloadTooLarge("이미지가 너무 큽니다")
+        obj['imageUrl'] = image_store.put(data)
+    return obj
+
+
+async def decode_process_request(request: Request) -> ProcessRequest:
+    """
+    요청 본문을 Content-Type에 맞게 디코딩
+    JSON은 스트리밍하며 이미지 필드를 걸러낸 뒤 pydantic-core가 바이트에서 바로 모델로 파싱
+    두 형식 모두 본문을 읽는 도중 크기 상한을 넘으면 413
+    이미지 파일 기록은 스레드풀에서 수행
+    """
+    try:
+        if request.headers.get('content-type', '').startswith(MSGPACK_MEDIA_TYPE):
+            declared = request.headers.get('content-length', '')
+            if declared.isdigit() and int(declared) > MAX_MSGPACK_BYTES:
+                raise HTTPException(status_code=413, detail="요청 본문이 너무 큽니다")
+            body = bytearray()
+            async for chunk in request.stream():
+                body += chunk
+                if len(body) > MAX_MSGPACK_BYTES:
+                    raise HTTPException(status_code=413, detail="요청 본문이 너무 큽니다")
+            payload = await run_in_threadpool(msgpack.unpackb, body, raw=False, object_hook=_store_msgpack_image)
+            return ProcessRequest.model_validate(payload)
+
+        stripper = ImageFieldStripper(image_store, MAX_IMAGE_BYTES, MAX_REQUEST_IMAGE_BYTES)
+        body = bytearray()
+        try:
+            async for chunk in request.stream():
+                body += await run_in_threadpool(stripper.feed, chunk)
+                if len(body) > MAX_REQUEST_BYTES:
+                    raise HTTPException(status_code=413, detail="요청 본문이 너무 큽니다")
+            body += await run_in_threadpool(stripper.close)
+        except BaseException:
+            stripper.abort()
+            raise
+        return ProcessRequest.model_validate_json(body)
+    except PayloadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (ValueError, msgpack.UnpackException) as e:
+        # pydantic ValidationError도 ValueError의 하위 클래스
+        raise HTTPException(status_code=422, detail=f"요청 형식 오류: {str(e)}")
+
+
+def encode_response(request: Request, payload: BaseModel) -> Response:
+    """Accept 헤더에 따라 msgpack 또는 orjson으로 응답 인코딩"""
+    content = payload.model_dump()
+    if MSGPACK_MEDIA_TYPE in request.headers.get('accept', ''):
+        return MsgPackResponse(content)
+    return ORJSONResponse(content)
+
+# 서버 측 레코드 저장소 설정 (빈 문자열이면 비활성화, 클라이언트 LocalStorage만 사용)
+RECORD_STORE_PATH = os.environ.get("RECORD_STORE_PATH", "")
+# 다른 워커의 저장소 변경을 확인하는 주기 (초, 0이면 요청 시에만 확인)
+STORE_SYNC_INTERVAL = float(os.environ.get("STORE_SYNC_INTERVAL", "2.0"))
+
+
+# 저장소 CRUD용 레코드 모델 (types.ts의 전체 형태, id는 없으면 서버가 발급)
+class ContactRecord(BaseModel):
+    id: Optional[str] = None
+    name: str
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    group: Optional[str] = None
+    favorite: Optional[bool] = None
+
+
+def _check_record_date(value: str) -> str:
+    """달력에 있는 날짜인지 확인 (strptime의 ValueError는 검증 오류로 바뀜)"""
+    datetime.strptime(value[:10], '%Y-%m-%d')
+    return value
+
+
+# 저장 레코드 날짜: YYYY-MM-DD (뒤에 시각이 붙은 ISO 형식도 허용, '내일' 같은 미해석 표현은 거부)
+RecordDate = Annotated[str, Field(pattern=r'^\d{4}-\d{2}-\d{2}'), AfterValidator(_check_record_date)]
+
+
+class RecurrenceRule(BaseModel):
+    """반복 일정 규칙 (date 필드가 첫 발생일)"""
+    freq: Literal['daily', 'weekly', 'monthly', 'yearly']
+    interval: int = Field(default=1, ge=1)
+    weekdays: Optional[List[Annotated[int, Field(ge=0, le=6)]]] = None  # weekly: 0=월 ... 6=일
+    monthDay: Optional[int] = Field(default=None, ge=1, le=31)            # monthly/yearly: 일자
+    month: Optional[int] = Field(default=None, ge=1, le=12)               # yearly: 월
+    until: Optional[str] = None                                           # YYYY-MM-DD (포함)
+    count: Optional[int] = Field(default=None, ge=1)                      # 총 발생 횟수
+
+
+class ScheduleRecord(BaseModel):
+    id: Optional[str] = None
+    title: str
+    date: RecordDate
+    time: Optional[str] = None
+    location: Optional[str] = None
+    categoryId: Optional[str] = None
+    category: Optional[str] = None
+    isDday: Optional[bool] = None
+    recurrence: Optional[RecurrenceRule] = None
+
+
+class ExpenseRecord(BaseModel):
+    id: Optional[str] = None
+    date: RecordDate
+    item: str
+    amount: Union[int, float]
+    type: Literal['expense', 'income']
+    category: Optional[str] = None
+    imageUrl: Optional[str] = None
+
+
+class DiaryRecord(BaseModel):
+    id: Optional[str] = None
+    date: RecordDate
+    entry: str
+    group: Optional[str] = None
+    isChecklist: Optional[bool] = None
+    checklistItems: Optional[List[Dict[str, Any]]] = None
+    imageUrl: Optional[str] = None
+    imageName: Optional[str] = None
+
+
+RecordKind = Literal['contacts', 'schedule', 'expenses', 'diary']
+
+# 종류별 테이블 스키마: (레코드 모델, 컬럼 정의, 인덱스 컬럼 목록, JSON으로 저장할 컬럼)
+RECORD_SCHEMAS = {
+    'contacts': (
+        ContactRecord,
+        {'name': 'TEXT NOT NULL', 'phone': 'TEXT', 'email': 'TEXT', 'group': 'TEXT', 'favorite': 'INTEGER'},
+        [('group',), ('name',), ('phone',)],
+        (),
+    ),
+    'schedule': (
+        ScheduleRecord,
+        {'title': 'TEXT NOT NULL', 'date': 'TEXT NOT NULL', 'time': 'TEXT', 'location': 'TEXT',
+         'categoryId': 'TEXT', 'category': 'TEXT', 'isDday': 'INTEGER', 'recurrence': 'TEXT'},
+        [('date', 'time'), ('category', 'date'), ('categoryId', 'date')],
+        ('recurrence',),
+    ),
+    'expenses': (
+        ExpenseRecord,
+        {'date': 'TEXT NOT NULL', 'item': 'TEXT NOT NULL', 'amount': 'NUMERIC NOT NULL', 'type': 'TEXT NOT NULL',
+         'category': 'TEXT', 'imageUrl': 'TEXT'},
+        [('date',), ('type', 'date'), ('category', 'date'), ('amount',)],
+        (),
+    ),
+    'diary': (
+        DiaryRecord,
+        {'date': 'TEXT NOT NULL', 'entry': 'TEXT NOT NULL', 'group': 'TEXT', 'isChecklist': 'INTEGER',
+         'checklistItems': 'TEXT', 'imageUrl': 'TEXT', 'imageName': 'TEXT'},
+        [('date',), ('group', 'date')],
+        ('checklistItems',),
+    ),
+}
+
+# 저장소 레코드 → fallback_text_parsing이 쓰는 contextData 타입
+CONTEXT_TYPES = {'contacts': Contact, 'schedule': ScheduleItem, 'expenses': Expense, 'diary': DiaryEntry}
+
+
+class RecordStore:
+    """
+    연락처/일정/가계부/메모를 서버에 보관하는 SQLite 저장소
+    날짜, 종류, 카테고리, 그룹 인덱스로 범위 조회를 처리하고
+    fallback_text_parsing의 교차 참조 검색도 여기서 직접 수행
+    워커가 여러 개면 다른 워커의 쓰기는 변경 알림이 오지 않으므로
+    PRAGMA data_version으로 감지해 등록된 인덱스를 통째로 다시 구성
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # 변경 알림과 인덱스 재구성이 엇갈리지 않도록 알림도 잠금 안에서 보냄 (재구성은 iter_all을 다시 호출)
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._rebuilders = []
+        self.external_refreshes = 0
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for kind, (_, columns, indexes, _) in RECORD_SCHEMAS.items():
+            column_sql = ', '.join(f'"{name}" {spec}' for name, spec in columns.items())
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS {kind} (id TEXT PRIMARY KEY, {column_sql})')
+            # 이전 버전에서 만든 테이블에 새 컬럼 추가 (NOT NULL 없는 컬럼만 추가됨)
+            existing = {row[1] for row in self._conn.execute(f'PRAGMA table_info({kind})')}
+            for name, spec in columns.items():
+                if name not in existing:
+                    self._conn.execute(f'ALTER TABLE {kind} ADD COLUMN "{name}" {spec}')
+            for index_columns in indexes:
+                index_name = f"idx_{kind}_{'_'.join(index_columns)}"
+                index_sql = ', '.join(f'"{name}"' for name in index_columns)
+                self._conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {kind} ({index_sql})')
+        self._conn.commit()
+        self._data_version = self._read_data_version()
+
+    # --- 변경 알림 ---
+
+    def add_listener(self, listener, rebuild=None):
+        """
+        레코드 변경 구독. listener(kind, old, new) 형태로 호출되며
+        추가는 old=None, 삭제는 new=None
+        rebuild(store)는 다른 워커가 저장소를 바꿨을 때 전체 재구성용
+        """
+        self._listeners.append(listener)
+        if rebuild is not None:
+            self._rebuilders.append(rebuild)
+
+    def _notify(self, kind: str, old: Optional[dict], new: Optional[dict]):
+        for listener in self._listeners:
+            listener(kind, old, new)
+
+    def _read_data_version(self) -> int:
+        # 이 연결 밖(다른 프로세스)에서 커밋했을 때만 값이 바뀜
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def refresh_if_changed(self) -> bool:
+        """다른 워커가 저장소를 바꿨으면 등록된 인덱스를 저장소 기준으로 다시 구성"""
+        with self._lock:
+            version = self._read_data_version()
+            if version == self._data_version:
+                return False
+            self._data_version = version
+            for rebuild in self._rebuilders:
+                rebuild(self)
+            self.external_refreshes += 1
+        return True
+
+    # --- 행 변환 ---
+
+    @staticmethod
+    def _to_row(kind: str, record: dict) -> dict:
+        json_columns = RECORD_SCHEMAS[kind][3]
+        return {
+            key: (json.dumps(value, ensure_ascii=False) if key in json_columns and value is not None else value)
+            for key, value in record.items()
+        }
+
+    @staticmethod
+    def _from_row(kind: str, row: sqlite3.Row) -> dict:
+        model, _, _, json_columns = RECORD_SCHEMAS[kind]
+        data = dict(row)
+        for key in json_columns:
+            if data.get(key) is not None:
+                data[key] = json.loads(data[key])
+        if kind == 'schedule' and data.get('recurrence') is not None:
+            try:
+                RecurrenceRule.model_validate(data['recurrence'])
+            except ValueError:
+                # 규칙 검증이 없던 버전에서 저장된 잘못된 반복 규칙은 단발 일정으로 취급 (부팅 시 색인 재구성이 멈추지 않도록)
+                print(f"[저장소] 잘못된 반복 규칙 무시 ({data['id']}): {data['recurrence']}")
+                data['recurrence'] = None
+        return model.model_validate(data).model_dump()
+
+    @staticmethod
+    def _to_context(kind: str, row: sqlite3.Row):
+        context_type = CONTEXT_TYPES[kind]
+        data = dict(row)
+        return context_type(**{name: data[name] for name in context_type.__dataclass_fields__ if name in data})
+
+    # --- CRUD ---
+
+    def add(self, kind: str, record: dict) -> dict:
+        return self.add_many(kind, [record])[0]
+
+    def add_many(self, kind: str, records: List[dict]) -> List[dict]:
+        model = RECORD_SCHEMAS[kind][0]
+        validated = []
+        for record in records:
+            data = model.model_validate(record).model_dump()
+            data['id'] = data['id'] or uuid.uuid4().hex
+            validated.append(data)
+        if not validated:
+            return []
+
+        columns = list(validated[0].keys())
+        column_sql = ', '.join(f'"{name}"' for name in columns)
+        placeholders = ', '.join('?' for _ in columns)
+        ids = [data['id'] for data in validated]
+        with self._lock:
+            # 같은 id가 이미 있으면 교체되므로 변경 알림용으로 기존 레코드를 먼저 읽어둠
+            previous = {}
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                rows = self._conn.execute(
+                    f'SELECT * FROM {kind} WHERE id IN ({", ".join("?" for _ in chunk)})', chunk
+                ).fetchall()
+                previous.update((row['id'], self._from_row(kind, row)) for row in rows)
+            self._conn.executemany(
+                f'INSERT OR REPLACE INTO {kind} ({column_sql}) VALUES ({placeholders})',
+                [tuple(self._to_row(kind, data)[name] for name in columns) for data in validated]
+            )
+            self._conn.commit()
+            for data in validated:
+                self._notify(kind, previous.get(data['id']), data)
+                previous[data['id']] = data
+        return validated
+
+    def get(self, kind: str, record_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(f'SELECT * FROM {kind} WHERE id = ?', (record_id,)).fetchone()
+        return self._from_row(kind, row) if row else None
+
+    def update(self, kind: str, record_id: str, fields: dict) -> Optional[dict]:
+        """Modification<T>.fieldsToUpdate처럼 일부 필드만 갱신"""
+        with self._lock:
+            current = self.get(kind, record_id)
+            if current is None:
+                return None
+            fields = {key: value for key, value in fields.items() if key != 'id'}
+            updated = RECORD_SCHEMAS[kind][0].model_validate({**current, **fields}).model_dump()
+            row = self._to_row(kind, {key: updated[key] for key in fields if key in updated})
+            if row:
+                assignments = ', '.join(f'"{name}" = ?' for name in row)
+                self._conn.execute(
+                    f'UPDATE {kind} SET {assignments} WHERE id = ?', (*row.values(), record_id)
+                )
+                self._conn.commit()
+                self._notify(kind, current, updated)
+        return updated
+
+    def delete(self, kind: str, record_id: str) -> Optional[dict]:
+        with self._lock:
+            current = self.get(kind, record_id)
+            if current is None:
+                return None
+            self._conn.execute(f'DELETE FROM {kind} WHERE id = ?', (record_id,))
+            self._conn.commit()
+            self._notify(kind, current, None)
+        return current
+
+    def query(self, kind: str, start: Optional[str] = None, end: Optional[str] = None,
+              type: Optional[str] = None, category: Optional[str] = None, group: Optional[str] = None,
+              limit: int = 100, offset: int = 0) -> List[dict]:
+        """인덱스를 타는 조건(날짜 범위, 종류, 카테고리, 그룹)으로 레코드 조회"""
+        columns = RECORD_SCHEMAS[kind][1]
+        conditions = []
+        params = []
+        if start and 'date' in columns:
+            conditions.append('"date" >= ?')
+            params.append(start)
+        if end and 'date' in columns:
+            conditions.append('"date" <= ?')
+            params.append(end)
+        for name, value in (('type', type), ('category', category), ('group', group)):
+            if value is not None and name in columns:
+                conditions.append(f'"{name}" = ?')
+                params.append(value)
+
+        sql = f'SELECT * FROM {kind}'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY "date", rowid' if 'date' in columns else ' ORDER BY rowid'
+        sql += ' LIMIT ? OFFSET ?'
+        with self._lock:
+            rows = self._conn.execute(sql, (*params, limit, offset)).fetchall()
+        return [self._from_row(kind, row) for row in rows]
+
+    def iter_all(self, kind: str):
+        """전체 레코드 순회 (부팅 시와 다른 워커 변경 반영 시 인덱스 재구성용)"""
+        with self._lock:
+            rows = self._conn.execute(f'SELECT * FROM {kind} ORDER BY rowid').fetchall()
+        for row in rows:
+            yield self._from_row(kind, row)
+
+    def count(self, kind: str) -> int:
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM {kind}').fetchone()[0]
+
+    # --- 교차 참조 검색 (fallback_text_parsing의 리스트 순회와 같은 조건) ---
+
+    def _find_one(self, kind: str, condition: str, params: tuple):
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT * FROM {kind} WHERE {condition} ORDER BY rowid LIMIT 1', params
+            ).fetchone()
+        return self._to_context(kind, row) if row else None
+
+    def find_expense(self, item_name: str, amount: Optional[int]) -> Optional[Expense]:
+        name_condition = (
+            "item != '' AND (instr(lower(item), lower(?)) > 0 OR instr(lower(?), lower(item)) > 0)"
+        )
+        if item_name and amount is not None:
+            return self._find_one('expenses', f'({name_condition}) AND amount = ?', (item_name, item_name, amount))
+        if item_name:
+            return self._find_one('expenses', name_condition, (item_name, item_name))
+        if amount is not None:
+            return self._find_one('expenses', 'amount = ?', (amount,))
+        return None
+
+    def find_contact(self, source_text: str) -> Optional[Contact]:
+        return self._find_one(
+            'contacts',
+            "(name != '' AND instr(?, name) > 0) OR (phone != '' AND instr(?, phone) > 0) "
+            "OR (email != '' AND instr(?, email) > 0)",
+            (source_text, source_text, source_text)
+        )
+
+    def find_schedule(self, source_text: str) -> Optional[ScheduleItem]:
+        return self._find_one(
+            'schedule',
+            "(title != '' AND instr(?, title) > 0) OR instr(title, ?) > 0",
+            (source_text, source_text)
+        )
+
+    def find_diary(self, source_text: str) -> Optional[DiaryEntry]:
+        return self._find_one(
+            'diary',
+            "entry != '' AND (instr(entry, ?) > 0 OR instr(?, entry) > 0)",
+            (source_text, source_text)
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            'path': self.path,
+            'external_refreshes': self.external_refreshes,
+            **{kind: self.count(kind) for kind in RECORD_SCHEMAS},
+        }
+
+
+record_store = RecordStore(RECORD_STORE_PATH) if RECORD_STORE_PATH else None
+
+
+class ExpenseRollups:
+    """
+    가계부 집계(일/월/카테고리/유형별 합계와 건수)를 증분 유지
+    레코드 추가/수정/삭제마다 버킷 몇 개만 O(1)로 갱신하고,
+    조회는 원본 행을 훑지 않고 집계 버킷만 읽음
+    """
+
+    GROUP_BYS = ('day', 'month', 'category', 'type')
+
+    def __init__(self):
+        # (차원, 키...) → [합계, 건수]
+        self._buckets = defaultdict(lambda: [0, 0])
+        # 날짜별 건수 (지출/수입 합산) - 기본 조회 범위 계산용
+        self._day_counts = defaultdict(int)
+        self.skipped = 0
+
+    @staticmethod
+    def _day(record: dict) -> Optional[str]:
+        """YYYY-MM-DD 날짜 (해석할 수 없으면 None)"""
+        day = str(record.get('date') or '')[:10]
+        try:
+            datetime.strptime(day, '%Y-%m-%d')
+        except ValueError:
+            return None
+        return day
+
+    @staticmethod
+    def _keys(record: dict, day: str):
+        month = day[:7]
+        category = record.get('category') or '기타'
+        record_type = record.get('type') or 'expense'
+        return (
+            ('day', day, record_type),
+            ('month', month, record_type),
+            ('day_category', day, category, record_type),
+            ('month_category', month, category, record_type),
+            ('category', category, record_type),
+            ('type', record_type),
+        )
+
+    def _apply(self, record: dict, sign: int):
+        day = self._day(record)
+        if day is None:
+            # 저장소 검증 이전에 들어온 잘못된 날짜는 집계에서 제외 (추가/삭제 모두 건너뛰므로 버킷은 일관됨)
+            if sign > 0:
+                self.skipped += 1
+                print(f"[집계] 날짜를 해석할 수 없는 가계부 레코드 제외: {record.get('id')} {record.get('date')!r}")
+            return
+        amount = record.get('amount') or 0
+        for key in self._keys(record, day):
+            bucket = self._buckets[key]
+            bucket[0] += sign * amount
+            bucket[1] += sign
+            if bucket[1] == 0:
+                del self._buckets[key]
+        # 한 유형의 버킷이 비어도 다른 유형 레코드가 남아 있으면 그 날짜는 유지
+        self._day_counts[day] += sign
+        if self._day_counts[day] == 0:
+            del self._day_counts[day]
+
+    def on_change(self, kind: str, old: Optional[dict], new: Optional[dict]):
+        """RecordStore 변경 알림 리스너"""
+        if kind != 'expenses':
+            return
+        if old is not None:
+            self._apply(old, -1)
+        if new is not None:
+            self._apply(new, 1)
+
+    def rebuild(self, records):
+        self._buckets.clear()
+        self._day_counts.clear()
+        self.skipped = 0
+        for record in records:
+            self._apply(record, 1)
+
+    def _bucket(self, *key) -> list:
+        return self._buckets.get(key, (0, 0))
+
+    def _split_range(self, start: str, end: str):
+        """
+        [start, end] 구간을 통째로 포함된 달과 양 끝의 남는 날짜로 분리
+        통째 달은 월 버킷, 남는 날짜만 일 버킷으로 읽음
+        """
+        first = datetime.strptime(start, '%Y-%m-%d').date()
+        last = datetime.strptime(end, '%Y-%m-%d').date()
+        months, days = [], []
+        current = first
+        while current <= last:
+            month_end = current.replace(day=calendar.monthrange(current.year, current.month)[1])
+            if current.day == 1 and month_end <= last:
+                months.append(current.strftime('%Y-%m'))
+                current = month_end + timedelta(days=1)
+            else:
+                stop = min(month_end, last)
+                while current <= stop:
+                    days.append(current.strftime('%Y-%m-%d'))
+                    current += timedelta(days=1)
+        return months, days
+
+    def summarize(self, start: Optional[str] = None, end: Optional[str] = None,
+                  group_by: str = 'month', record_type: Optional[str] = None) -> dict:
+        """기간 내 합계를 group_by 기준으로 집계. 반환: {그룹: {'expense': {...}, 'income': {...}}}"""
+        if not self._day_counts:
+            return {}
+        start = start or min(self._day_counts)
+        end = end or max(self._day_counts)
+        types = [record_type] if record_type else ['expense', 'income']
+        months, days = self._split_range(start, end)
+        categories = {key[1] for key in self._buckets if key[0] == 'category'}
+
+        groups = defaultdict(lambda: {t: {'total': 0, 'count': 0} for t in types})
+
+        def add(group, t, bucket):
+            if bucket[1]:
+                groups[group][t]['total'] += bucket[0]
+                groups[group][t]['count'] += bucket[1]
+
+        for t in types:
+            if group_by == 'day':
+                for day in days + self._days_in_months(months):
+                    add(day, t, self._bucket('day', day, t))
+            elif group_by == 'category':
+                for category in categories:
+                    for month in months:
+                        add(category, t, self._bucket('month_category', month, category, t))
+                    for day in days:
+                        add(category, t, self._bucket('day_category', day, category, t))
+            else:
+                for month in months:
+                    add(month if group_by == 'month' else t, t, self._bucket('month', month, t))
+                for day in days:
+                    add(day[:7] if group_by == 'month' else t, t, self._bucket('day', day, t))
+
+        return dict(sorted(groups.items()))
+
+    @staticmethod
+    def _days_in_months(months: List[str]) -> List[str]:
+        days = []
+        for month in months:
+            year, month_number = map(int, month.split('-'))
+            for day in range(1, calendar.monthrange(year, month_number)[1] + 1):
+                days.append(f"{month}-{day:02d}")
+        return days
+
+    def month_total(self, month: str, record_type: str = 'expense'):
+        return self._bucket('month', month, record_type)[0]
+
+    def budget_status(self, month: str, monthly_limit: float) -> dict:
+        """이번 달 지출이 예산(NotificationSettings.budget.monthlyLimit)을 넘었는지 O(1) 확인"""
+        spent = self.month_total(month, 'expense')
+        return {
+            'month': month,
+            'spent': spent,
+            'monthlyLimit': monthly_limit,
+            'remaining': monthly_limit - spent,
+            'exceeded': monthly_limit > 0 and spent > monthly_limit,
+            'ratio': spent / monthly_limit if monthly_limit > 0 else None,
+        }
+
+
+expense_rollups = ExpenseRollups()
+if record_store is not None:
+    expense_rollups.rebuild(record_store.iter_all('expenses'))
+    record_store.add_listener(expense_rollups.on_change,
+                              rebuild=lambda store: expense_rollups.rebuild(store.iter_all('expenses')))
+
+
+def _normalize_text(value: Any) -> str:
+    """비교용 문자열 정규화 (소문자, 공백/구두점 제거)"""
+    return re.sub(r'[\s\W_]+', '', str(value or '')).lower()
+
+
+def record_fingerprint(kind: str, record: dict) -> Optional[bytes]:
+    """
+    레코드 종류별 중복 판별용 지문
+    - 가계부: 항목명 + 금액 + 날짜
+    - 연락처: 전화번호 숫자 (없으면 이메일)
+    - 일정: 제목 + 날짜 + 시간
+    - 메모: 본문
+    """
+    if kind == 'expenses':
+        amount = record.get('amount') or 0
+        if isinstance(amount, float) and amount.is_integer():
+            amount = int(amount)
+        canonical = f"{_normalize_text(record.get('item'))}|{amount}|{(record.get('date') or '')[:10]}"
+    elif kind == 'contacts':
+        phone = re.sub(r'\D', '', str(record.get('phone') or ''))
+        email = str(record.get('email') or '').strip().lower()
+        if not phone and not email:
+            return None
+        canonical = f"p:{phone}" if phone else f"e:{email}"
+    elif kind == 'schedule':
+        canonical = f"{_normalize_text(record.get('title'))}|{(record.get('date') or '')[:10]}|{record.get('time') or ''}"
+    elif kind == 'diary':
+        canonical = _normalize_text(record.get('entry'))
+        if not canonical:
+            return None
+    else:
+        return None
+    return hashlib.blake2b(f"{kind}|{canonical}".encode(), digest_size=16).digest()
+
+
+class DedupIndex:
+    """
+    저장된 레코드 지문 해시 집합 - 새 레코드의 중복 여부를 O(1)로 확인
+    같은 지문의 레코드가 여럿일 수 있으므로 개수를 함께 유지
+    """
+
+    def __init__(self):
+        self._counts = defaultdict(int)
+
+    def _add(self, kind: str, record: dict, delta: int):
+        fingerprint = record_fingerprint(kind, record)
+        if fingerprint is None:
+            return
+        self._counts[fingerprint] += delta
+        if self._counts[fingerprint] <= 0:
+            del self._counts[fingerprint]
+
+    def add(self, kind: str, record: dict):
+        self._add(kind, record, 1)
+
+    def rebuild(self, store: 'RecordStore'):
+        self._counts.clear()
+        for kind in RECORD_SCHEMAS:
+            for record in store.iter_all(kind):
+                self.add(kind, record)
+
+    def on_change(self, kind: str, old: Optional[dict], new: Optional[dict]):
+        """RecordStore 변경 알림 리스너"""
+        if old is not None:
+            self._add(kind, old, -1)
+        if new is not None:
+            self._add(kind, new, 1)
+
+    def contains(self, kind: str, record: dict) -> bool:
+        fingerprint = record_fingerprint(kind, record)
+        return fingerprint is not None and fingerprint in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
+
+dedup_index = DedupIndex()
+if record_store is not None:
+    dedup_index.rebuild(record_store)
+    record_store.add_listener(dedup_index.on_change, rebuild=dedup_index.rebuild)
+
+
+# /api/process가 추출한 레코드를 서버 저장소에도 저장할지 (저장소가 켜져 있을 때만 적용)
+RECORD_STORE_SAVE_EXTRACTED = os.environ.get("RECORD_STORE_SAVE_EXTRACTED", "1") == "1"
+extracted_record_counters = {'saved': 0, 'invalid': 0}
+
+
+def save_extracted_records(parsed_data: Dict[str, Any]) -> int:
+    """
+    중복 의심이 아닌 추출 레코드를 서버 저장소에 추가하고 발급된 id를 레코드에 기록
+    저장소 리스너로 집계/중복/검색/달력/알림 인덱스도 함께 갱신됨. 반환: 저장한 레코드 수
+    """
+    if record_store is None or not RECORD_STORE_SAVE_EXTRACTED:
+        return 0
+    if frozen_now.get() is not None:
+        # replay.py로 재생한 요청(X-Frozen-Time)은 대상 서버 저장소를 바꾸지 않음
+        return 0
+    saved = 0
+    for kind in CONTEXT_TYPES:
+        model = RECORD_SCHEMAS[kind][0]
+        records, payload = [], []
+        for record in parsed_data.get(kind) or []:
+            if not isinstance(record, dict) or record.get('isDuplicate'):
+                continue
+            data = {key: value for key, value in record.items() if key not in ('id', 'isDuplicate')}
+            try:
+                model.model_validate(data)
+            except ValueError:
+                # 필수 필드가 없거나 날짜가 YYYY-MM-DD로 해석되지 않은 모델 출력 (예: '내일')
+                print(f"[저장소] 형식이 맞지 않아 저장하지 않음 ({kind}): {data}")
+                extracted_record_counters['invalid'] += 1
+                continue
+            records.append(record)
+            payload.append(data)
+        for record, stored in zip(records, record_store.add_many(kind, payload)):
+            record['id'] = stored['id']
+        saved += len(payload)
+    extracted_record_counters['saved'] += saved
+    return saved
+
+
+def mark_duplicates(parsed_data: Dict[str, Any], context_data: ContextData) -> int:
+    """
+    추출된 각 레코드에 isDuplicate 표시 (서버 저장소, 요청 contextData, 같은 응답 내 앞선 레코드 기준)
+    반환: 중복 의심 레코드 수
+    """
+    # 요청에 실려 온 contextData는 요청마다 한 번만 지문화 (O(n+m))
+    request_index = DedupIndex()
+    for kind in CONTEXT_TYPES:
+        for item in getattr(context_data, kind):
+            request_index.add(kind, asdict(item))
+
+    duplicates = 0
+    for kind in CONTEXT_TYPES:
+        records = parsed_data.get(kind)
+        if not isinstance(records, list):
+            continue
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            is_duplicate = request_index.contains(kind, record) or dedup_index.contains(kind, record)
+            record['isDuplicate'] = is_duplicate
+            request_index.add(kind, record)
+            duplicates += is_duplicate
+    return duplicates
+
+
+# 캘린더 설정
+CALENDAR_EVENT_MINUTES = int(os.environ.get("CALENDAR_EVENT_MINUTES", "60"))        # 충돌 판단용 기본 일정 길이
+CALENDAR_CONFLICT_HORIZON_DAYS = int(os.environ.get("CALENDAR_CONFLICT_HORIZON_DAYS", "365"))  # 반복 일정 충돌 검사 범위
+
+
+def _parse_day(value: str) -> date:
+    return datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+
+def _iter_rule_from(rule: RecurrenceRule, dtstart: date, since: date):
+    """
+    since 이후 발생일을 순서대로 생성 (since 이전 구간은 계산으로 건너뜀)
+    규칙상 존재하지 않는 날짜만 계속 나오면 (예: 12개월 간격의 2월 31일)
+    그레고리력 한 주기(400년) 동안 발생이 없을 때 중단하고, date 범위(9999년)를 넘어도 중단
+    """
+    since = max(since, dtstart)
+    try:
+        if rule.freq == 'daily':
+            skipped = (since - dtstart).days
+            current = dtstart + timedelta(days=-(-skipped // rule.interval) * rule.interval)
+            while True:
+                yield current
+                current += timedelta(days=rule.interval)
+
+        elif rule.freq == 'weekly':
+            weekdays = sorted(set(rule.weekdays or [dtstart.weekday()]))
+            anchor = dtstart - timedelta(days=dtstart.weekday())  # 첫 주 월요일
+            week = (since - anchor).days // 7
+            week -= week % rule.interval
+            while True:
+                week_start = anchor + timedelta(weeks=week)
+                for weekday in weekdays:
+                    current = week_start + timedelta(days=weekday)
+                    if current >= since:
+                        yield current
+                week += rule.interval
+
+        elif rule.freq == 'monthly':
+            day = rule.monthDay or dtstart.day
+            months = (since.year - dtstart.year) * 12 + since.month - dtstart.month
+            months -= months % rule.interval
+            max_misses = 4800 // math.gcd(rule.interval, 4800)
+            misses = 0
+            while misses < max_misses:
+                year, month = dtstart.year + (dtstart.month - 1 + months) // 12, (dtstart.month - 1 + months) % 12 + 1
+                # 해당 월에 없는 날짜(예: 2월 30일)는 건너뜀
+                if day <= calendar.monthrange(year, month)[1]:
+                    misses = 0
+                    current = date(year, month, day)
+                    if current >= since:
+                        yield current
+                else:
+                    misses += 1
+                months += rule.interval
+
+        else:  # yearly
+            month = rule.month or dtstart.month
+            day = rule.monthDay or dtstart.day
+            years = since.year - dtstart.year
+            years -= years % rule.interval
+            max_misses = 400 // math.gcd(rule.interval, 400)
+            misses = 0
+            while misses < max_misses:
+                year = dtstart.year + years
+                if day <= calendar.monthrange(year, month)[1]:
+                    misses = 0
+                    current = date(year, month, day)
+                    if current >= since:
+                        yield current
+                else:
+                    misses += 1
+                years += rule.interval
+    except (OverflowError, ValueError):
+        # date.max를 넘는 날짜
+        return
+
+
+def iter_occurrences(rule: RecurrenceRule, dtstart: date, start: date, end: Optional[date] = None):
+    """
+    [start, end] 구간의 반복 일정 발생일을 지연 생성
+    end가 없으면 끝없이 생성하므로 호출 측에서 필요한 만큼만 소비
+    """
+    until = _parse_day(rule.until) if rule.until else None
+    if rule.count is not None:
+        # 횟수 제한은 첫 발생부터 세어야 함
+        occurrences = itertools.islice(_iter_rule_from(rule, dtstart, dtstart), rule.count)
+    else:
+        occurrences = _iter_rule_from(rule, dtstart, start)
+
+    for current in occurrences:
+        if (end is not None and current > end) or (until is not None and current > until):
+            return
+        if current >= start:
+            yield current
+
+
+def next_occurrence(rule: RecurrenceRule, dtstart: date, since: date) -> Optional[date]:
+    return next(iter_occurrences(rule, dtstart, since), None)
+
+
+def _time_to_minutes(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    match = re.match(r'(\d{1,2}):(\d{2})', value)
+    return int(match.group(1)) * 60 + int(match.group(2)) if match else None
+
+
+class CalendarIndex:
+    """
+    일정 날짜 인덱스
+    - 단발 일정: (날짜, 시간, id) 정렬 리스트 + 이진 탐색으로 범위 조회
+    - 반복 일정: 규칙만 보관하고 조회 시 생성기로 지연 전개 후 병합
+    """
+
+    def __init__(self):
+        self._single = []     # 정렬된 (date, time, id)
+        self._items = {}      # id → 레코드
+        self._recurring = {}  # id → (RecurrenceRule, 첫 발생일)
+
+    def _insert(self, record: dict):
+        record_id = record['id']
+        self._items[record_id] = record
+        if record.get('recurrence'):
+            self._recurring[record_id] = (RecurrenceRule.model_validate(record['recurrence']), _parse_day(record['date']))
+        else:
+            bisect.insort(self._single, (record['date'][:10], record.get('time') or '', record_id))
+
+    def _remove(self, record: dict):
+        record_id = record['id']
+        self._items.pop(record_id, None)
+        if self._recurring.pop(record_id, None) is None:
+            key = (record['date'][:10], record.get('time') or '', record_id)
+            position = bisect.bisect_left(self._single, key)
+            if position < len(self._single) and self._single[position] == key:
+                del self._single[position]
+
+    def on_change(self, kind: str, old: Optional[dict], new: Optional[dict]):
+        """RecordStore 변경 알림 리스너"""
+        if kind != 'schedule':
+            return
+        if old is not None:
+            self._remove(old)
+        if new is not None:
+            self._insert(new)
+
+    def rebuild(self, records):
+        self._single.clear()
+        self._items.clear()
+        self._recurring.clear()
+        for record in records:
+            self._insert(record)
+
+    def _single_between(self, start: str, end: str):
+        low = bisect.bisect_left(self._single, (start,))
+        high = bisect.bisect_right(self._single, (end, '\uffff'))
+        return itertools.islice(self._single, low, high)
+
+    def _expand(self, record_id: str, rule: RecurrenceRule, dtstart: date, start: date, end: date):
+        time_value = self._items[record_id].get('time') or ''
+        for current in iter_occurrences(rule, dtstart, start, end):
+            yield current.isoformat(), time_value, record_id
+
+    def occurrences(self, start: date, end: date):
+        """[start, end] 구간 일정 발생을 날짜/시간 순으로 생성"""
+        streams = [self._single_between(start.isoformat(), end.isoformat())]
+        for record_id, (rule, dtstart) in self._recurring.items():
+            streams.append(self._expand(record_id, rule, dtstart, start, end))
+
+        today = current_kst().date()
+        for day, _, record_id in heapq.merge(*streams):
+            record = self._items[record_id]
+            yield {
+                **record,
+                'date': day,
+                'recurring': record_id in self._recurring,
+                'dday': (_parse_day(day) - today).days,
+            }
+
+    def _conflicts_on(self, day: date, minutes: int, exclude_id: Optional[str]):
+        day_str = day.isoformat()
+        candidates = [record_id for _, _, record_id in self._single_between(day_str, day_str)]
+        candidates += [
+            record_id for record_id, (rule, dtstart) in self._recurring.items()
+            if next_occurrence(rule, dtstart, day) == day
+        ]
+        for record_id in candidates:
+            if record_id == exclude_id:
+                continue
+            other = _time_to_minutes(self._items[record_id].get('time'))
+            if other is not None and abs(other - minutes) < CALENDAR_EVENT_MINUTES:
+                yield {**self._items[record_id], 'date': day_str}
+
+    def conflicts(self, candidate: dict, limit: int = 20) -> List[dict]:
+        """새 일정과 시간이 겹치는 기존 일정 (시간 없는 종일 일정은 제외)"""
+        minutes = _time_to_minutes(candidate.get('time'))
+        if minutes is None:
+            return []
+        first = _parse_day(candidate['date'])
+        if candidate.get('recurrence'):
+            rule = RecurrenceRule.model_validate(candidate['recurrence'])
+            days = iter_occurrences(rule, first, first, first + timedelta(days=CALENDAR_CONFLICT_HORIZON_DAYS))
+        else:
+            days = [first]
+
+        found = (
+            conflict for day in days
+            for conflict in self._conflicts_on(day, minutes, candidate.get('id'))
+        )
+        return list(itertools.islice(found, limit))
+
+
+calendar_index = CalendarIndex()
+if record_store is not None:
+    calendar_index.rebuild(record_store.iter_all('schedule'))
+    record_store.add_listener(calendar_index.on_change,
+                              rebuild=lambda store: calendar_index.rebuild(store.iter_all('schedule')))
+
+
+# 알림 스케줄러 설정
+NOTIFICATION_OUTBOX_MAX = int(os.environ.get("NOTIFICATION_OUTBOX_MAX", "500"))  # 가져가지 않은 알림 최대 보관 수
+# 워커 간 공유 알림 outbox/설정 DB와 알림 리더 잠금 파일 (기본: 레코드 저장소 옆, 빈 문자열이면 워커 하나로 간주)
+NOTIFICATION_STORE_PATH = os.environ.get(
+    "NOTIFICATION_STORE_PATH", f"{RECORD_STORE_PATH}.notifications" if RECORD_STORE_PATH else "")
+NOTIFICATION_LEADER_LOCK = os.environ.get(
+    "NOTIFICATION_LEADER_LOCK", f"{RECORD_STORE_PATH}.notify.lock" if RECORD_STORE_PATH else "")
+DDAY_ALERT_DAYS = (1, 10, 50)  # + 100일 단위 (100, 200, 300, ...)
+BUDGET_ALERT_THRESHOLDS = (30, 50, 90, 100)  # 월 예산 대비 %
+
+
+class CalendarAlertSettings(BaseModel):
+    enabled: bool = True
+    dDayAlerts: bool = True
+    todayEventAlerts: bool = True
+
+
+class BudgetAlertSettings(BaseModel):
+    enabled: bool = False
+    monthlyLimit: float = 0
+
+
+class NotificationSettings(BaseModel):
+    """types.ts NotificationSettings와 같은 형태"""
+    calendar: CalendarAlertSettings = Field(default_factory=CalendarAlertSettings)
+    budget: BudgetAlertSettings = Field(default_factory=BudgetAlertSettings)
+
+
+def _kst_midnight(day: date) -> float:
+    return KST.localize(datetime(day.year, day.month, day.day)).timestamp()
+
+
+def _dday_offset(days_left: int) -> Optional[int]:
+    """남은 일수 이하에서 가장 큰 알림 시점 (D-100 단위, D-50, D-10, D-1)"""
+    if days_left >= 100:
+        return days_left // 100 * 100
+    for offset in reversed(DDAY_ALERT_DAYS):
+        if days_left >= offset:
+            return offset
+    return None
+
+
+class NotificationOutbox:
+    """
+    워커 간 공유 알림 outbox와 알림 설정 (SQLite)
+    알림은 리더 워커만 만들고, 가져가기와 설정 변경은 어느 워커에서든 처리
+    레코드 저장소와 파일을 나눠 알림 가져가기가 다른 워커의 인덱스 재구성을 일으키지 않게 함
+    """
+
+    def __init__(self, path: str, maxlen: int):
+        self.path = path
+        self.maxlen = maxlen
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('CREATE TABLE IF NOT EXISTS outbox (seq INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        # 이미 보낸 예산 알림 (재시작/리더 교체 후에도 같은 달 같은 임계값을 다시 보내지 않음)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS budget_alerts (month TEXT NOT NULL, threshold INTEGER NOT NULL, '
+            'PRIMARY KEY (month, threshold))'
+        )
+        self._conn.commit()
+
+    def push(self, notifications: List[dict]):
+        with self._lock:
+            self._conn.executemany(
+                'INSERT INTO outbox (payload) VALUES (?)',
+                [(json.dumps(notification, ensure_ascii=False),) for notification in notifications]
+            )
+            # deque(maxlen)처럼 가져가지 않은 알림이 상한을 넘으면 오래된 것부터 버림
+            self._conn.execute('DELETE FROM outbox WHERE seq <= (SELECT MAX(seq) FROM outbox) - ?', (self.maxlen,))
+            self._conn.commit()
+
+    def pull(self) -> List[dict]:
+        """쌓인 알림을 모두 가져가고 지움 (DELETE 한 문장이라 워커 간 중복 전달 없음)"""
+        with self._lock:
+            rows = self._conn.execute('DELETE FROM outbox RETURNING seq, payload').fetchall()
+            self._conn.commit()
+        return [json.loads(payload) for _, payload in sorted(rows)]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def claim_budget_alert(self, month: str, threshold: int) -> bool:
+        """이 달의 임계값 알림을 처음 기록하면 True"""
+        with self._lock:
+            inserted = self._conn.execute(
+                'INSERT OR IGNORE INTO budget_alerts (month, threshold) VALUES (?, ?)', (month, threshold)
+            ).rowcount
+            self._conn.commit()
+        return inserted == 1
+
+    def load_settings(self) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM settings WHERE key = 'notifications'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_settings(self, value: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES ('notifications', ?)", (json.dumps(value),)
+            )
+            self._conn.commit()
+
+
+class NotificationScheduler:
+    """
+    일정 알림 타이머 힙 (발생 시각 = KST 자정)
+    - 레코드·알림 종류(today/dday)마다 다음 알림 하나만 힙에 넣고, 발생하면 그다음 것을 계산해 넣음
+    - 레코드가 바뀌면 버전만 올리고 힙의 옛 항목은 꺼낼 때 버림 (lazy deletion)
+    - 예산 알림은 지출 변경 시 expense_rollups의 월 합계로 바로 판단해 outbox에 넣음
+    - 워커가 여러 개면 리더 잠금을 잡은 워커 하나만 알림을 만들고 공유 outbox에 넣음
+    """
+
+    def __init__(self, outbox_max: int, shared: Optional[NotificationOutbox] = None,
+                 leader_lock: Optional[str] = None):
+        self._settings = NotificationSettings()
+        self._shared = shared
+        self._leader_lock_path = leader_lock
+        self._leader_lock = None
+        # 잠금 파일이 없으면 워커 하나로 보고 처음부터 리더
+        self.leader = not leader_lock
+        self._lock = threading.Lock()
+        self._heap = []        # (발생 시각, 순번, record_id, 종류, 버전)
+        self._seq = itertools.count()
+        self._records = {}     # record_id → (레코드, 버전), 버전은 변경마다 새 순번
+        self._outbox = deque(maxlen=outbox_max)
+        self._budget_fired = defaultdict(set)  # 월 → 이미 보낸 임계값 (공유 outbox가 없을 때)
+        self.counters = {'fired': 0, 'stale_skipped': 0, 'missed': 0, 'budget_alerts': 0, 'delivered': 0,
+                         'invalid': 0}
+
+    @property
+    def settings(self) -> NotificationSettings:
+        # 설정은 어느 워커에서 바꿔도 리더가 보도록 공유 DB에서 읽음
+        if self._shared is not None:
+            stored = self._shared.load_settings()
+            if stored is not None:
+                return NotificationSettings.model_validate(stored)
+        return self._settings
+
+    def try_lead(self, store: 'RecordStore') -> bool:
+        """리더 잠금을 잡으면 이 워커가 알림 힙을 맡음 (리더 프로세스가 끝나면 잠금이 풀려 다른 워커가 이어받음)"""
+        if self.leader:
+            return True
+        if fcntl is not None:
+            handle = open(self._leader_lock_path, 'a')
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return False
+            self._leader_lock = handle
+        self.leader = True
+        print(f"[알림] 알림 리더 워커 (pid {os.getpid()})")
+        self.rebuild(store.iter_all('schedule'))
+        return True
+
+    def refresh(self, store: 'RecordStore'):
+        """다른 워커의 저장소 변경 반영 (RecordStore 재구성 콜백)"""
+        if not self.leader:
+            return
+        self.rebuild(store.iter_all('schedule'))
+        self.check_budget()
+
+    @staticmethod
+    def _today() -> date:
+        return current_kst().date()
+
+    def _event_day(self, record: dict, since: date) -> Optional[date]:
+        """since 이후 첫 일정 날짜 (반복 일정이면 다음 발생일)"""
+        first = _parse_day(record['date'])
+        if record.get('recurrence'):
+            return next_occurrence(RecurrenceRule.model_validate(record['recurrence']), first, since)
+        return first if first >= since else None
+
+    def _next_alert(self, record: dict, kind: str, since: date) -> Optional[tuple]:
+        """since 이후 다음 알림 (발생일, 일정 날짜, 남은 일수)"""
+        if kind == 'today':
+            event_day = self._event_day(record, since)
+            return (event_day, event_day, 0) if event_day else None
+        # D-day: 다음 일정 날짜까지 남은 일수 기준, 당일이면 그다음 발생으로
+        event_day = self._event_day(record, since)
+        while event_day is not None:
+            offset = _dday_offset((event_day - since).days)
+            if offset is not None:
+                return event_day - timedelta(days=offset), event_day, offset
+            if not record.get('recurrence'):
+                return None
+            event_day = self._event_day(record, event_day + timedelta(days=1))
+        return None
+
+    def _push(self, record_id: str, kind: str, since: date):
+        record, version = self._records[record_id]
+        alert = self._next_alert(record, kind, since)
+        if alert is not None:
+            heapq.heappush(self._heap, (_kst_midnight(alert[0]), next(self._seq), record_id, kind, version))
+
+    def _schedule(self, record: dict, since: date):
+        record_id = record['id']
+        self._records[record_id] = (record, next(self._seq))
+        try:
+            self._push(record_id, 'today', since)
+            if record.get('isDday'):
+                self._push(record_id, 'dday', since)
+        except (KeyError, TypeError, ValueError) as e:
+            # 날짜/반복 규칙을 해석할 수 없는 레코드 하나 때문에 시작이나 다른 리스너가 멈추지 않도록 제외
+            # (힙에 먼저 들어간 항목은 버전 불일치로 버려짐)
+            del self._records[record_id]
+            self.counters['invalid'] += 1
+            print(f"[알림] 해석할 수 없는 일정이라 알림에서 제외 ({record_id}): {e}")
+
+    def rebuild(self, records):
+        """
+        전체 일정 기준으로 다시 예약. 내용이 그대로인 일정은 기존 예약을 유지해
+        다른 워커 변경을 반영할 때 오늘 이미 보낸 알림이 다시 나가지 않게 함
+        """
+        with self._lock:
+            today = self._today()
+            current = {record['id']: record for record in records}
+            for record_id in list(self._records):
+                if record_id not in current:
+                    del self._records[record_id]
+            for record_id, record in current.items():
+                existing = self._records.get(record_id)
+                if existing is None or existing[0] != record:
+                    self._schedule(record, today)
+            # 버려진 항목이 쌓이면 힙을 한 번 정리
+            if len(self._heap) > 4 * len(self._records) + 64:
+                self._heap = [entry for entry in self._heap
+                              if self._records.get(entry[2], (None, None))[1] == entry[4]]
+                heapq.heapify(self._heap)
+
+    def on_change(self, kind: str, old: Optional[dict], new: Optional[dict]):
+        """RecordStore 변경 알림 리스너"""
+        if not self.leader:
+            return
+        if kind == 'expenses':
+            self.check_budget()
+            return
+        if kind != 'schedule':
+            return
+        with self._lock:
+            if new is not None:
+                self._schedule(new, self._today())
+            elif old is not None:
+                # 힙에 남은 항목은 꺼낼 때 버전 불일치로 버려짐
+                self._records.pop(old['id'], None)
+
+    def _notification(self, title: str, message: str, kind: str, view: str, day: str) -> dict:
+        return {
+            'id': uuid.uuid4().hex,
+            'title': title,
+            'message': message,
+            'timestamp': current_kst().isoformat(),
+            'type': kind,
+            'relatedData': {'view': view, 'date': day},
+        }
+
+    def fire_due(self, now: Optional[float] = None) -> int:
+        """발생 시각이 지난 알림을 outbox로 옮김 (k개 발생 시 O(k log n))"""
+        # 예약(_today)과 같은 시계 사용 (고정 시계 요청이면 그 시각 기준)
+        now = current_kst().timestamp() if now is None else now
+        today = datetime.fromtimestamp(now, KST).date()
+        calendar_settings = self.settings.calendar
+        fired = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, _, record_id, kind, version = heapq.heappop(self._heap)
+                current = self._records.get(record_id)
+                if current is None or current[1] != version:
+                    self.counters['stale_skipped'] += 1
+                    continue
+                record = current[0]
+                fire_day = datetime.fromtimestamp(fire_at, KST).date()
+                if fire_day < today:
+                    # 서버가 꺼져 있던 동안 지난 알림은 보내지 않고 오늘부터 다시 예약
+                    self.counters['missed'] += 1
+                    self._push(record_id, kind, today)
+                    continue
+                alert = self._next_alert(record, kind, fire_day)
+                if alert is None:
+                    continue
+                _, event_day, days_left = alert
+                if kind == 'today' and calendar_settings.enabled and calendar_settings.todayEventAlerts:
+                    time_suffix = f" ({record['time']})" if record.get('time') else ''
+                    self._outbox.append(self._notification(
+                        '오늘의 일정', f"오늘 '{record['title']}' 일정이 있습니다.{time_suffix}",
+                        'calendar', 'CALENDAR', event_day.isoformat()))
+                    fired += 1
+                elif kind == 'dday' and calendar_settings.enabled and calendar_settings.dDayAlerts:
+                    self._outbox.append(self._notification(
+                        'D-Day 알림', f"'{record['title']}'까지 {days_left}일 남았습니다.",
+                        'calendar', 'CALENDAR', event_day.isoformat()))
+                    fired += 1
+                # 같은 레코드의 다음 알림 예약
+                self._push(record_id, kind, fire_day + timedelta(days=1))
+            self.counters['fired'] += fired
+        self._flush()
+        return fired
+
+    def _flush(self):
+        """공유 outbox가 있으면 이 워커에서 만든 알림을 옮김"""
+        if self._shared is None:
+            return
+        with self._lock:
+            pending = list(self._outbox)
+            self._outbox.clear()
+        if pending:
+            self._shared.push(pending)
+
+    def check_budget(self):
+        """이번 달 지출이 예산 임계값을 새로 넘었으면 알림 (월 합계는 롤업에서 O(1))"""
+        if not self.leader:
+            return
+        budget = self.settings.budget
+        if not budget.enabled or budget.monthlyLimit <= 0:
+            return
+        month = current_kst().strftime('%Y-%m')
+        spent = expense_rollups.month_total(month, 'expense')
+        ratio = spent / budget.monthlyLimit * 100
+        with self._lock:
+            for threshold in BUDGET_ALERT_THRESHOLDS:
+                if ratio >= threshold and self._claim_budget_alert(month, threshold):
+                    self._outbox.append(self._notification(
+                        '지출 한도 경고',
+                        f"이번 달 지출이 설정 한도의 {threshold}%에 도달했습니다. "
+                        f"(현재: {spent:,.0f}원 / 한도: {budget.monthlyLimit:,.0f}원)",
+                        'budget', 'EXPENSES_EXPENSE', f"{month}-01"))
+                    self.counters['budget_alerts'] += 1
+        self._flush()
+
+    def _claim_budget_alert(self, month: str, threshold: int) -> bool:
+        """이 달 이 임계값 알림을 아직 보내지 않았으면 보낸 것으로 기록하고 True"""
+        if self._shared is not None:
+            return self._shared.claim_budget_alert(month, threshold)
+        fired = self._budget_fired[month]
+        if threshold in fired:
+            return False
+        fired.add(threshold)
+        return True
+
+    def update_settings(self, settings: NotificationSettings):
+        if self._shared is not None:
+            self._shared.save_settings(settings.model_dump())
+        self._settings = settings
+        self.check_budget()
+
+    def pull(self) -> List[dict]:
+        """발생한 알림을 모두 가져감 (가져간 알림은 outbox에서 제거)"""
+        if self.leader:
+            self.fire_due()
+        if self._shared is not None:
+            delivered = self._shared.pull()
+        else:
+            with self._lock:
+                delivered = list(self._outbox)
+                self._outbox.clear()
+        self.counters['delivered'] += len(delivered)
+        return delivered
+
+    def next_fire_at(self) -> Optional[float]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    async def run(self, store: 'RecordStore'):
+        """다음 알림 시각(보통 KST 자정)까지 기다렸다가 outbox로 옮기는 타이머 루프"""
+        while True:
+            if not self.leader and not await run_in_threadpool(self.try_lead, store):
+                # 리더가 아니면 리더 워커가 내려갈 때를 대비해 잠금만 주기적으로 다시 시도
+                await asyncio.sleep(60.0)
+                continue
+            # 다른 워커에서 바뀐 예산 설정 반영 (SQLite 접근은 이벤트 루프 밖에서)
+            await run_in_threadpool(self.check_budget)
+            next_fire = self.next_fire_at()
+            # 대기 중 더 이른 알림이 추가될 수 있으므로 최대 60초마다 다시 확인
+            delay = 60.0 if next_fire is None else min(60.0, max(0.0, next_fire - time.time()))
+            await asyncio.sleep(delay)
+            fired = await run_in_threadpool(self.fire_due)
+            if fired:
+                print(f"[알림] {fired}개 발생 (대기 {len(self._outbox)}개)")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            next_fire = self._heap[0][0] if self._heap else None
+            return {
+                'leader': self.leader,
+                'scheduled': len(self._heap),
+                'records': len(self._records),
+                'outbox': self._shared.count() if self._shared is not None else len(self._outbox),
+                'next_fire_at': datetime.fromtimestamp(next_fire, KST).isoformat() if next_fire else None,
+                **self.counters,
+            }
+
+
+notification_scheduler = NotificationScheduler(
+    NOTIFICATION_OUTBOX_MAX,
+    NotificationOutbox(NOTIFICATION_STORE_PATH, NOTIFICATION_OUTBOX_MAX) if NOTIFICATION_STORE_PATH else None,
+    NOTIFICATION_LEADER_LOCK or None,
+)
+if record_store is not None:
+    # 리더 잠금을 쓰면 힙은 lifespan에서 리더가 된 뒤 구성
+    if notification_scheduler.leader:
+        notification_scheduler.rebuild(record_store.iter_all('schedule'))
+    record_store.add_listener(notification_scheduler.on_change, rebuild=notification_scheduler.refresh)
+
+
+# 검색 대상 필드 (종류별)
+SEARCH_FIELDS = {
+    'contacts': ('name', 'phone', 'email'),
+    'schedule': ('title',),
+    'expenses': ('item',),
+    'diary': ('entry',),
+}
+SEARCH_FIELD_CODES = {field: code for code, field in enumerate(
+    field for fields in SEARCH_FIELDS.values() for field in fields
+)}
+SEARCH_FIELD_WEIGHTS = {'name': 1.5, 'title': 1.5, 'item': 1.2, 'phone': 1.0, 'email': 1.0, 'entry': 0.8}
+
+
+def _normalize_search(text: str) -> str:
+    # 띄어쓰기가 일정하지 않은 한국어 입력을 위해 공백/구두점을 모두 제거 (전화번호 '-'도 제거)
+    return re.sub(r'[\s\W_]+', '', str(text or '').lower())
+
+
+def _ngrams(text: str, n: int) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class NgramSearchIndex:
+    """
+    문자 1-gram/2-gram/3-gram 역색인 (형태소 분석 없이 한국어 부분 검색)
+    포스팅 키는 문서번호 * 8 + 필드코드 정수라 필드 필터를 색인 분리 없이 처리
+    RecordStore 변경 알림으로 증분 갱신
+    """
+
+    FIELD_SLOTS = 8
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(set)  # gram → {posting id}
+        self._texts = {}                    # posting id → 원본 필드 값
+        self._docs = {}                     # 문서번호 → (kind, record id, date)
+        self._doc_ids = {}                  # (kind, record id) → 문서번호
+        self._next_doc = 0
+
+    @staticmethod
+    def _grams(normalized: str) -> set:
+        # 1-gram은 한 글자 질의용 (필드 끝 글자나 한 글자 필드도 찾을 수 있도록)
+        return set(normalized) | _ngrams(normalized, 2) | _ngrams(normalized, 3)
+
+    def _add(self, kind: str, record: dict):
+        doc = self._next_doc
+        self._next_doc += 1
+        self._doc_ids[(kind, record['id'])] = doc
+        self._docs[doc] = (kind, record['id'], (record.get('date') or '')[:10] or None)
+        for field in SEARCH_FIELDS[kind]:
+            value = record.get(field)
+            if not value:
+                continue
+            posting = doc * self.FIELD_SLOTS + SEARCH_FIELD_CODES[field]
+            self._texts[posting] = str(value)
+            for gram in self._grams(_normalize_search(value)):
+                self._postings[gram].add(posting)
+
+    def _remove(self, kind: str, record_id: str):
+        doc = self._doc_ids.pop((kind, record_id), None)
+        if doc is None:
+            return
+        del self._docs[doc]
+        for field in SEARCH_FIELDS[kind]:
+            posting = doc * self.FIELD_SLOTS + SEARCH_FIELD_CODES[field]
+            value = self._texts.pop(posting, None)
+            if value is None:
+                continue
+            for gram in self._grams(_normalize_search(value)):
+                postings = self._postings.get(gram)
+                if postings is not None:
+                    postings.discard(posting)
+                    if not postings:
+                        del self._postings[gram]
+
+    def on_change(self, kind: str, old: Optional[dict], new: Optional[dict]):
+        """RecordStore 변경 알림 리스너"""
+        with self._lock:
+            if old is not None:
+                self._remove(kind, old['id'])
+            if new is not None:
+                self._add(kind, new)
+
+    def rebuild(self, store: 'RecordStore'):
+        with self._lock:
+            self._postings.clear()
+            self._texts.clear()
+            self._docs.clear()
+            self._doc_ids.clear()
+            for kind in SEARCH_FIELDS:
+                for record in store.iter_all(kind):
+                    self._add(kind, record)
+
+    def _candidates(self, normalized: str) -> set:
+        """질의의 모든 n-gram을 포함하는 포스팅 (작은 포스팅부터 교집합)"""
+        grams = _ngrams(normalized, 3) if len(normalized) >= 3 else {normalized}
+        posting_sets = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+        result = set(posting_sets[0])
+        for postings in posting_sets[1:]:
+            result &= postings
+            if not result:
+                break
+        return result
+
+    def search(self, query: str, kinds: Optional[List[str]] = None, fields: Optional[List[str]] = None,
+               start: Optional[str] = None, end: Optional[str] = None, limit: int = 20) -> List[dict]:
+        normalized = _normalize_search(query)
+        if not normalized:
+            return []
+        field_codes = {SEARCH_FIELD_CODES[field] for field in fields} if fields else None
+        code_fields = {code: field for field, code in SEARCH_FIELD_CODES.items()}
+
+        with self._lock:
+            scored = []
+            for posting in self._candidates(normalized):
+                doc, code = divmod(posting, self.FIELD_SLOTS)
+                if field_codes is not None and code not in field_codes:
+                    continue
+                kind, record_id, day = self._docs[doc]
+                if kinds and kind not in kinds:
+                    continue
+                # 날짜 범위는 날짜가 있는 레코드에만 적용 (연락처 등 날짜 없는 레코드는 그대로 포함)
+                if day is not None and ((start and day < start) or (end and day > end)):
+                    continue
+
+                text = self._texts[posting]
+                target = _normalize_search(text)
+                field = code_fields[code]
+                # 정확한 부분 문자열 일치 > 접두 일치 > n-gram만 일치, 짧은 필드일수록 가중
+                score = SEARCH_FIELD_WEIGHTS.get(field, 1.0)
+                position = target.find(normalized)
+                if position == 0:
+                    score += 2.0
+                elif position > 0:
+                    score += 1.0
+                score += len(normalized) / max(len(target), 1)
+                scored.append((score, kind, record_id, field, text, day))
+
+        top = heapq.nlargest(limit, scored, key=lambda item: item[0])
+        return [
+            {'kind': kind, 'id': record_id, 'field': field, 'text': text, 'date': day, 'score': round(score, 4)}
+            for score, kind, record_id, field, text, day in top
+        ]
+
+    def snapshot(self) -> dict:
+        return {'documents': len(self._docs), 'grams': len(self._postings)}
+
+
+search_index = NgramSearchIndex()
+if record_store is not None:
+    search_index.rebuild(record_store)
+    record_store.add_listener(search_index.on_change, rebuild=search_index.rebuild)
+
+
+async def sync_record_indexes():
+    """워커가 여러 개일 때 다른 워커가 바꾼 레코드를 이 워커의 메모리 인덱스에 주기적으로 반영"""
+    while True:
+        await asyncio.sleep(STORE_SYNC_INTERVAL)
+        try:
+            if await run_in_threadpool(record_store.refresh_if_changed):
+                print("[저장소] 다른 워커 변경 반영 - 인덱스 재구성")
+        except Exception as e:
+            print(f"[저장소] 인덱스 재구성 실패: {e}")
+
 
 def convert_to_kst_date(date_str: str) -> str:
     """
@@ -78,7 +2046,7 @@ def convert_to_kst_date(date_str: str) -> str:
 
 def get_current_kst_datetime() -> dict:
     """현재 한국 시간 정보 반환"""
-    now_kst = datetime.now(KST)
+    now_kst = current_kst()
     return {
         'date': now_kst.strftime('%Y-%m-%d'),
         'time': now_kst.strftime('%H:%M'),
@@ -92,7 +2060,7 @@ def parse_relative_date(text: str) -> Optional[str]:
     상대적 날짜 표현을 파싱하여 YYYY-MM-DD 형식으로 반환
     예: 다음주 금요일, 다음달 15일, 어제, 모레, 3일 전, 2주 후 등
     """
-    now_kst = datetime.now(KST)
+    now_kst = current_kst()
 
     # 어제, 오늘, 내일, 모레, 그저께
     if '그저께' in text or '그제' in text:
@@ -306,20 +2274,23 @@ def parse_relative_date(text: str) -> Optional[str]:
         month = int(date_match.group(1))
         day = int(date_match.group(2))
         year = now_kst.year
-
-        if '작년' in text or '지난해' in text:
-            year = now_kst.year - 1
-        elif '내년' in text or '다음해' in text:
-            year = now_kst.year + 1
-        elif '올해' in text or '이번해' in text:
-            year = now_kst.year
-        else:
-            # 연도 지정 없으면 이미 지난 날짜는 내년으로
-            target_date = datetime(year, month, day, tzinfo=KST)
-            if target_date < now_kst:
+        # 없는 날짜(13월, 2월 30일, 평년의 2월 29일 등)는 날짜로 보지 않음
+        try:
+            if '작년' in text or '지난해' in text:
+                year = now_kst.year - 1
+            elif '내년' in text or '다음해' in text:
                 year = now_kst.year + 1
+            elif '올해' in text or '이번해' in text:
+                year = now_kst.year
+            else:
+                # 연도 지정 없으면 이미 지난 날짜는 내년으로
+                target_date = datetime(year, month, day, tzinfo=KST)
+                if target_date < now_kst:
+                    year = now_kst.year + 1
 
-        target_date = datetime(year, month, day, tzinfo=KST)
+            target_date = datetime(year, month, day, tzinfo=KST)
+        except ValueError:
+            return None
         return target_date.strftime('%Y-%m-%d')
 
     # 작년/내년/올해 (일자 없이)
@@ -380,26 +2351,93 @@ def extract_item_name(text: str) -> Optional[str]:
     return None
 
 
-def can_handle_locally(text: str) -> tuple[bool, str]:
+def parse_recurrence(text: str) -> Optional[RecurrenceRule]:
     """
-    로컬 모델이 처리할 수 있는지 판단
-    Returns: (can_handle: bool, reason: str)
+    반복 일정 표현을 규칙으로 파싱
+    예: 매일, 매주 월요일, 격주 화요일, 평일마다, 3일마다, 매월 15일, 매년 3월 1일
     """
-    text_lower = text.lower()
+    weekdays = [i for i, day in enumerate(['월요일', '화요일', '수요일', '목요일', '금요일', '토요일', '일요일'])
+                if day in text]
+    if '평일' in text:
+        weekdays = [0, 1, 2, 3, 4]
+    elif '주말' in text:
+        weekdays = [5, 6]
+
+    # 매월/매달 N일 (없는 날짜면 반복 일정으로 보지 않음)
+    monthly_match = re.search(r'(매월|매달)\s*(\d{1,2})일', text)
+    if monthly_match:
+        month_day = int(monthly_match.group(2))
+        return RecurrenceRule(freq='monthly', monthDay=month_day) if 1 <= month_day <= 31 else None
+    if '매월' in text or '매달' in text:
+        return RecurrenceRule(freq='monthly')
+
+    # 매년 M월 D일
+    yearly_match = re.search(r'매년\s*(\d{1,2})월\s*(\d{1,2})일', text)
+    if yearly_match:
+        month, month_day = int(yearly_match.group(1)), int(yearly_match.group(2))
+        if not (1 <= month <= 12 and 1 <= month_day <= calendar.monthrange(2000, month)[1]):
+            return None
+        return RecurrenceRule(freq='yearly', month=month, monthDay=month_day)
+    if '매년' in text:
+        return RecurrenceRule(freq='yearly')
+
+    # N일마다 / N주마다
+    every_days = re.search(r'(\d+)일\s*마다', text)
+    if every_days and int(every_days.group(1)) > 0:
+        return RecurrenceRule(freq='daily', interval=int(every_days.group(1)))
+    every_weeks = re.search(r'(\d+)주\s*마다', text)
+    if every_weeks and int(every_weeks.group(1)) > 0:
+        return RecurrenceRule(freq='weekly', interval=int(every_weeks.group(1)), weekdays=weekdays or None)
+
+    if '매일' in text or '날마다' in text:
+        return RecurrenceRule(freq='daily')
+    if '격주' in text:
+        return RecurrenceRule(freq='weekly', interval=2, weekdays=weekdays or None)
+    if '매주' in text or (weekdays and '마다' in text):
+        return RecurrenceRule(freq='weekly', weekdays=weekdays or None)
+
+    return None
+
 
-    # OCR이 필요한 경우
-    if '영수증' in text or '사진' in text or '이미지' in text:
-        return False, "OCR 처리 필요 - Gemini로 전달"
+# 이미지가 있어야 처리 가능한 요청 (이미지는 서버로 오지 않으므로 클라이언트가 직접 Gemini 호출)
+OCR_KEYWORDS = ['영수증', '사진', '이미지']
+
+
+def needs_image(text: str) -> bool:
+    return any(keyword in text for keyword in OCR_KEYWORDS)
+
+
+def hard_routing_rule(text: str) -> Optional[str]:
+    """
+    로컬 모델이 구조적으로 처리할 수 없는 요청이면 이유 반환 (학습된 라우터도 뒤집지 않음)
+    - OCR: 이미지가 서버로 오지 않음
+    - 수정/삭제: 로컬 모델은 dataModification/dataDeletion 미지원
+    """
+    if needs_image(text):
+        return "OCR 처리 필요 - Gemini로 전달"
 
-    # 수정/삭제 의도 감지 - 로컬 모델은 dataModification/dataDeletion 미지원
     modification_keywords = ['수정', '변경', '바꿔', '고쳐']
     deletion_keywords = ['삭제', '지워', '제거']
 
     if any(keyword in text for keyword in modification_keywords):
-        return False, "데이터 수정 요청 - Gemini로 전달"
+        return "데이터 수정 요청 - Gemini로 전달"
 
     if any(keyword in text for keyword in deletion_keywords):
-        return False, "데이터 삭제 요청 - Gemini로 전달"
+        return "데이터 삭제 요청 - Gemini로 전달"
+    return None
+
+
+def can_handle_locally(text: str) -> tuple[bool, str]:
+    """
+    로컬 모델이 처리할 수 있는지 판단
+    Returns: (can_handle: bool, reason: str)
+    """
+    text_lower = text.lower()
+
+    # OCR, 수정/삭제 요청
+    hard_reason = hard_routing_rule(text)
+    if hard_reason is not None:
+        return False, hard_reason
 
     # 웹 검색이 필요한 경우
     web_search_keywords = ['날씨', '뉴스', '검색', '찾아줘', '알려줘 (일반 정보)', 'gta6', '발매일']
@@ -432,14 +2470,514 @@ def can_handle_locally(text: str) -> tuple[bool, str]:
     return False, "키워드 미발견 - Gemini로 전달"
 
 
-def process_with_local_model(text: str, context_data: Dict[str, List[Any]]) -> Dict[str, Any]:
+# 학습된 라우팅 분류기 설정 (router.py로 학습, 가중치 파일이 없으면 휴리스틱만 사용)
+ROUTER_WEIGHTS_PATH = os.environ.get("ROUTER_WEIGHTS_PATH", "./router_weights.json")
+ROUTER_MODE = os.environ.get("ROUTER_MODE", "shadow")  # off | shadow: 휴리스틱으로 라우팅, 불일치만 기록 | active: 분류기로 라우팅
+ROUTER_THRESHOLD = float(os.environ.get("ROUTER_THRESHOLD", "0.5"))
+ROUTING_LOG_PATH = os.environ.get("ROUTING_LOG_PATH", "")  # 라우팅 결과 로그 (router.py 학습 데이터)
+ROUTING_LOG_SALT = os.environ.get("ROUTING_LOG_SALT", "")  # 로그 가명 처리용 솔트
+
+
+class LearnedRouter:
     """
-    로컬 LoRA 모델로 텍스트 처리
+    can_handle_locally 휴리스틱과 학습된 분류기(로컬 파싱 성공 확률)를 함께 실행
+    shadow 모드에서는 휴리스틱 결과를 그대로 쓰고 두 판단이 다를 때만 기록
     """
-    current_time = get_current_kst_datetime()
 
-    # 프롬프트 구성
-    prompt = f"""현재 시간: {current_time['datetime']} ({current_time['weekday']})
+    def __init__(self, model: Optional[RouterModel], mode: str, threshold: float):
+        self.model = model
+        self.mode = mode if model is not None else 'off'
+        self.threshold = threshold
+        self.counters = {'decisions': 0, 'disagreements': 0, 'router_local': 0, 'heuristic_local': 0}
+        self._predict_seconds = 0.0
+
+    @classmethod
+    def from_path(cls, path: str, mode: str, threshold: float) -> 'LearnedRouter':
+        model = None
+        if mode != 'off' and os.path.exists(path):
+            model = RouterModel.load(path)
+            print(f"[라우터] {path} 로드 (모드: {mode}, 임계값: {threshold}, 가중치 {len(model.weights)}개)")
+        return cls(model, mode, threshold)
+
+    def route(self, text: str) -> tuple:
+        """Returns: (can_handle, reason, 휴리스틱 판단, 분류기 확률 또는 None)"""
+        heuristic, reason = can_handle_locally(text)
+        # OCR/수정/삭제는 분류기가 로컬이라고 해도 로컬에서 처리할 수 없음
+        if self.model is None or hard_routing_rule(text) is not None:
+            return heuristic, reason, heuristic, None
+
+        started = time.perf_counter()
+        prob = self.model.predict_proba(text)
+        self._predict_seconds += time.perf_counter() - started
+        predicted = prob >= self.threshold
+
+        self.counters['decisions'] += 1
+        self.counters['router_local'] += predicted
+        self.counters['heuristic_local'] += heuristic
+        if predicted != heuristic:
+            self.counters['disagreements'] += 1
+            print(f"[라우터 불일치] 휴리스틱={heuristic}, 분류기={predicted} (p={prob:.2f}): {text[:50]}")
+
+        if self.mode == 'active':
+            if predicted:
+                return True, f"라우터 판단: 로컬 처리 (p={prob:.2f})", heuristic, prob
+            return False, f"라우터 판단: Gemini로 전달 (p={prob:.2f})", heuristic, prob
+        return heuristic, reason, heuristic, prob
+
+    def snapshot(self) -> dict:
+        decisions = self.counters['decisions']
+        return {
+            'mode': self.mode,
+            'threshold': self.threshold,
+            'model': self.model.meta if self.model is not None else None,
+            'avg_predict_us': round(self._predict_seconds / decisions * 1e6, 1) if decisions else None,
+            **self.counters,
+        }
+
+
+_anonymize_phone = re.compile(r'(?<!\d)(01[016789])([-\s]?)(\d{3,4})([-\s]?)(\d{4})(?!\d)')
+_anonymize_email = re.compile(r'[\w.+-]+@[\w-]+(\.[\w-]+)+')
+_anonymize_long_number = re.compile(r'\d{9,}')
+_anonymize_name = re.compile(r'[가-힣]{2,4}')
+# 사람에게만 붙는 호칭/조사 앞 한글 2-4자 (김민수씨, 민수님, 영희한테, 철수에게)
+_anonymize_addressed_name = re.compile(
+    r'(?<![가-힣])([가-힣]{2,4}?)(?=씨|님|한테|에게|께서)(?:씨|님)?(?:한테|에게|께서)?(?![가-힣])'
+)
+# 호칭/조사가 붙어도 이름이 아닌 관계/직함 단어
+ANONYMIZE_RELATION_WORDS = {
+    '엄마', '아빠', '어머니', '아버지', '부모', '가족', '친구', '동생', '언니', '오빠', '누나', '선배', '후배',
+    '동료', '팀장', '부장', '과장', '대리', '사장', '이사', '선생', '교수', '고객', '기사', '사람', '아이',
+}
+
+# 파서/라우터가 의미로 쓰는 단어 (이름으로 보지 않고, 이름 가명이 이런 단어를 새로 만들지 않도록 확인)
+# 파서 쪽 키워드 목록(TEMPLATE_LITERAL_WORDS 등)은 처음 사용할 때 함께 모음
+ANONYMIZE_KEEP_WORDS = [
+    '저장', '추가', '등록', '수정', '변경', '바꿔', '고쳐', '삭제', '지워', '제거',
+    '오늘', '내일', '어제', '모레', '오전', '오후', '가계부', '지출', '경비', '스케줄',
+    '날씨', '뉴스', '검색', '찾아줘', '먹었어', '샀어', '구매', '만났어',
+    '월요일', '화요일', '수요일', '목요일', '금요일', '토요일', '일요일',
+]
+
+
+class TextAnonymizer:
+    """
+    디스크에 남기는 사용자 입력의 개인정보를 형태를 유지한 가명으로 치환
+    - 전화번호(앞자리와 자릿수 유지)/이메일/긴 숫자, 같은 솔트면 같은 값은 같은 가명
+    - 이름: 전화번호 앞 이름, 알려진 연락처 이름(요청 contextData), 호칭/조사가 붙은 한글 이름(민수씨, 영희한테)
+      그 밖의 문맥에서 쓰인, 연락처에 없는 이름은 찾지 못하므로 원문 그대로 남을 수 있음
+    - 원문에서 치환할 구간을 먼저 모두 찾고 한 번에 바꿔서, 이미 바꾼 값이 다른 규칙에 다시 걸리지 않음
+    - 파서 키워드는 이름으로 보지 않으므로 같은 입력의 파싱 경로(카테고리/필드 구성)가 그대로 유지됨
+    """
+
+    NAME_LOOKBACK_WORDS = 3  # 전화번호 앞 몇 단어까지 이름을 찾을지
+    NAME_ATTEMPTS = 16
+
+    def __init__(self, salt: str):
+        self.salt = salt.encode()
+        self._keep_words = None
+
+    @property
+    def keep_words(self) -> tuple:
+        if self._keep_words is None:
+            words = set(ANONYMIZE_KEEP_WORDS) | set(TEMPLATE_LITERAL_WORDS) | set(OCR_KEYWORDS)
+            words.update(keyword for keywords in CROSS_REF_CATEGORY_KEYWORDS.values() for keyword in keywords)
+            self._keep_words = tuple(sorted(words))
+        return self._keep_words
+
+    def _keywords_in(self, text: str) -> set:
+        return {word for word in self.keep_words if word in text}
+
+    def digest(self, value: str) -> bytes:
+        return hashlib.blake2b(value.encode(), key=self.salt[:64], digest_size=16).digest()
+
+    def _digits(self, value: str, length: int) -> str:
+        digest = self.digest(value)
+        return ''.join(str(digest[i % len(digest)] % 10) for i in range(length))
+
+    def _hangul(self, value: str, attempt: int = 0) -> str:
+        digest = self.digest(f"{attempt}:{value}" if attempt else value)
+        return ''.join(chr(0xAC00 + (digest[2 * i] << 8 | digest[2 * i + 1]) % 11172) for i in range(len(value)))
+
+    def _name_span(self, text: str, phone_start: int) -> Optional[tuple]:
+        """전화번호 바로 앞 단어들 중 파서 키워드가 아닌 첫 한글 2-4자 단어 (이름) 위치"""
+        words = list(re.finditer(r'\S+', text[:phone_start]))[-self.NAME_LOOKBACK_WORDS:]
+        for word in reversed(words):
+            if any(keyword in word.group() for keyword in self.keep_words) or _anonymize_email.fullmatch(word.group()):
+                continue
+            if _anonymize_name.fullmatch(word.group()):
+                return word.start(), word.end()
+            return None
+        return None
+
+    def _name(self, text: str, start: int, end: int) -> str:
+        """가명이 파서 키워드를 새로 만들거나 지우지 않을 때까지 다른 가명 시도"""
+        value = text[start:end]
+        keywords = self._keywords_in(text)
+        for attempt in range(self.NAME_ATTEMPTS):
+            candidate = self._hangul(value, attempt)
+            if self._keywords_in(text[:start] + candidate + text[end:]) == keywords:
+                return candidate
+        return candidate
+
+    def anonymize(self, text: str, names=()) -> str:
+        """names: 이름으로 알려진 문자열 (연락처 이름 등, 본문 어디에 나와도 가명 처리)"""
+        spans = []  # (시작, 끝, 치환 값) - 겹치는 구간은 먼저 잡힌 규칙만 적용
+
+        def add(start: int, end: int, replacement: str):
+            if all(end <= other_start or start >= other_end for other_start, other_end, _ in spans):
+                spans.append((start, end, replacement))
+
+        for match in _anonymize_email.finditer(text):
+            add(match.start(), match.end(), f"u{self.digest(match.group()).hex()[:8]}@example.com")
+        for match in _anonymize_phone.finditer(text):
+            prefix, first_separator, middle, second_separator, _ = match.groups()
+            add(match.start(), match.end(),
+                f"{prefix}{first_separator}{self._digits(match.group(), len(middle))}"
+                f"{second_separator}{self._digits(match.group()[::-1], 4)}")
+            name = self._name_span(text, match.start())
+            if name is not None:
+                add(*name, self._name(text, *name))
+        # 긴 이름부터 잡아 짧은 이름이 긴 이름의 일부만 바꾸지 않게 함
+        for name in sorted({name for name in names if name and len(name) >= 2}, key=len, reverse=True):
+            for match in re.finditer(re.escape(name), text):
+                add(match.start(), match.end(), self._name(text, match.start(), match.end()))
+        for match in _anonymize_addressed_name.finditer(text):
+            value = match.group(1)
+            if value in ANONYMIZE_RELATION_WORDS or any(keyword in value for keyword in self.keep_words):
+                continue
+            add(*match.span(1), self._name(text, *match.span(1)))
+        for match in _anonymize_long_number.finditer(text):
+            add(match.start(), match.end(), self._digits(match.group(), len(match.group())))
+
+        for start, end, replacement in sorted(spans, reverse=True):
+            text = text[:start] + replacement + text[end:]
+        return text
+
+
+class RoutingLog:
+    """
+    라우팅 판단과 실제 결과를 JSONL로 기록 (router.py train 입력)
+    입력 원문 대신 가명 처리한 문장을 남김 (분류기 특징은 숫자를 0으로 정규화하므로 학습에는 영향 적음)
+    """
+
+    def __init__(self, path: str, anonymizer: TextAnonymizer):
+        self.path = path
+        self.anonymizer = anonymizer
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8', buffering=1) if path else None
+
+    def record(self, text: str, heuristic: bool, router_prob: Optional[float], outcome: str, names=()):
+        if self._file is None:
+            return
+        line = json.dumps({
+            'ts': time.time(),
+            'text': self.anonymizer.anonymize(text, names),
+            'heuristic': heuristic,
+            'routerProb': None if router_prob is None else round(router_prob, 4),
+            'outcome': outcome,
+        }, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+
+
+learned_router = LearnedRouter.from_path(ROUTER_WEIGHTS_PATH, ROUTER_MODE, ROUTER_THRESHOLD)
+routing_log = RoutingLog(ROUTING_LOG_PATH, TextAnonymizer(ROUTING_LOG_SALT))
+
+
+# 운영 중 요청 프로파일링 (관리자 전용, ADMIN_TOKEN 미설정 시 비활성화)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+PROFILE_MAX_SESSIONS = 10
+
+
+class ProfileSession:
+    """다음 N개의 /api/process 호출에 대한 프로파일 결과 묶음"""
+
+    def __init__(self, count: int, mode: str, torch_ops: bool, interval_ms: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.torch_ops = torch_ops
+        self.interval = interval_ms / 1000
+        self.requested = count
+        self.started = 0
+        self.completed = 0
+        self.created_at = datetime.now(KST).isoformat()
+        self.profiles = []          # cProfile.Profile 목록
+        self.stacks = defaultdict(int)  # 접힌 스택(collapsed) → 샘플 수
+        self.torch_tables = []      # 연산자별 타이밍 표
+
+    def summary(self) -> dict:
+        return {
+            'id': self.id,
+            'mode': self.mode,
+            'torch': self.torch_ops,
+            'requested': self.requested,
+            'completed': self.completed,
+            'createdAt': self.created_at,
+        }
+
+
+class RequestProfiler:
+    """
+    관리자가 켜면 다음 N개 요청의 처리를 cProfile 또는 스택 샘플링으로 기록
+    꺼져 있을 때는 요청 경로에서 armed 속성 확인 한 번 외에는 비용 없음
+    """
+
+    def __init__(self):
+        self.armed = False
+        self._active = None
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def arm(self, count: int, mode: str, torch_ops: bool, interval_ms: float) -> ProfileSession:
+        session = ProfileSession(count, mode, torch_ops, interval_ms)
+        with self._lock:
+            self._active = session
+            self._sessions[session.id] = session
+            while len(self._sessions) > PROFILE_MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+            self.armed = True
+        return session
+
+    def disarm(self):
+        with self._lock:
+            self._active = None
+            self.armed = False
+
+    def _claim(self) -> Optional[ProfileSession]:
+        with self._lock:
+            session = self._active
+            if session is None:
+                return None
+            session.started += 1
+            if session.started >= session.requested:
+                self._active = None
+                self.armed = False
+            return session
+
+    def get(self, session_id: str) -> Optional[ProfileSession]:
+        return self._sessions.get(session_id)
+
+    def sessions(self) -> List[dict]:
+        return [session.summary() for session in self._sessions.values()]
+
+    def torch_session(self) -> Optional[ProfileSession]:
+        """현재 스레드에서 torch 연산자 프로파일을 요청한 세션"""
+        session = getattr(self._local, 'session', None)
+        return session if session is not None and session.torch_ops else None
+
+    def call(self, fn, *args):
+        """프로파일 대상이면 기록하며 fn 실행 (스레드풀 안에서 호출)"""
+        session = self._claim()
+        if session is None:
+            return fn(*args)
+
+        self._local.session = session
+        try:
+            if session.mode == 'stack':
+                return self._call_sampled(session, fn, *args)
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return fn(*args)
+            finally:
+                profile.disable()
+                with self._lock:
+                    session.profiles.append(profile)
+        finally:
+            self._local.session = None
+            with self._lock:
+                session.completed += 1
+
+    def _call_sampled(self, session: ProfileSession, fn, *args):
+        target = threading.get_ident()
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(session.interval):
+                frame = sys._current_frames().get(target)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    with self._lock:
+                        session.stacks[';'.join(reversed(stack))] += 1
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        try:
+            return fn(*args)
+        finally:
+            done.set()
+            sampler.join()
+
+    def record_torch(self, session: ProfileSession, profile):
+        table = profile.key_averages().table(sort_by="self_cpu_time_total", row_limit=50)
+        with self._lock:
+            session.torch_tables.append(table)
+
+    @staticmethod
+    def export_pstats(session: ProfileSession) -> bytes:
+        stats = pstats.Stats(session.profiles[0])
+        for profile in session.profiles[1:]:
+            stats.add(profile)
+        with tempfile.NamedTemporaryFile(suffix='.pstats') as f:
+            stats.dump_stats(f.name)
+            return f.read()
+
+    @staticmethod
+    def export_collapsed(session: ProfileSession) -> bytes:
+        # flamegraph.pl / speedscope가 읽는 접힌 스택 형식
+        return '\n'.join(f"{stack} {count}" for stack, count in session.stacks.items()).encode()
+
+
+request_profiler = RequestProfiler()
+
+
+# 디코딩 설정
+# LOCAL_DECODING=greedy 이거나 GENERATION_SEED가 지정되면 결과가 결정적이므로 캐시 가능
+# (시드 샘플링은 함께 배치된 입력과 보조 디코딩 여부에 따라 난수 소비가 달라지므로 배치 1 생성만 캐시하고 보조 디코딩은 끔)
+LOCAL_DECODING = os.environ.get("LOCAL_DECODING", "sample")
+GENERATION_SEED = os.environ.get("GENERATION_SEED")
+GENERATION_PARAMS = {
+    'max_new_tokens': 256,
+    'temperature': 0.7,
+    'do_sample': LOCAL_DECODING != 'greedy',
+    'top_p': 0.9,
+}
+
+# 영속 생성 캐시 설정 (빈 문자열이면 비활성화)
+GENERATION_CACHE_PATH = os.environ.get("GENERATION_CACHE_PATH", "./generation_cache.sqlite3")
+GENERATION_CACHE_MAX_ENTRIES = int(os.environ.get("GENERATION_CACHE_MAX_ENTRIES", "50000"))
+GENERATION_CACHE_MEMORY_ENTRIES = int(os.environ.get("GENERATION_CACHE_MEMORY_ENTRIES", "2000"))
+
+
+class GenerationCache:
+    """
+    모델 출력 영속 캐시 (SQLite WAL)
+    키: (입력 문장, 날짜, 어댑터 버전, 디코딩 파라미터)
+    프롬프트에는 분 단위 현재 시각이 들어가 그대로 키로 쓰면 거의 적중하지 않으므로,
+    상대 날짜 해석에 필요한 날짜까지만 키에 포함
+    WAL 모드라 여러 워커 프로세스가 같은 파일을 안전하게 공유하며,
+    부팅 시 최근 사용 항목을 메모리 LRU로 미리 읽어옴
+    """
+
+    # 최대 항목 수 초과 여부는 쓰기 N번마다 확인
+    EVICT_EVERY = 100
+
+    def __init__(self, path: str, max_entries: int, memory_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._writes = 0
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evicted': 0}
+
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_generations_last_used ON generations(last_used)")
+        self._conn.commit()
+        self._warm()
+
+    @staticmethod
+    def make_key(text: str, day: str, adapter: str, params: dict) -> str:
+        payload = json.dumps([text, day, adapter, params], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _warm(self):
+        rows = self._conn.execute(
+            "SELECT key, response FROM generations ORDER BY last_used DESC LIMIT ?",
+            (self.memory_entries,)
+        ).fetchall()
+        for key, response in reversed(rows):
+            self._memory[key] = response
+        print(f"[생성 캐시] {self.path}에서 {len(rows)}개 항목 로드")
+
+    def _remember(self, key: str, response: str):
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return self._memory[key]
+
+            row = self._conn.execute("SELECT response FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.counters['misses'] += 1
+                return None
+
+            self._conn.execute("UPDATE generations SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self._remember(key, row[0])
+            self.counters['disk_hits'] += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generations (key, response, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            self._conn.commit()
+            self._remember(key, response)
+            self.counters['stores'] += 1
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        # 가장 오래 사용되지 않은 항목부터 삭제
+        count = self._conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM generations WHERE key IN "
+                "(SELECT key FROM generations ORDER BY last_used ASC LIMIT ?)",
+                (excess,)
+            )
+            self._conn.commit()
+            self.counters['evicted'] += excess
+
+    def snapshot(self) -> dict:
+        return {
+            'path': self.path,
+            'memory_entries': len(self._memory),
+            **self.counters,
+        }
+
+
+generation_cache = (
+    GenerationCache(GENERATION_CACHE_PATH, GENERATION_CACHE_MAX_ENTRIES, GENERATION_CACHE_MEMORY_ENTRIES)
+    if GENERATION_CACHE_PATH else None
+)
+
+
+def is_deterministic_decoding() -> bool:
+    return not GENERATION_PARAMS['do_sample'] or GENERATION_SEED is not None
+
+
+def use_assisted_decoding() -> bool:
+    """보조 디코딩은 greedy일 때만 (샘플링에서는 출력이 일반 디코딩과 달라짐)"""
+    return draft_model is not None and not GENERATION_PARAMS['do_sample']
+
+
+def build_extraction_prompt(text: str, current_time: dict) -> str:
+    """로컬 모델 추출 프롬프트 구성"""
+    return f"""현재 시간: {current_time['datetime']} ({current_time['weekday']})
 사용자 입력: {text}
 
 다음 정보를 추출하여 JSON 형식으로 반환하세요:
@@ -450,32 +2988,204 @@ def process_with_local_model(text: str, context_data: Dict[str, List[Any]]) -> D
 
 응답:"""
 
-    # 토크나이저로 인코딩
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)
+
+# 긴 입력 처리 설정
+# 프롬프트가 PROMPT_MAX_TOKENS를 넘을 때만 문장 단위 구간으로 나눠
+# 한 번의 배치 generate로 처리 (예전처럼 512 토큰에서 잘려 입력 끝과 "응답:"이 사라지지 않도록)
+# 나눌 때도 이어지는 문장은 한도 안에서 한 구간에 모아 문장 간 문맥(앞 문장의 날짜 등)을 최대한 유지
+PROMPT_MAX_TOKENS = int(os.environ.get("PROMPT_MAX_TOKENS", "512"))
+LONG_INPUT_BATCH_TOKENS = int(os.environ.get("LONG_INPUT_BATCH_TOKENS", "8192"))  # 배치당 (프롬프트 + 생성) 토큰 합계 상한
+
+_sentence_boundary = re.compile(r'(?<=[.!?。…])\s+|\n+')
+
+
+def count_tokens(text: str) -> int:
+    return len(tokenizer.encode(text))
+
+
+def split_sentences(text: str, max_size: int, measure=len) -> List[str]:
+    """
+    문장(줄바꿈, 마침표/물음표/느낌표 뒤 공백) 단위로 나누고,
+    measure 기준 max_size를 넘는 문장은 어절 단위로, 그래도 넘는 어절은 글자 단위로 자름
+    """
+    segments = []
+    for sentence in _sentence_boundary.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if measure(sentence) <= max_size:
+            segments.append(sentence)
+            continue
+
+        chunk, size = [], 0
+        for word in sentence.split():
+            word_size = measure(' ' + word)
+            if size + word_size > max_size and chunk:
+                segments.append(' '.join(chunk))
+                chunk, size = [], 0
+            if word_size <= max_size:
+                chunk.append(word)
+                size += word_size
+                continue
+            # 한 어절이 한도를 넘으면 글자 수 비율로 잘라가며 한도 안에 들어올 때까지 줄임
+            while word:
+                step = max(1, len(word) * max_size // max(measure(word), 1))
+                while step > 1 and measure(word[:step]) > max_size:
+                    step = step * 3 // 4
+                segments.append(word[:step])
+                word = word[step:]
+        if chunk:
+            segments.append(' '.join(chunk))
+    return segments
+
+
+def split_long_input(text: str, current_time: dict) -> List[str]:
+    """프롬프트 한도 안에 들어오는 입력은 그대로, 아니면 문장 단위 구간 목록"""
+    text_budget = PROMPT_MAX_TOKENS - count_tokens(build_extraction_prompt('', current_time))
+    if count_tokens(text) <= text_budget:
+        return [text]
+    segments = []
+    for sentence in split_sentences(text, text_budget, count_tokens):
+        if segments and count_tokens(segments[-1] + ' ' + sentence) <= text_budget:
+            segments[-1] += ' ' + sentence
+        else:
+            segments.append(sentence)
+    return segments or [text]
+
+
+def plan_batches(lengths: List[int], max_new_tokens: int, budget: int) -> List[List[int]]:
+    """
+    프롬프트 길이 순으로 정렬해 패딩을 줄이고, 배치 크기 x (가장 긴 프롬프트 + 생성 토큰)이
+    budget을 넘지 않게 묶음 (예산보다 큰 프롬프트도 최소 한 개씩은 배치)
+    """
+    batches, current = [], []
+    for index in sorted(range(len(lengths)), key=lengths.__getitem__):
+        longest = lengths[index]  # 정렬했으므로 새로 넣는 프롬프트가 가장 김
+        if current and (len(current) + 1) * (longest + max_new_tokens) > budget:
+            batches.append(current)
+            current = []
+        current.append(index)
+    if current:
+        batches.append(current)
+    return batches
+
+
+# 시드 고정 생성은 프로세스 전역 난수 상태를 사용하므로 (generate는 요청별 Generator를 받지 않음)
+# 동시에 실행되면 서로의 난수열을 소비해 결과가 달라짐 → 시드가 지정된 경우 한 번에 하나씩 실행
+seeded_generation_lock = threading.Lock()
+
+
+def _generate_batch(prompts: List[str]) -> List[str]:
+    """프롬프트 목록을 한 번의 generate로 처리해 프롬프트 이후의 응답 텍스트 목록 반환"""
+    if len(prompts) == 1:
+        inputs = tokenizer(prompts[0], return_tensors="pt")
+        # 초안 모델이 여러 토큰을 제안하고 본 모델이 한 번의 forward로 검증
+        # (greedy에서만 사용하므로 출력이 일반 디코딩과 같아 생성 캐시 키에는 포함하지 않음, 배치 1만 지원)
+        assisted = {'assistant_model': draft_model} if use_assisted_decoding() else {}
+    else:
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+        assisted = {}
 
     # 모델 추론
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=256,
-            temperature=0.7,
-            do_sample=True,
-            top_p=0.9,
-            pad_token_id=tokenizer.eos_token_id
-        )
+    with torch.no_grad(), seeded_generation_lock if GENERATION_SEED is not None else nullcontext():
+        if GENERATION_SEED is not None:
+            torch.manual_seed(int(GENERATION_SEED))
+        profile_session = request_profiler.torch_session()
+        if profile_session is not None:
+            # 관리자가 요청한 경우에만 연산자 단위 타이밍 기록
+            with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU]) as torch_profile:
+                outputs = model.generate(**inputs, **GENERATION_PARAMS, **assisted, pad_token_id=tokenizer.eos_token_id)
+            request_profiler.record_torch(profile_session, torch_profile)
+        else:
+            outputs = model.generate(
+                **inputs,
+                **GENERATION_PARAMS,
+                **assisted,
+                pad_token_id=tokenizer.eos_token_id
+            )
 
-    # 디코딩
-    generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    # 프롬프트(왼쪽 패딩 포함) 이후에 생성된 토큰만 디코딩
+    prompt_length = inputs['input_ids'].shape[1]
+    return [tokenizer.decode(output[prompt_length:], skip_special_tokens=True).strip() for output in outputs]
+
+
+def generate_responses(texts: List[str], current_time: dict) -> List[str]:
+    """
+    입력(구간)별 모델 응답 텍스트 반환
+    결정적 디코딩이면 영속 캐시를 먼저 확인하고, 적중하지 않은 입력만 토큰 예산 안에서 배치 생성
+    """
+    prompts = [build_extraction_prompt(text, current_time) for text in texts]
+    responses = [None] * len(prompts)
+    cache_keys = [None] * len(prompts)
+    pending = []
+    for index, text in enumerate(texts):
+        if generation_cache is not None and is_deterministic_decoding():
+            params = {**GENERATION_PARAMS, 'seed': GENERATION_SEED}
+            cache_keys[index] = GenerationCache.make_key(text, current_time['date'], adapter_version, params)
+            cached = generation_cache.get(cache_keys[index])
+            if cached is not None:
+                responses[index] = cached
+                continue
+        pending.append(index)
+
+    if len(pending) < len(prompts):
+        print(f"[생성 캐시] 적중 {len(prompts) - len(pending)}/{len(prompts)} - 모델 추론 생략")
+
+    lengths = [count_tokens(prompts[index]) for index in pending] if len(pending) > 1 else [0] * len(pending)
+    for batch in plan_batches(lengths, GENERATION_PARAMS['max_new_tokens'], LONG_INPUT_BATCH_TOKENS):
+        indexes = [pending[position] for position in batch]
+        # 시드 샘플링 결과는 함께 배치된 입력에 따라 달라지므로 혼자 생성한 경우만 캐시
+        cacheable = not GENERATION_PARAMS['do_sample'] or len(indexes) == 1
+        for index, response_text in zip(indexes, _generate_batch([prompts[index] for index in indexes])):
+            responses[index] = response_text
+            if cache_keys[index] is not None and cacheable:
+                generation_cache.put(cache_keys[index], response_text)
+
+    return responses
+
+
+def detect_ambiguous_hour(parsed_data: Dict[str, Any]) -> Optional[int]:
+    """오전/오후가 불분명한 일정 시간(1-12시)이 있으면 그 시를 반환"""
+    for schedule in parsed_data.get('schedule') or []:
+        if 'time' in schedule:
+            time_parts = schedule['time'].split(':')
+            if time_parts:
+                hour = int(time_parts[0])
+                if 1 <= hour <= 12:
+                    return hour
+    return None
 
-    # 프롬프트 이후의 응답만 추출
-    response_text = generated_text[len(prompt):].strip()
 
+def merge_extractions(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """구간별 추출 결과 합치기 (목록은 이어 붙이고, 확인 질문 등 단일 값은 처음 나온 것 사용)"""
+    if len(results) == 1:
+        return results[0]
+    merged = {'contacts': [], 'schedule': [], 'expenses': [], 'diary': []}
+    clarification = None
+    for result in results:
+        for key, value in result.items():
+            if isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            elif not key.startswith('clarification_'):
+                merged.setdefault(key, value)
+        if clarification is None and result.get('clarification_needed'):
+            clarification = result
+    if clarification is not None:
+        for key in ('clarification_needed', 'clarification_question', 'clarification_options'):
+            merged[key] = clarification.get(key)
+    return merged
+
+
+def parse_local_response(response_text: str, text: str, current_time: dict,
+                         context_data: ContextData) -> Dict[str, Any]:
+    """모델 응답 한 건을 파싱 (JSON이 아니면 규칙 기반 파싱)하고 날짜를 KST로 정리"""
     # JSON 파싱 시도
     try:
-        # JSON 부분 추출 (중괄호 사이)
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group()
+        # JSON 부분 추출 (첫 여는 중괄호부터 마지막 닫는 중괄호까지, 선형 시간)
+        json_start = response_text.find('{')
+        json_end = response_text.rfind('}')
+        if json_start != -1 and json_end > json_start:
+            json_str = response_text[json_start:json_end + 1]
             parsed_data = json.loads(json_str)
         else:
             # JSON이 없으면 바로 fallback으로
@@ -506,6 +3216,28 @@ def process_with_local_model(text: str, context_data: Dict[str, List[Any]]) -> D
             if 'date' in diary:
                 diary['date'] = convert_to_kst_date(diary['date'])
 
+    return parsed_data
+
+
+def process_with_local_model(text: str, context_data: ContextData) -> Dict[str, Any]:
+    """
+    로컬 LoRA 모델로 텍스트 처리
+    긴 입력은 문장 단위 구간으로 나눠 배치 생성한 뒤 구간별 추출 결과를 합침
+    """
+    current_time = get_current_kst_datetime()
+
+    segments = split_long_input(text, current_time)
+    if len(segments) > 1:
+        print(f"[긴 입력] {len(text)}자 → {len(segments)}개 구간으로 나눠 처리")
+
+    responses = generate_responses(segments, current_time)
+    response_text = "\n".join(responses)
+
+    parsed_data = merge_extractions([
+        parse_local_response(response, segment, current_time, context_data)
+        for response, segment in zip(responses, segments)
+    ])
+
     # fallback에서 온 clarification 정보 확인
     clarification_needed = parsed_data.get('clarification_needed', False)
     clarification_question = parsed_data.get('clarification_question', None)
@@ -524,19 +3256,13 @@ def process_with_local_model(text: str, context_data: Dict[str, List[Any]]) -> D
         del parsed_data['ambiguous_categories']
 
     # 애매한 시간 감지 (1-12시) - clarification이 아직 없는 경우만
-    if not clarification_needed and 'schedule' in parsed_data and parsed_data['schedule']:
-        for schedule in parsed_data['schedule']:
-            if 'time' in schedule:
-                time_parts = schedule['time'].split(':')
-                if time_parts:
-                    hour = int(time_parts[0])
-                    if 1 <= hour <= 12:
-                        # 애매한 시간 발견
-                        clarification_needed = True
-                        ambiguous_time = hour
-                        clarification_question = f"{hour}시가 오전인가요, 오후인가요?"
-                        clarification_options = ["오전", "오후"]
-                        break
+    if not clarification_needed:
+        hour = detect_ambiguous_hour(parsed_data)
+        if hour is not None:
+            clarification_needed = True
+            ambiguous_time = hour
+            clarification_question = f"{hour}시가 오전인가요, 오후인가요?"
+            clarification_options = ["오전", "오후"]
 
     return {
         'raw_response': response_text,
@@ -549,12 +3275,62 @@ def process_with_local_model(text: str, context_data: Dict[str, List[Any]]) -> D
     }
 
 
-def fallback_text_parsing(text: str, current_time: dict, context_data: Dict[str, List[Any]] = None) -> Dict[str, Any]:
+# 폴백 파싱 키워드 (템플릿 캐시도 이 단어들은 슬롯으로 바꾸지 않음)
+CONTACT_KEYWORDS = ['연락처', '주소록', '전화번호', '번호']
+SCHEDULE_KEYWORDS = ['일정', '예약', '약속', '미팅', '회의', '있어', '있다']
+MEMO_KEYWORDS = ['메모', '메모장', '다이어리', '일기', '기록']
+INCOME_KEYWORDS = ['받았어', '수입', '월급', '급여']
+EXPENSE_CATEGORY_KEYWORDS = {  # 먼저 일치하는 카테고리 사용
+    '식비': ['먹었어', '식사', '음식', '밥', '국수', '저녁', '점심', '아침', '식비'],
+    '교통': ['교통비', '버스', '지하철', '택시', '기름', '주유', '교통'],
+    '쇼핑': ['쇼핑', '옷', '구매', '샀어'],
+    '급여': ['월급', '급여', '수입', '용돈'],
+}
+
+
+# 규칙 기반 파싱 길이 제한 (역추적이 많은 정규식이 긴 입력에서 CPU를 오래 점유하지 않도록)
+RULE_PARSER_MAX_CHARS = int(os.environ.get("RULE_PARSER_MAX_CHARS", "400"))  # 넘으면 문장 단위로 나눠 파싱
+RULE_CONTENT_MAX_CHARS = 100  # "[카테고리]의 [내용]을 [카테고리]에 저장"에서 기존 기록을 가리키는 내용 부분 최대 길이
+
+# 교차 참조(기존 기록을 다른 카테고리에 저장) 카테고리 키워드
+CROSS_REF_CATEGORY_KEYWORDS = {
+    '메모': ['메모장', '메모', '다이어리', '일기', '기록'],
+    '일정': ['일정', '스케줄', '약속', '예약'],
+    '가계부': ['가계부', '지출', '수입', '경비'],
+    '주소록': ['주소록', '연락처', '전화번호']
+}
+_cross_ref_categories = '|'.join(keyword for keywords in CROSS_REF_CATEGORY_KEYWORDS.values() for keyword in keywords)
+
+# 더 유연한 패턴 매칭
+CROSS_REF_PATTERNS = [re.compile(pattern) for pattern in (
+    # 패턴 1: [카테고리]의 [내용]을/를 [카테고리]에 저장
+    rf'\[?({_cross_ref_categories})\]?의\s*\[?(.{{1,{RULE_CONTENT_MAX_CHARS}}}?)\]?(를|을)\s*\[?({_cross_ref_categories})\]?에?\s*(저장|추가|등록)',
+    # 패턴 2: [카테고리] [내용]을/를 [카테고리]에 저장
+    rf'\[?({_cross_ref_categories})\]?\s+(.{{1,{RULE_CONTENT_MAX_CHARS}}}?)(를|을)\s*\[?({_cross_ref_categories})\]?에?\s*(저장|추가|등록)',
+    # 패턴 3: [내용]을/를 [카테고리]에 저장 (원래 패턴)
+    rf'(.{{1,{RULE_CONTENT_MAX_CHARS}}}?)(를|을)\s*\[?({_cross_ref_categories})\]?에?\s*(저장|추가|등록)',
+    # 패턴 4: [카테고리]에 [내용] [카테고리]에 저장 ("를/을" 없이)
+    rf'\[?({_cross_ref_categories})\]?에\s+(.{{1,{RULE_CONTENT_MAX_CHARS}}}?)\s+\[?({_cross_ref_categories})\]?에\s*(저장|추가|등록)',
+)]
+
+
+def is_cross_reference(text: str) -> bool:
+    """기존 기록(contextData/저장소)을 찾아 결과를 만드는 입력인지 - 결과가 사용자 데이터에 좌우됨"""
+    return any(pattern.search(text) for pattern in CROSS_REF_PATTERNS)
+
+
+def fallback_text_parsing(text: str, current_time: dict, context_data: Optional[ContextData] = None) -> Dict[str, Any]:
     """
     모델 응답이 JSON이 아닐 때 텍스트 파싱으로 폴백
     """
+    if len(text) > RULE_PARSER_MAX_CHARS:
+        return merge_extractions([
+            fallback_text_parsing(segment, current_time, context_data)
+            for segment in split_sentences(text, RULE_PARSER_MAX_CHARS)
+        ])
+
     if context_data is None:
-        context_data = {'contacts': [], 'schedule': [], 'expenses': [], 'diary': []}
+        context_data = ContextData()
 
     result = {
         'contacts': [],
@@ -572,30 +3348,8 @@ def fallback_text_parsing(text: str, current_time: dict, context_data: Dict[str,
     # 패턴 2: "[소스카테고리] [내용]을/를 [목적카테고리]에 저장"
     # 패턴 3: "[내용]을/를 [목적카테고리]에 저장" (소스 카테고리 자동 감지)
 
-    category_keywords = {
-        '메모': ['메모장', '메모', '다이어리', '일기', '기록'],
-        '일정': ['일정', '스케줄', '약속', '예약'],
-        '가계부': ['가계부', '지출', '수입', '경비'],
-        '주소록': ['주소록', '연락처', '전화번호']
-    }
-
-    # 모든 카테고리 키워드를 하나의 패턴으로 결합
-    all_categories = []
-    for keywords in category_keywords.values():
-        all_categories.extend(keywords)
-    category_pattern = '|'.join(all_categories)
-
-    # 더 유연한 패턴 매칭
-    patterns = [
-        # 패턴 1: [카테고리]의 [내용]을/를 [카테고리]에 저장
-        rf'\[?({category_pattern})\]?의\s*\[?(.+?)\]?(를|을)\s*\[?({category_pattern})\]?에?\s*(저장|추가|등록)',
-        # 패턴 2: [카테고리] [내용]을/를 [카테고리]에 저장
-        rf'\[?({category_pattern})\]?\s+(.+?)(를|을)\s*\[?({category_pattern})\]?에?\s*(저장|추가|등록)',
-        # 패턴 3: [내용]을/를 [카테고리]에 저장 (원래 패턴)
-        rf'(.+?)(를|을)\s*\[?({category_pattern})\]?에?\s*(저장|추가|등록)',
-        # 패턴 4: [카테고리]에 [내용] [카테고리]에 저장 ("를/을" 없이)
-        rf'\[?({category_pattern})\]?에\s+(.+?)\s+\[?({category_pattern})\]?에\s*(저장|추가|등록)'
-    ]
+    category_keywords = CROSS_REF_CATEGORY_KEYWORDS
+    patterns = CROSS_REF_PATTERNS
 
     matched = False
     for i, pattern in enumerate(patterns):
@@ -650,14 +3404,22 @@ def fallback_text_parsing(text: str, current_time: dict, context_data: Dict[str,
                     break
 
                 # 가계부 검색
-                if search_cat == '가계부' and context_data.get('expenses'):
+                if search_cat == '가계부' and (context_data.expenses or record_store):
                     # 금액 패턴 매칭
                     amount_match = re.search(r'(\d+)원', source_text)
                     item_name_in_source = re.sub(r'\d+원', '', source_text).strip()
 
-                    for expense in context_data['expenses']:
-                        item_name = expense.get('item', '')
-                        amount = expense.get('amount', 0)
+                    # 요청 contextData를 먼저 보고, 서버 저장소에서 인덱스로 찾은 레코드를 뒤에 추가
+                    candidates = list(context_data.expenses)
+                    if record_store is not None:
+                        stored = record_store.find_expense(
+                            item_name_in_source, int(amount_match.group(1)) if amount_match else None
+                        )
+                        candidates += [stored] if stored else []
+
+                    for expense in candidates:
+                        item_name = expense.item
+                        amount = expense.amount
 
                         # 유연한 매칭: 부분 문자열 또는 금액이 일치하면 OK
                         name_match = (item_name_in_source and item_name and
@@ -667,49 +3429,64 @@ def fallback_text_parsing(text: str, current_time: dict, context_data: Dict[str,
 
                         if (name_match and amount_value_match) or (name_match and not amount_match) or (amount_value_match and not item_name_in_source):
                             found_item = f"{item_name} {amount}원"
-                            found_data = expense.copy()
+                            found_data = asdict(expense)
                             print(f"[멀티모달 발견] 가계부에서 찾음: {found_item}")
                             break
 
                 # 주소록 검색
-                elif search_cat == '주소록' and context_data.get('contacts'):
-                    for contact in context_data['contacts']:
-                        name = contact.get('name', '')
-                        phone = contact.get('phone', '')
-                        email = contact.get('email', '')
+                elif search_cat == '주소록' and (context_data.contacts or record_store):
+                    candidates = list(context_data.contacts)
+                    if record_store is not None:
+                        stored = record_store.find_contact(source_text)
+                        candidates += [stored] if stored else []
+
+                    for contact in candidates:
+                        name = contact.name
+                        phone = contact.phone or ''
+                        email = contact.email or ''
 
                         # 이름, 전화번호, 이메일 중 하나라도 매칭되면 OK
                         if (name and name in source_text) or \
                            (phone and phone in source_text) or \
                            (email and email in source_text):
                             found_item = f"{name} {phone or email}".strip()
-                            found_data = contact.copy()
+                            found_data = asdict(contact)
                             print(f"[멀티모달 발견] 주소록에서 찾음: {found_item}")
                             break
 
                 # 일정 검색
-                elif search_cat == '일정' and context_data.get('schedule'):
-                    for schedule in context_data['schedule']:
-                        title = schedule.get('title', '')
-                        date = schedule.get('date', '')
-                        time = schedule.get('time', '')
+                elif search_cat == '일정' and (context_data.schedule or record_store):
+                    candidates = list(context_data.schedule)
+                    if record_store is not None:
+                        stored = record_store.find_schedule(source_text)
+                        candidates += [stored] if stored else []
+
+                    for schedule in candidates:
+                        title = schedule.title
+                        date = schedule.date
+                        time = schedule.time or ''
 
                         # 제목이나 날짜가 매칭되면 OK
                         if (title and title in source_text) or (source_text in title):
                             found_item = f"{title} {date} {time}".strip()
-                            found_data = schedule.copy()
+                            found_data = asdict(schedule)
                             print(f"[멀티모달 발견] 일정에서 찾음: {found_item}")
                             break
 
                 # 메모 검색
-                elif search_cat == '메모' and context_data.get('diary'):
-                    for diary in context_data['diary']:
-                        entry = diary.get('entry', '')
+                elif search_cat == '메모' and (context_data.diary or record_store):
+                    candidates = list(context_data.diary)
+                    if record_store is not None:
+                        stored = record_store.find_diary(source_text)
+                        candidates += [stored] if stored else []
+
+                    for diary in candidates:
+                        entry = diary.entry
 
                         # 메모 내용이 부분적으로라도 일치하면 OK
                         if (entry and source_text in entry) or (entry and entry in source_text):
                             found_item = entry
-                            found_data = diary.copy()
+                            found_data = asdict(diary)
                             print(f"[멀티모달 발견] 메모에서 찾음: {found_item}")
                             break
 
@@ -766,8 +3543,7 @@ def fallback_text_parsing(text: str, current_time: dict, context_data: Dict[str,
                 break
 
     # 연락처 패턴 감지
-    contact_keywords = ['연락처', '주소록', '전화번호', '번호']
-    if any(keyword in text for keyword in contact_keywords):
+    if any(keyword in text for keyword in CONTACT_KEYWORDS):
         # 전화번호 패턴 (010-xxxx-xxxx 또는 01xxxxxxxxx)
         phone_match = re.search(r'(010[-\s]?\d{4}[-\s]?\d{4})', text)
         if phone_match:
@@ -801,18 +3577,14 @@ def fallback_text_parsing(text: str, current_time: dict, context_data: Dict[str,
         item = extract_item_name(text) or "지출 항목"
 
         # 수입/지출 구분
-        transaction_type = 'income' if any(word in text for word in ['받았어', '수입', '월급', '급여']) else 'expense'
+        transaction_type = 'income' if any(word in text for word in INCOME_KEYWORDS) else 'expense'
 
         # 카테고리 자동 분류
         category = '기타'
-        if any(word in text for word in ['먹었어', '식사', '음식', '밥', '국수', '저녁', '점심', '아침', '식비']):
-            category = '식비'
-        elif any(word in text for word in ['교통비', '버스', '지하철', '택시', '기름', '주유', '교통']):
-            category = '교통'
-        elif any(word in text for word in ['쇼핑', '옷', '구매', '샀어']):
-            category = '쇼핑'
-        elif any(word in text for word in ['월급', '급여', '수입', '용돈']):
-            category = '급여'
+        for name, words in EXPENSE_CATEGORY_KEYWORDS.items():
+            if any(word in text for word in words):
+                category = name
+                break
 
         # 날짜 추출 (상대적 날짜 파싱 사용)
         expense_date = parse_relative_date(text)
@@ -829,12 +3601,22 @@ def fallback_text_parsing(text: str, current_time: dict, context_data: Dict[str,
         result['expenses'].append(expense_data)
 
     # 일정 패턴 감지
-    if any(word in text for word in ['일정', '예약', '약속', '미팅', '회의', '있어', '있다']):
+    if any(word in text for word in SCHEDULE_KEYWORDS):
         # 날짜 추출 (상대적 날짜 파싱 사용)
         date_str = parse_relative_date(text)
         if not date_str:
             date_str = current_time['date']
 
+        # 반복 일정 감지 (매주 월요일, 매월 15일 등) - 날짜는 오늘 이후 첫 발생일
+        recurrence = parse_recurrence(text)
+        if recurrence:
+            today = datetime.strptime(current_time['date'], '%Y-%m-%d').date()
+            if recurrence.freq == 'weekly' and not recurrence.weekdays:
+                recurrence.weekdays = [datetime.strptime(date_str, '%Y-%m-%d').weekday()]
+            first_date = next_occurrence(recurrence, today, today)
+            if first_date:
+                date_str = first_date.strftime('%Y-%m-%d')
+
         # 시간 추출
         time_match = re.search(r'(\d{1,2})시', text)
         time_str = None
@@ -872,6 +3654,11 @@ def fallback_text_parsing(text: str, current_time: dict, context_data: Dict[str,
         for day in ['월요일', '화요일', '수요일', '목요일', '금요일', '토요일', '일요일']:
             title = title.replace(day, '')
 
+        # 반복 표현 제거
+        if recurrence:
+            title = re.sub(r'(매일|매주|매월|매달|매년|격주|평일|주말|날마다|\d+일마다|\d+주마다|마다)', '', title)
+            title = re.sub(r'\d{1,2}일', '', title)
+
         # 일정 관련 동사/조사 제거
         title = re.sub(r'(있어|있다|있음|합니다)', '', title)
 
@@ -898,14 +3685,15 @@ def fallback_text_parsing(text: str, current_time: dict, context_data: Dict[str,
             'title': title,
             'date': date_str,
         }
+        if recurrence:
+            schedule_data['recurrence'] = recurrence.model_dump(exclude_none=True)
         if time_str:
             schedule_data['time'] = time_str
 
         result['schedule'].append(schedule_data)
 
     # 메모/다이어리 패턴 감지
-    memo_keywords = ['메모', '메모장', '다이어리', '일기', '기록']
-    if any(keyword in text for keyword in memo_keywords):
+    if any(keyword in text for keyword in MEMO_KEYWORDS):
         # 날짜 추출
         diary_date = parse_relative_date(text)
         if not diary_date:
@@ -984,44 +3772,998 @@ def fallback_text_parsing(text: str, current_time: dict, context_data: Dict[str,
     return result
 
 
-@app.post("/api/process", response_model=ProcessResponse)
-async def process_text(request: ProcessRequest):
+# 확인 질문(clarification) 대기 결과 보관 설정
+CLARIFICATION_TTL_SECONDS = float(os.environ.get("CLARIFICATION_TTL_SECONDS", "600"))
+CLARIFICATION_MAX_ENTRIES = int(os.environ.get("CLARIFICATION_MAX_ENTRIES", "1000"))
+# 워커 간 공유 보관 DB (기본: 레코드 저장소 옆, 빈 문자열이면 프로세스 내 메모리 - 워커 하나일 때만)
+CLARIFICATION_STORE_PATH = os.environ.get(
+    "CLARIFICATION_STORE_PATH", f"{RECORD_STORE_PATH}.clarifications" if RECORD_STORE_PATH else "")
+
+# 카테고리 선택지 → dataExtraction 키
+CATEGORY_KEYS = {'연락처': 'contacts', '일정': 'schedule', '가계부': 'expenses', '메모': 'diary'}
+TIME_OPTIONS = ('오전', '오후')
+
+
+class ClarificationStore:
     """
-    텍스트 처리 API
+    확인 질문에 대한 파싱 결과를 id로 보관 (TTL + 최대 개수 제한)
+    사용자가 선택지를 고르면 저장된 결과에 바로 적용하므로 모델을 다시 실행하지 않음
+    워커가 여러 개면 질문한 워커와 응답받는 워커가 다를 수 있어 공유 SQLite에 보관
+    (경로가 없으면 프로세스 내 메모리 DB)
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        # 만료 시각은 워커끼리 비교해야 하므로 monotonic이 아닌 벽시계 기준
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS pending (id TEXT PRIMARY KEY, expires_at REAL NOT NULL, payload TEXT NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_pending_expires_at ON pending (expires_at)')
+        self._conn.commit()
+        self.counters = {'stored': 0, 'resolved': 0, 'expired': 0, 'evicted': 0}
+
+    def _purge(self, now: float):
+        expired = self._conn.execute('DELETE FROM pending WHERE expires_at <= ?', (now,)).rowcount
+        self.counters['expired'] += expired
+
+    def put(self, pending: dict) -> str:
+        clarification_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            # TTL이 고정이라 만료 시각 순서 = 삽입 순서, 상한을 넘으면 오래된 것부터 버림
+            evicted = self._conn.execute(
+                'DELETE FROM pending WHERE id IN (SELECT id FROM pending ORDER BY expires_at '
+                'LIMIT max(0, (SELECT COUNT(*) FROM pending) - ? + 1))', (self.max_entries,)
+            ).rowcount
+            self._conn.execute(
+                'INSERT INTO pending (id, expires_at, payload) VALUES (?, ?, ?)',
+                (clarification_id, now + self.ttl_seconds, json.dumps(pending, ensure_ascii=False))
+            )
+            self._conn.commit()
+            self.counters['evicted'] += evicted
+            self.counters['stored'] += 1
+        return clarification_id
+
+    def get(self, clarification_id: str) -> Optional[dict]:
+        """보관 내용 조회 (만료 시 None)"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT payload FROM pending WHERE id = ? AND expires_at > ?', (clarification_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def resolve(self, clarification_id: str) -> bool:
+        """응답이 끝난 항목 제거 (한 번만 사용 가능, 동시에 두 워커가 응답하면 하나만 True)"""
+        with self._lock:
+            removed = self._conn.execute('DELETE FROM pending WHERE id = ?', (clarification_id,)).rowcount
+            self._conn.commit()
+            if removed:
+                self.counters['resolved'] += 1
+        return bool(removed)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pending = self._conn.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+        return {'pending': pending, 'ttl_seconds': self.ttl_seconds, **self.counters}
+
+
+clarification_store = ClarificationStore(
+    CLARIFICATION_STORE_PATH or ':memory:', CLARIFICATION_TTL_SECONDS, CLARIFICATION_MAX_ENTRIES)
+
+
+def apply_clarification(pending: dict, option: str) -> Dict[str, Any]:
+    """
+    보관된 파싱 결과에 선택지 적용
+    - 애매한 시간: 오후면 +12시 (12시는 그대로), 오전 12시는 0시로
+    - 여러 카테고리: 선택한 카테고리만 남김
+    """
+    parsed_data = pending['parsed_data']
+    if pending.get('ambiguous_time') is not None:
+        ambiguous_hour = pending['ambiguous_time']
+        for schedule in parsed_data.get('schedule') or []:
+            if 'time' not in schedule:
+                continue
+            hour_text, _, minute_text = schedule['time'].partition(':')
+            hour = int(hour_text)
+            if hour != ambiguous_hour:
+                continue
+            if option == '오후' and hour < 12:
+                hour += 12
+            elif option == '오전' and hour == 12:
+                hour = 0
+            schedule['time'] = f"{hour:02d}:{minute_text or '00'}"
+    else:
+        selected = CATEGORY_KEYS.get(option)
+        if selected is None:
+            raise ValueError(f"알 수 없는 카테고리 선택지: {option}")
+        for key in CATEGORY_KEYS.values():
+            if key != selected:
+                parsed_data[key] = []
+    return parsed_data
+
+
+def build_clarification_response(result: Dict[str, Any], duplicate_count: int) -> ProcessResponse:
+    """확인 질문 응답 생성 (파싱 결과는 clarification_store에 보관)"""
+    print(f"[확인 필요] {result['clarification_question']}")
+
+    # 처리 내역 메시지 생성
+    if result.get('ambiguous_time'):
+        processing_msg = f"애매한 시간 감지: {result['ambiguous_time']}시"
+    elif result.get('ambiguous_categories'):
+        processing_msg = f"여러 카테고리 파싱: {', '.join(result['ambiguous_categories'])}"
+    else:
+        processing_msg = "확인 필요"
+
+    # 모델 JSON에서 온 선택지일 수 있으므로 적용 가능한 것만 남김
+    allowed = TIME_OPTIONS if result.get('ambiguous_time') is not None else CATEGORY_KEYS
+    options = [option for option in result.get('clarification_options') or [] if option in allowed]
+    if not options and result.get('ambiguous_time') is None:
+        options = [name for name, key in CATEGORY_KEYS.items() if result['parsed_data'].get(key)]
+    clarification_id = clarification_store.put({
+        'parsed_data': result['parsed_data'],
+        'raw_response': result['raw_response'],
+        'ambiguous_time': result.get('ambiguous_time'),
+        'options': options,
+        'duplicate_count': duplicate_count,
+    })
+
+    return ProcessResponse(
+        answer=result['clarification_question'],
+        dataExtraction=result['parsed_data'],
+        usedModel="local-lora-gpt2",
+        canHandle=True,
+        parseResult=result['raw_response'][:200],
+        processingDetails=processing_msg,
+        clarificationNeeded=True,
+        clarificationOptions=options,
+        clarificationId=clarification_id
+    )
+
+
+def build_completed_response(parsed_data: Dict[str, Any], raw_response: str, duplicate_count: int) -> ProcessResponse:
+    """저장 완료 응답 생성"""
+    answer_parts = []
+    if parsed_data.get('expenses'):
+        for exp in parsed_data['expenses']:
+            answer_parts.append(f"{exp.get('item', '항목')} {exp.get('amount', 0):,}원이 {exp.get('type', 'expense') == 'expense' and '지출로' or '수입으로'} 저장되었습니다.")
+    if parsed_data.get('schedule'):
+        for sch in parsed_data['schedule']:
+            answer_parts.append(f"{sch.get('title', '일정')}이(가) {sch.get('date')}에 등록되었습니다.")
+    if parsed_data.get('contacts'):
+        for con in parsed_data['contacts']:
+            answer_parts.append(f"{con.get('name', '연락처')}이(가) 저장되었습니다.")
+    if parsed_data.get('diary'):
+        for dia in parsed_data['diary']:
+            answer_parts.append(f"메모가 저장되었습니다.")
+
+    answer = ' '.join(answer_parts) if answer_parts else "입력을 처리했습니다."
+
+    processing_details = f"로컬 LoRA 모델로 처리 완료. 추출된 데이터: {len(parsed_data.get('expenses', []))}개 지출/수입, {len(parsed_data.get('schedule', []))}개 일정, {len(parsed_data.get('contacts', []))}개 연락처, {len(parsed_data.get('diary', []))}개 메모"
+    if duplicate_count:
+        processing_details += f" (중복 의심 {duplicate_count}개)"
+
+    print(f"[답변] {answer}")
+    print(f"[처리 내역] {processing_details}")
+
+    return ProcessResponse(
+        answer=answer,
+        dataExtraction=parsed_data,
+        usedModel="local-lora-gpt2",
+        canHandle=True,
+        parseResult=raw_response[:200],  # 처음 200자만
+        processingDetails=processing_details
+    )
+
+
+# 슬롯 템플릿 캐시 설정 ("오늘 국수 5000원 먹었어" → "오늘 <ITEM> <AMOUNT>원 먹었어", 기본 비활성화)
+TEMPLATE_CACHE_ENABLED = os.environ.get("TEMPLATE_CACHE_ENABLED", "0") == "1"
+TEMPLATE_CACHE_MAX_ENTRIES = int(os.environ.get("TEMPLATE_CACHE_MAX_ENTRIES", "5000"))
+TEMPLATE_MIN_OBSERVATIONS = int(os.environ.get("TEMPLATE_MIN_OBSERVATIONS", "2"))  # 같은 구조가 이만큼 나와야 사용
+TEMPLATE_VALIDATION_RATE = float(os.environ.get("TEMPLATE_VALIDATION_RATE", "0.05"))  # 적중 중 전체 경로로 재검증할 비율
+
+# 파싱 결과를 바꾸는 단어가 들어간 항목명은 슬롯으로 만들지 않음 (예: 택시 → 교통)
+TEMPLATE_LITERAL_WORDS = tuple(
+    CONTACT_KEYWORDS + SCHEDULE_KEYWORDS + MEMO_KEYWORDS + INCOME_KEYWORDS
+    + [word for words in EXPENSE_CATEGORY_KEYWORDS.values() for word in words]
+    + ['매일', '매주', '매월', '매달', '매년', '격주', '평일', '주말', '마다']
+)
+# 날짜를 나타내는 숫자 표현 (숫자만 <N>으로 바꾸고, 날짜 값은 parse_relative_date로 다시 계산)
+TEMPLATE_DATE_PATTERNS = (
+    re.compile(r'\d{1,2}월\s*\d{1,2}일'),
+    re.compile(r'\d+일\s*(전|후)'),
+    re.compile(r'\d+주\s*(전|후)'),
+    re.compile(r'\d+개?월\s*(전|후)'),
+)
+_slot_marker = '\x00{}\x00'.format
+_iso_date = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def extract_template_slots(text: str, today: str) -> Optional[tuple]:
+    """
+    입력을 (템플릿 키, 슬롯 값)으로 분해
+    금액/시간/날짜/항목명 외의 숫자가 남거나 같은 종류 슬롯이 여러 개면 None (캐시 대상 아님)
+    """
+    key = ' '.join(text.split())
+    slots = {}
+
+    amounts = re.findall(r'(\d+)원', key)
+    if len(amounts) > 1:
+        return None
+    if amounts:
+        slots['AMOUNT'] = int(amounts[0])
+        key = re.sub(r'\d+원', '<AMOUNT>원', key)
+
+    hours = re.findall(r'(\d{1,2})시', key)
+    if len(hours) > 1:
+        return None
+    if hours:
+        hour = int(hours[0])
+        if hour > 24:
+            return None
+        slots['TIME'] = "00:00" if hour in (0, 24) else f"{hour:02d}:00"
+        # 1-12시는 오전/오후 확인이 필요하므로 13-23시와 다른 템플릿
+        key = re.sub(r'\d{1,2}시', '<HOUR_AMPM>시' if 1 <= hour <= 12 else '<HOUR>시', key)
+
+    for pattern in TEMPLATE_DATE_PATTERNS:
+        key = pattern.sub(lambda match: re.sub(r'\d+', '<N>', match.group()), key)
+    if re.search(r'\d', key):
+        return None
+    slots['DATE'] = parse_relative_date(text) or today
+
+    item = extract_item_name(text)
+    if item and key.count(item) == 1 and not any(word in item for word in TEMPLATE_LITERAL_WORDS):
+        slots['ITEM'] = item
+        key = key.replace(item, '<ITEM>')
+    return key, slots
+
+
+def _to_template(value: Any, slots: dict) -> Any:
+    """파싱 결과의 슬롯 값을 표식으로 치환"""
+    if isinstance(value, dict):
+        return {k: _to_template(v, slots) for k, v in value.items() if k not in ('isDuplicate', 'id')}
+    if isinstance(value, list):
+        return [_to_template(v, slots) for v in value]
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value == slots.get('AMOUNT'):
+        return _slot_marker('AMOUNT')
+    if isinstance(value, str):
+        for name in ('DATE', 'TIME', 'ITEM'):
+            if name in slots:
+                value = value.replace(slots[name], _slot_marker(name))
+    return value
+
+
+def _fill_template(value: Any, slots: dict) -> Any:
+    """템플릿 표식에 슬롯 값 채우기"""
+    if isinstance(value, dict):
+        return {k: _fill_template(v, slots) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill_template(v, slots) for v in value]
+    if isinstance(value, str) and '\x00' in value:
+        if value == _slot_marker('AMOUNT'):
+            return slots['AMOUNT']
+        for name in ('DATE', 'TIME', 'ITEM'):
+            if name in slots:
+                value = value.replace(_slot_marker(name), slots[name])
+    return value
+
+
+class TemplateCache:
+    """
+    구조가 같은 입력의 추출 결과 캐시
+    - 입력을 슬롯 템플릿으로 바꾸고, 전체 경로 결과에서 슬롯 값을 표식으로 치환한 구조를 저장
+    - 같은 템플릿이 같은 구조로 min_observations번 나오면 이후 적중 시 슬롯만 채워 반환 (모델 생략)
+    - 적중 중 일부는 전체 경로를 다시 실행해 결과가 다르면 템플릿을 버림
+    - 교차 참조 입력은 결과가 요청자의 contextData/저장소에 좌우되므로 학습도 적중도 하지 않음
+      (다른 사용자에게 남의 연락처가 채워지거나 수정 전 값이 나가지 않도록)
+    """
+
+    def __init__(self, max_entries: int, min_observations: int, validation_rate: float):
+        self.max_entries = max_entries
+        self.min_observations = min_observations
+        self.validation_rate = validation_rate
+        self._entries = OrderedDict()  # 템플릿 키 → {'structure', 'observations', 'hits'}
+        self.counters = {'hits': 0, 'misses': 0, 'learned': 0, 'rejected': 0, 'bypassed': 0,
+                         'validations': 0, 'validation_failures': 0}
+
+    def lookup(self, text: str) -> Optional[dict]:
+        """사용 가능한 템플릿이 있으면 슬롯을 채운 파싱 결과 반환"""
+        if is_cross_reference(text):
+            self.counters['bypassed'] += 1
+            return None
+        extracted = extract_template_slots(text, get_current_kst_datetime()['date'])
+        entry = self._entries.get(extracted[0]) if extracted else None
+        if entry is None or entry['observations'] < self.min_observations:
+            self.counters['misses'] += 1
+            return None
+        self._entries.move_to_end(extracted[0])
+        entry['hits'] += 1
+        self.counters['hits'] += 1
+        return _fill_template(entry['structure'], extracted[1])
+
+    def should_validate(self) -> bool:
+        return random.random() < self.validation_rate
+
+    def learn(self, text: str, parsed_data: dict):
+        """전체 경로 결과로 템플릿 학습 (슬롯 값이 결과에 그대로 남는 경우는 저장하지 않음)"""
+        if is_cross_reference(text):
+            return
+        extracted = extract_template_slots(text, get_current_kst_datetime()['date'])
+        if extracted is None:
+            return
+        key, slots = extracted
+        structure = _to_template(parsed_data, slots)
+
+        # 다른 값을 채웠을 때 원래 값이나 다른 날짜가 남아 있으면 슬롯과 무관한 값이 섞인 것
+        probe_slots = {name: _slot_marker('PROBE') for name in slots}
+        probe_slots['AMOUNT'] = -1
+        probe = json.dumps(_fill_template(structure, probe_slots), ensure_ascii=False)
+        leftovers = [str(value) for value in slots.values()]
+        if _iso_date.search(probe) or any(value in probe for value in leftovers):
+            self.counters['rejected'] += 1
+            return
+
+        entry = self._entries.get(key)
+        if entry is not None and entry['structure'] == structure:
+            entry['observations'] += 1
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = {'structure': structure, 'observations': 1, 'hits': 0}
+        self._entries.move_to_end(key)
+        self.counters['learned'] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def validate(self, text: str, expected: dict, parsed_data: Optional[dict]) -> bool:
+        """템플릿 결과와 전체 경로 결과(완료되지 않았으면 None) 비교, 다르면 템플릿 삭제"""
+        self.counters['validations'] += 1
+        if parsed_data is not None and _to_template(expected, {}) == _to_template(parsed_data, {}):
+            return True
+        self.counters['validation_failures'] += 1
+        extracted = extract_template_slots(text, get_current_kst_datetime()['date'])
+        if extracted:
+            self._entries.pop(extracted[0], None)
+        print(f"[템플릿 캐시] 검증 실패 - 템플릿 삭제: {extracted[0] if extracted else text}")
+        return False
+
+    def snapshot(self) -> dict:
+        active = sum(1 for entry in self._entries.values() if entry['observations'] >= self.min_observations)
+        return {'templates': len(self._entries), 'active': active, **self.counters}
+
+
+template_cache = TemplateCache(TEMPLATE_CACHE_MAX_ENTRIES, TEMPLATE_MIN_OBSERVATIONS, TEMPLATE_VALIDATION_RATE) \
+    if TEMPLATE_CACHE_ENABLED else None
+
+
+# 추론 부하 제어(admission control) 설정
+MAX_CONCURRENT_INFERENCE = int(os.environ.get("MAX_CONCURRENT_INFERENCE", "1"))
+MAX_QUEUED_INFERENCE = int(os.environ.get("MAX_QUEUED_INFERENCE", "8"))   # 대화형 요청 대기열 한도
+MAX_QUEUED_BULK = int(os.environ.get("MAX_QUEUED_BULK", "256"))            # 일괄(bulk) 요청 대기열 한도
+SHORT_INPUT_CHARS = int(os.environ.get("SHORT_INPUT_CHARS", "40"))        # 이 길이 이하는 짧은 입력으로 우선 처리
+SHORT_INPUT_QUEUE_BONUS = int(os.environ.get("SHORT_INPUT_QUEUE_BONUS", "4"))  # 짧은 입력에 허용하는 추가 대기열
+SHED_MODE = os.environ.get("SHED_MODE", "degrade")  # degrade: Gemini 폴백 응답, 503: Retry-After와 함께 거절
+
+# 사용자(테넌트)별 공정 분배 설정 (deficit round robin)
+FAIR_QUANTUM = int(os.environ.get("FAIR_QUANTUM", "2"))          # 차례마다 테넌트에 더해주는 처리량 (비용 단위)
+FAIR_COST_CHARS = int(os.environ.get("FAIR_COST_CHARS", "100"))  # 입력 이 글자 수마다 비용 1
+BULK_INPUT_LINES = int(os.environ.get("BULK_INPUT_LINES", "3"))  # 이 줄 수 이상이면 일괄 요청으로 분류
+BULK_STARVATION_LIMIT = int(os.environ.get("BULK_STARVATION_LIMIT", "8"))  # 대화형이 연속 이만큼 처리되면 일괄 하나 처리
+FAIR_TENANT_WEIGHTS = {
+    tenant: float(weight)
+    for tenant, weight in (
+        item.split('=', 1) for item in os.environ.get("FAIR_TENANT_WEIGHTS", "").split(',') if '=' in item
+    )
+}  # 예: "key:1a2b3c4d5e6f=2,user:admin=4"
+REQUEST_CLASSES = ('interactive', 'bulk')
+# X-Request-Class로 등급을 올릴 수 있는 테넌트 (request_tenant 형식, 쉼표 구분)
+REQUEST_CLASS_TRUSTED_TENANTS = {
+    tenant.strip() for tenant in os.environ.get("REQUEST_CLASS_TRUSTED_TENANTS", "").split(',') if tenant.strip()
+}
+
+
+def classify_request(text: str, requested: Optional[str] = None, tenant: Optional[str] = None) -> str:
+    """
+    요청 등급 - 여러 줄 붙여넣기는 일괄로 분류
+    X-Request-Class 헤더는 클라이언트가 정하는 값이라 스스로 낮추는 'bulk'만 받고,
+    'interactive'로 올리는 것은 신뢰 테넌트만 허용
+    """
+    if requested == 'bulk' or (requested in REQUEST_CLASSES and tenant in REQUEST_CLASS_TRUSTED_TENANTS):
+        return requested
+    return 'bulk' if text.count('\n') + 1 >= BULK_INPUT_LINES else 'interactive'
+
+
+class FairQueue:
+    """
+    한 등급의 테넌트별 대기열 (deficit round robin)
+    차례가 온 테넌트는 적립된 deficit이 맨 앞 요청의 비용 이상이면 처리, 아니면 quantum을 적립하고 다음 테넌트로
+    """
+
+    def __init__(self, quantum: int):
+        self.quantum = quantum
+        self.flows = {}        # 테넌트 → deque[(future, 비용, 대기 시작 시각)]
+        self.active = deque()  # 대기 요청이 있는 테넌트 순서
+        self.deficit = defaultdict(float)
+        self.size = 0
+
+    def push(self, tenant: str, entry: tuple):
+        flow = self.flows.get(tenant)
+        if flow is None:
+            flow = self.flows[tenant] = deque()
+            self.active.append(tenant)
+        flow.append(entry)
+        self.size += 1
+
+    def remove(self, tenant: str, entry: tuple) -> bool:
+        flow = self.flows.get(tenant)
+        if flow is None or entry not in flow:
+            return False
+        flow.remove(entry)
+        self.size -= 1
+        if not flow:
+            self._drop(tenant)
+        return True
+
+    def _drop(self, tenant: str):
+        del self.flows[tenant]
+        self.active.remove(tenant)
+        self.deficit.pop(tenant, None)
+
+    def pop(self) -> tuple:
+        """다음 처리할 (테넌트, 요청) - 비어 있지 않을 때만 호출"""
+        while True:
+            tenant = self.active[0]
+            flow = self.flows[tenant]
+            cost = flow[0][1]
+            if self.deficit[tenant] >= cost:
+                self.deficit[tenant] -= cost
+                entry = flow.popleft()
+                self.size -= 1
+                if not flow:
+                    # 대기열이 빈 테넌트는 남은 deficit을 버림 (쉬었다 와서 몰아 쓰지 못하게)
+                    self._drop(tenant)
+                return tenant, entry
+            self.deficit[tenant] += self.quantum * FAIR_TENANT_WEIGHTS.get(tenant, 1.0)
+            self.active.rotate(-1)
+
+
+class TenantStats:
+    """테넌트·등급별 대기 지표"""
+
+    WAIT_SAMPLES = 200
+
+    def __init__(self):
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.total_wait = 0.0
+        self.waits = deque(maxlen=self.WAIT_SAMPLES)
+
+    def snapshot(self) -> dict:
+        waits = sorted(self.waits)
+        return {
+            'queued': self.queued,
+            'admitted': self.admitted,
+            'shed': self.shed,
+            'avg_wait_ms': round(self.total_wait / self.admitted * 1000, 1) if self.admitted else None,
+            'p95_wait_ms': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else None,
+        }
+
+
+class AdmissionController:
+    """
+    로컬 모델 추론 동시 실행/대기 수를 추적하고 임계값을 넘으면 요청을 즉시 거절(shedding)
+    대기 중인 요청은 등급(대화형 > 일괄) 순으로, 같은 등급 안에서는 테넌트별 DRR로 슬롯을 받음
+    일괄 요청은 대화형이 BULK_STARVATION_LIMIT번 연속 처리되면 하나씩 끼워 넣어 굶지 않게 함
+    """
+
+    MAX_TRACKED_TENANTS = 1000
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_bulk_queue: int,
+                 short_input_chars: int, short_queue_bonus: int, quantum: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_bulk_queue = max_bulk_queue
+        self.short_input_chars = short_input_chars
+        self.short_queue_bonus = short_queue_bonus
+        self.in_flight = 0
+        self._queues = {request_class: FairQueue(quantum) for request_class in REQUEST_CLASSES}
+        self._interactive_streak = 0
+        self._stats = OrderedDict()  # (테넌트, 등급) → TenantStats
+        self.avg_service_seconds = None  # 추론 소요 시간 지수 이동 평균
+        self.counters = {
+            'admitted': 0,
+            'shed_degraded': 0,
+            'shed_503': 0,
+        }
+
+    @property
+    def queued(self) -> int:
+        return sum(queue.size for queue in self._queues.values())
+
+    def _tenant_stats(self, tenant: str, request_class: str) -> TenantStats:
+        key = (tenant, request_class)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = TenantStats()
+            # 대기 중인 테넌트는 남기고 오래된 테넌트 지표부터 정리
+            while len(self._stats) > self.MAX_TRACKED_TENANTS:
+                oldest = next((k for k, v in self._stats.items() if v.queued == 0), None)
+                if oldest is None:
+                    break
+                del self._stats[oldest]
+        else:
+            self._stats.move_to_end(key)
+        return stats
+
+    def _cost(self, text: str) -> int:
+        return 1 + len(text) // FAIR_COST_CHARS
+
+    def should_shed(self, text: str, request_class: str = 'interactive') -> bool:
+        """현재 대기열 기준으로 이 요청을 거절해야 하는지 판단 (등급별 대기열 한도)"""
+        if self.in_flight < self.max_concurrency and self.queued == 0:
+            return False
+        if request_class == 'bulk':
+            return self._queues['bulk'].size >= self.max_bulk_queue
+        limit = self.max_queue
+        if len(text) <= self.short_input_chars:
+            limit += self.short_queue_bonus
+        return self._queues['interactive'].size >= limit
+
+    def record_shed(self, mode: str, tenant: str = 'anonymous', request_class: str = 'interactive'):
+        key = 'shed_503' if mode == '503' else 'shed_degraded'
+        self.counters[key] += 1
+        self._tenant_stats(tenant, request_class).shed += 1
+
+    def retry_after_seconds(self) -> int:
+        """대기열이 비워질 때까지 예상 시간 (Retry-After 헤더용)"""
+        service = self.avg_service_seconds or 1.0
+        backlog = (self.queued + self.in_flight) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(service * backlog))
+
+    @asynccontextmanager
+    async def slot(self, text: str, tenant: str = 'anonymous', request_class: str = 'interactive'):
+        """추론 슬롯 획득 (필요하면 테넌트별 공정 대기)"""
+        stats = self._tenant_stats(tenant, request_class)
+        enqueued = time.perf_counter()
+        if self.in_flight < self.max_concurrency and self.queued == 0:
+            self.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            entry = (waiter, self._cost(text), enqueued)
+            self._queues[request_class].push(tenant, entry)
+            stats.queued += 1
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if self._queues[request_class].remove(tenant, entry):
+                    stats.queued -= 1
+                elif not waiter.cancelled():
+                    # 슬롯을 넘겨받은 직후 취소된 경우 다음 대기자에게 양보
+                    # (waiter가 취소된 상태면 _release가 이미 건너뛰고 대기열에서 뺀 것)
+                    self._release()
+                raise
+
+        waited = time.perf_counter() - enqueued
+        stats.admitted += 1
+        stats.total_wait += waited
+        stats.waits.append(waited)
+        self.counters['admitted'] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if self.avg_service_seconds is None:
+                self.avg_service_seconds = elapsed
+            else:
+                self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * elapsed
+            self._release()
+
+    def _next_class(self) -> Optional[str]:
+        interactive, bulk = self._queues['interactive'].size, self._queues['bulk'].size
+        if bulk and (not interactive or self._interactive_streak >= BULK_STARVATION_LIMIT):
+            self._interactive_streak = 0
+            return 'bulk'
+        if interactive:
+            self._interactive_streak = self._interactive_streak + 1 if bulk else 0
+            return 'interactive'
+        return None
+
+    def _release(self):
+        # 대기자가 있으면 슬롯을 바로 넘겨줌 (in_flight 유지)
+        while True:
+            request_class = self._next_class()
+            if request_class is None:
+                self.in_flight -= 1
+                return
+            tenant, (waiter, _, _) = self._queues[request_class].pop()
+            self._tenant_stats(tenant, request_class).queued -= 1
+            # 같은 루프 반복에서 취소된 대기자는 아직 except 블록이 돌기 전이라 대기열에 남아 있음 → 건너뜀
+            if waiter.done():
+                continue
+            waiter.set_result(None)
+            return
+
+    def tenant_snapshot(self) -> dict:
+        tenants = defaultdict(dict)
+        for (tenant, request_class), stats in self._stats.items():
+            tenants[tenant][request_class] = stats.snapshot()
+        return tenants
+
+    def snapshot(self) -> dict:
+        return {
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'queued_interactive': self._queues['interactive'].size,
+            'queued_bulk': self._queues['bulk'].size,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'max_bulk_queue': self.max_bulk_queue,
+            'avg_service_seconds': self.avg_service_seconds,
+            'shed_mode': SHED_MODE,
+            **self.counters,
+            'shed_total': self.counters['shed_degraded'] + self.counters['shed_503'],
+        }
+
+
+admission = AdmissionController(
+    MAX_CONCURRENT_INFERENCE, MAX_QUEUED_INFERENCE, MAX_QUEUED_BULK,
+    SHORT_INPUT_CHARS, SHORT_INPUT_QUEUE_BONUS, FAIR_QUANTUM
+)
+
+
+def request_tenant(http_request: Request) -> str:
+    """공정 분배 단위 - API 키(해시) > 사용자 헤더 > 클라이언트 주소"""
+    api_key = http_request.headers.get('x-api-key')
+    if api_key:
+        return f"key:{hashlib.sha256(api_key.encode()).hexdigest()[:12]}"
+    user_id = http_request.headers.get('x-user-id')
+    if user_id:
+        return f"user:{user_id[:64]}"
+    return f"ip:{http_request.client.host if http_request.client else 'unknown'}"
+
+
+# 트래픽 캡처 설정 (replay.py 재생용, 빈 문자열이면 비활성화)
+CAPTURE_PATH = os.environ.get("CAPTURE_PATH", "")
+CAPTURE_SALT = os.environ.get("CAPTURE_SALT", "")  # 개인정보 해시용 솔트 (캡처 간 같은 값이 같은 가명이 되도록 고정)
+
+def contact_names(context: ContextData) -> List[str]:
+    """가명 처리에 쓸 요청 contextData의 연락처 이름"""
+    return [contact.name for contact in context.contacts if contact.name]
+
+
+class TrafficRecorder:
+    """
+    /api/process 요청을 익명화해 JSONL로 기록
+    - 전화번호/이메일/긴 숫자/이름은 형태를 유지한 가명으로 치환 (파싱 경로가 바뀌지 않도록, TextAnonymizer 참고)
+    - contextData는 내용 없이 종류별 개수와 직렬화 크기만 기록
+    """
+
+    def __init__(self, path: str, salt: str):
+        self.path = path
+        self.anonymizer = TextAnonymizer(salt)
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8', buffering=1) if path else None
+        self.captured = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def anonymize(self, text: str, names=()) -> str:
+        return self.anonymizer.anonymize(text, names)
+
+    def record(self, request: ProcessRequest, tenant: str, request_class: Optional[str]):
+        if self._file is None:
+            return
+        arrived = current_kst()
+        context = {}
+        for kind in ('contacts', 'schedule', 'expenses', 'diary'):
+            items = getattr(request.contextData, kind)
+            if items:
+                size = len(json.dumps([asdict(item) for item in items], ensure_ascii=False).encode())
+                context[kind] = [len(items), size]
+        line = json.dumps({
+            'ts': round(time.time(), 3),
+            'kst': arrived.isoformat(),
+            'tenant': self.anonymizer.digest(tenant).hex()[:10],
+            'class': request_class,
+            'text': self.anonymize(request.text, contact_names(request.contextData)),
+            'context': context,
+        }, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + "\n")
+            self.captured += 1
+
+
+traffic_recorder = TrafficRecorder(CAPTURE_PATH, CAPTURE_SALT)
+if traffic_recorder.enabled:
+    print(f"[트래픽 캡처] {CAPTURE_PATH}에 /api/process 요청 기록")
+
+
+def gemini_fallback_response(reason: str) -> ProcessResponse:
+    """로컬 처리 불가 시 클라이언트가 Gemini로 넘기도록 하는 응답"""
+    return ProcessResponse(
+        answer="",
+        dataExtraction={
+            'contacts': [],
+            'schedule': [],
+            'expenses': [],
+            'diary': []
+        },
+        usedModel="gemini-fallback-required",
+        canHandle=False,
+        parseResult=None,
+        processingDetails=reason
+    )
+
+
+# 서버 측 원격 모델 위임(escalation) 설정 (빈 문자열이면 비활성화, 클라이언트가 Gemini 직접 호출)
+ESCALATION_URL = os.environ.get("ESCALATION_URL", "")
+ESCALATION_API_KEY = os.environ.get("ESCALATION_API_KEY", "")
+ESCALATION_MAX_CONCURRENCY = int(os.environ.get("ESCALATION_MAX_CONCURRENCY", "8"))
+ESCALATION_MAX_CONNECTIONS = int(os.environ.get("ESCALATION_MAX_CONNECTIONS", "16"))
+ESCALATION_CONNECT_TIMEOUT = float(os.environ.get("ESCALATION_CONNECT_TIMEOUT", "3"))
+ESCALATION_TIMEOUT = float(os.environ.get("ESCALATION_TIMEOUT", "30"))
+ESCALATION_MAX_RETRIES = int(os.environ.get("ESCALATION_MAX_RETRIES", "2"))
+ESCALATION_RETRY_RATIO = float(os.environ.get("ESCALATION_RETRY_RATIO", "0.2"))  # 요청 대비 허용 재시도 비율
+ESCALATION_RETRY_RESERVE = float(os.environ.get("ESCALATION_RETRY_RESERVE", "10"))  # 재시도 예산 최대치
+
+
+class EscalationResult(BaseModel):
+    """원격 모델 응답 (ProcessResponse와 같은 필드, 없는 값은 기본값)"""
+    answer: str = ""
+    dataExtraction: Dict[str, List[Any]] = Field(default_factory=dict)
+    dataModification: Dict[str, List[Any]] = Field(default_factory=dict)
+    dataDeletion: Dict[str, List[str]] = Field(default_factory=dict)
+    webSearchSources: Optional[List[Dict[str, str]]] = None
+    usedModel: Optional[str] = None
+    canHandle: bool = True
+    clarificationNeeded: Optional[bool] = False
+    clarificationOptions: Optional[List[str]] = None
+
+    def unsupported_keys(self) -> set:
+        """응답 형태로 옮길 수 없는 카테고리 키"""
+        return {
+            key for field in (self.dataExtraction, self.dataModification, self.dataDeletion)
+            for key, items in field.items() if items and key not in RECORD_SCHEMAS
+        }
+
+
+class EscalationClient:
+    """
+    로컬 처리 불가 요청을 서버가 직접 원격 모델로 전달
+    - keep-alive 연결 풀 재사용, 동시 요청 수 제한, 연결/응답 타임아웃
+    - 재시도는 예산 안에서만 (요청마다 ratio만큼 적립, 재시도마다 1 차감) → 장애 시 재시도 폭주 방지
+    - 동일한 요청이 동시에 들어오면 원격 호출 하나를 공유
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, url: str, api_key: str, max_concurrency: int, max_connections: int,
+                 connect_timeout: float, timeout: float, max_retries: int,
+                 retry_ratio: float, retry_reserve: float):
+        self.url = url
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_ratio = retry_ratio
+        self.retry_reserve = retry_reserve
+        self.retry_tokens = retry_reserve
+        self.in_flight = 0
+        self._client = None
+        self._semaphore = None
+        self._pending = {}  # 요청 키 -> 진행 중인 Task
+        self.counters = {'requests': 0, 'coalesced': 0, 'upstream_calls': 0, 'retries': 0,
+                         'retry_budget_exhausted': 0, 'failures': 0, 'unrepresentable': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url)
+
+    def _ensure_client(self):
+        # 이벤트 루프 안에서 처음 사용할 때 생성
+        if self._client is None:
+            headers = {'Authorization': f"Bearer {self.api_key}"} if self.api_key else None
+            self._client = httpx.AsyncClient(
+                headers=headers,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def make_key(payload: dict) -> str:
+        return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+    def _withdraw_retry(self) -> bool:
+        if self.retry_tokens >= 1:
+            self.retry_tokens -= 1
+            return True
+        self.counters['retry_budget_exhausted'] += 1
+        return False
+
+    async def _call(self, payload: dict) -> dict:
+        self._ensure_client()
+        self.retry_tokens = min(self.retry_reserve, self.retry_tokens + self.retry_ratio)
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                attempt = 0
+                while True:
+                    self.counters['upstream_calls'] += 1
+                    try:
+                        response = await self._client.post(self.url, json=payload)
+                        if response.status_code not in self.RETRY_STATUS:
+                            response.raise_for_status()
+                            return response.json()
+                        error = httpx.HTTPStatusError(f"upstream {response.status_code}",
+                                                      request=response.request, response=response)
+                    except httpx.TransportError as e:
+                        error = e
+                    if attempt >= self.max_retries or not self._withdraw_retry():
+                        raise error
+                    attempt += 1
+                    self.counters['retries'] += 1
+                    # 지수 백오프 + 지터
+                    await asyncio.sleep(min(2.0, 0.1 * 2 ** attempt) * random.uniform(0.5, 1.0))
+            finally:
+                self.in_flight -= 1
+
+    async def forward(self, payload: dict) -> dict:
+        """원격 모델 호출 (같은 요청이 진행 중이면 그 결과를 함께 기다림)"""
+        self.counters['requests'] += 1
+        key = self.make_key(payload)
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call(payload))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        else:
+            self.counters['coalesced'] += 1
+        # 한 호출자가 취소돼도 공유 중인 원격 호출은 계속 진행
+        return await asyncio.shield(task)
+
+    def snapshot(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'in_flight': self.in_flight,
+            'coalescing': len(self._pending),
+            'retry_tokens': round(self.retry_tokens, 2),
+            **self.counters,
+        }
+
+
+escalation_client = EscalationClient(
+    ESCALATION_URL, ESCALATION_API_KEY, ESCALATION_MAX_CONCURRENCY, ESCALATION_MAX_CONNECTIONS,
+    ESCALATION_CONNECT_TIMEOUT, ESCALATION_TIMEOUT, ESCALATION_MAX_RETRIES,
+    ESCALATION_RETRY_RATIO, ESCALATION_RETRY_RESERVE
+)
+
+
+async def escalate_or_fallback(request: ProcessRequest, reason: str) -> ProcessResponse:
+    """
+    원격 모델 위임이 설정돼 있으면 서버가 직접 호출하고, 아니거나 실패하면 클라이언트 폴백 응답
     """
+    # 이미지 없이 원격 모델에 보내면 OCR 결과를 지어내므로 클라이언트가 이미지와 함께 직접 호출
+    if not escalation_client.enabled or needs_image(request.text):
+        return gemini_fallback_response(reason)
+
+    payload = {'text': request.text, 'contextData': request.contextData.model_dump(), 'reason': reason}
+    started = time.perf_counter()
+    try:
+        result = EscalationResult.model_validate(await escalation_client.forward(payload))
+    except (httpx.HTTPError, ValueError) as e:
+        escalation_client.counters['failures'] += 1
+        print(f"[원격 위임] 실패 - 클라이언트 폴백: {e!r}")
+        return gemini_fallback_response(reason)
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    unsupported = result.unsupported_keys()
+    if not result.canHandle or unsupported:
+        # 원격 결과를 응답에 그대로 담을 수 없으면 클라이언트가 직접 처리하도록
+        escalation_client.counters['unrepresentable'] += 1
+        print(f"[원격 위임] 응답 형태로 옮길 수 없음 ({elapsed_ms:.0f}ms, 키 {sorted(unsupported)}) - 클라이언트 폴백")
+        return gemini_fallback_response(reason)
+
+    print(f"[원격 위임] 완료 ({elapsed_ms:.0f}ms)")
+    return ProcessResponse(
+        answer=result.answer,
+        dataExtraction={key: result.dataExtraction.get(key, []) for key in RECORD_SCHEMAS},
+        dataModification={key: result.dataModification.get(key, []) for key in RECORD_SCHEMAS},
+        dataDeletion={key: result.dataDeletion.get(key, []) for key in RECORD_SCHEMAS},
+        webSearchSources=result.webSearchSources,
+        usedModel=result.usedModel or "escalation",
+        canHandle=True,
+        parseResult=None,
+        processingDetails=f"원격 모델로 처리 ({reason})",
+        clarificationNeeded=result.clarificationNeeded,
+        clarificationOptions=result.clarificationOptions
+    )
+
+
+async def run_process_pipeline(request: ProcessRequest, tenant: str = 'anonymous',
+                               request_class: Optional[str] = None) -> ProcessResponse:
+    """
+    텍스트 처리 파이프라인 (라우팅 판단 → 로컬 모델 → 응답 생성)
+    """
+    request_class = classify_request(request.text, request_class, tenant)
     try:
         print(f"\n{'='*60}")
         print(f"[요청 수신] 사용자 입력: {request.text}")
 
         # 1. 로컬 모델이 처리 가능한지 판단
-        can_handle, reason = can_handle_locally(request.text)
+        can_handle, reason, heuristic, router_prob = learned_router.route(request.text)
         print(f"[판단 결과] {reason}")
 
         if not can_handle:
             # 로컬 모델로 처리 불가능
             print(f"[모델 선택] Gemini API로 전달 필요")
-            return ProcessResponse(
-                answer="",
-                dataExtraction={
-                    'contacts': [],
-                    'schedule': [],
-                    'expenses': [],
-                    'diary': []
-                },
-                usedModel="gemini-fallback-required",
-                canHandle=False,
-                parseResult=None,
-                processingDetails=reason
-            )
-
-        # 2. 로컬 모델로 처리
+            # 고정 규칙(OCR/수정/삭제)만 로컬 불가가 확정된 결과. 휴리스틱이나 분류기가 원격으로 보낸 경우는
+            # 실제 로컬 결과를 모르므로 학습 라벨에서 제외되도록 구분 (휴리스틱 판단을 라벨로 쓰면 순환 학습)
+            if hard_routing_rule(request.text) is not None:
+                outcome = 'remote_hard'
+            else:
+                outcome = 'router_remote' if heuristic else 'heuristic_remote'
+            routing_log.record(request.text, heuristic, router_prob, outcome, contact_names(request.contextData))
+            return await escalate_or_fallback(request, reason)
+
+        # 2. 구조가 같은 입력을 이미 처리한 적이 있으면 슬롯만 채워 응답 (일부는 검증용으로 전체 경로 실행)
+        template_result = template_cache.lookup(request.text) if template_cache is not None else None
+        validating = template_result is not None and template_cache.should_validate()
+        if template_result is not None and not validating:
+            print(f"[템플릿 캐시] 적중 - 모델 추론 생략")
+            duplicate_count = mark_duplicates(template_result, request.contextData)
+            await run_in_threadpool(save_extracted_records, template_result)
+            response = build_completed_response(template_result, "", duplicate_count)
+            response.processingDetails += " (템플릿 캐시)"
+            print(f"{'='*60}\n")
+            return response
+
+        # 3. 과부하 시 대기열에 쌓지 않고 즉시 거절
+        if admission.should_shed(request.text, request_class):
+            admission.record_shed(SHED_MODE, tenant, request_class)
+            print(f"[부하 제어] 추론 대기열 초과 ({tenant}, {request_class}, 대기 {admission.queued}, 실행 {admission.in_flight})")
+            if SHED_MODE == '503':
+                raise HTTPException(
+                    status_code=503,
+                    detail="서버가 혼잡합니다. 잠시 후 다시 시도해주세요.",
+                    headers={"Retry-After": str(admission.retry_after_seconds())}
+                )
+            return gemini_fallback_response("서버 과부하 - Gemini로 전달")
+
+        # 4. 로컬 모델로 처리 (이벤트 루프를 막지 않도록 스레드풀에서 실행)
         print(f"[모델 선택] 로컬 LoRA 모델 사용")
-        result = process_with_local_model(request.text, request.contextData)
+        async with admission.slot(request.text, tenant, request_class):
+            if request_profiler.armed:
+                result = await run_in_threadpool(
+                    request_profiler.call, process_with_local_model, request.text, request.contextData
+                )
+            else:
+                result = await run_in_threadpool(process_with_local_model, request.text, request.contextData)
 
         print(f"[파싱 결과] {json.dumps(result['parsed_data'], ensure_ascii=False, indent=2)}")
 
-        # 3. 응답 생성
+        # 5. 응답 생성
         parsed_data = result['parsed_data']
+        duplicate_count = mark_duplicates(parsed_data, request.contextData)
 
         # 파싱 결과가 비어있는지 확인
         has_data = any([
@@ -1031,7 +4773,16 @@ async def process_text(request: ProcessRequest):
             parsed_data.get('diary')
         ])
 
+        # 템플릿 검증: 전체 경로가 확인 질문이나 파싱 실패로 끝나도 템플릿과 다른 결과
+        if validating:
+            template_cache.validate(
+                request.text, template_result,
+                None if result.get('clarification_needed') or not has_data else parsed_data
+            )
+
         # 파싱 실패시 Gemini로 폴백
+        routing_log.record(request.text, heuristic, router_prob, 'local_success' if has_data else 'local_parse_failure',
+                           contact_names(request.contextData))
         if not has_data:
             print(f"[파싱 실패] 데이터 추출 실패 - Gemini로 폴백")
             print(f"{'='*60}\n")
@@ -1049,81 +4800,349 @@ async def process_text(request: ProcessRequest):
                 processingDetails="파싱 실패 - Gemini로 전달"
             )
 
-        # 확인 필요 (애매한 시간 또는 여러 카테고리)
+        # 확인 필요 (애매한 시간 또는 여러 카테고리) - 결과는 보관해두고 /api/clarify로 이어서 처리
         if result.get('clarification_needed'):
-            print(f"[확인 필요] {result['clarification_question']}")
+            response = build_clarification_response(result, duplicate_count)
             print(f"{'='*60}\n")
+            return response
 
-            # 처리 내역 메시지 생성
-            if result.get('ambiguous_time'):
-                processing_msg = f"애매한 시간 감지: {result['ambiguous_time']}시"
-            elif result.get('ambiguous_categories'):
-                processing_msg = f"여러 카테고리 파싱: {', '.join(result['ambiguous_categories'])}"
-            else:
-                processing_msg = "확인 필요"
-
-            return ProcessResponse(
-                answer=result['clarification_question'],
-                dataExtraction=parsed_data,
-                usedModel="local-lora-gpt2",
-                canHandle=True,
-                parseResult=result['raw_response'][:200],
-                processingDetails=processing_msg,
-                clarificationNeeded=True,
-                clarificationOptions=result.get('clarification_options', [])
-            )
+        if template_cache is not None and not validating:
+            template_cache.learn(request.text, parsed_data)
 
-        # 응답 메시지 생성
-        answer_parts = []
-        if parsed_data.get('expenses'):
-            for exp in parsed_data['expenses']:
-                answer_parts.append(f"{exp.get('item', '항목')} {exp.get('amount', 0):,}원이 {exp.get('type', 'expense') == 'expense' and '지출로' or '수입으로'} 저장되었습니다.")
-        if parsed_data.get('schedule'):
-            for sch in parsed_data['schedule']:
-                answer_parts.append(f"{sch.get('title', '일정')}이(가) {sch.get('date')}에 등록되었습니다.")
-        if parsed_data.get('contacts'):
-            for con in parsed_data['contacts']:
-                answer_parts.append(f"{con.get('name', '연락처')}이(가) 저장되었습니다.")
-        if parsed_data.get('diary'):
-            for dia in parsed_data['diary']:
-                answer_parts.append(f"메모가 저장되었습니다.")
-
-        answer = ' '.join(answer_parts) if answer_parts else "입력을 처리했습니다."
-
-        processing_details = f"로컬 LoRA 모델로 처리 완료. 추출된 데이터: {len(parsed_data.get('expenses', []))}개 지출/수입, {len(parsed_data.get('schedule', []))}개 일정, {len(parsed_data.get('contacts', []))}개 연락처, {len(parsed_data.get('diary', []))}개 메모"
-
-        print(f"[답변] {answer}")
-        print(f"[처리 내역] {processing_details}")
+        await run_in_threadpool(save_extracted_records, parsed_data)
+        response = build_completed_response(parsed_data, result['raw_response'], duplicate_count)
         print(f"{'='*60}\n")
+        return response
 
-        return ProcessResponse(
-            answer=answer,
-            dataExtraction=parsed_data,
-            usedModel="local-lora-gpt2",
-            canHandle=True,
-            parseResult=result['raw_response'][:200],  # 처음 200자만
-            processingDetails=processing_details
-        )
-
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[오류] {str(e)}")
         raise HTTPException(status_code=500, detail=f"처리 중 오류 발생: {str(e)}")
 
 
+@app.post("/api/process", response_model=ProcessResponse)
+async def process_text(http_request: Request, request: ProcessRequest = Depends(decode_process_request)):
+    """
+    텍스트 처리 API
+    JSON 또는 msgpack(application/x-msgpack) 요청/응답 지원
+    """
+    tenant = request_tenant(http_request)
+    request_class = http_request.headers.get('x-request-class')
+    traffic_recorder.record(request, tenant, request_class)
+    response = await run_process_pipeline(request, tenant, request_class)
+    return encode_response(http_request, response)
+
+
+@app.post("/api/clarify", response_model=ProcessResponse)
+async def resolve_clarification(http_request: Request, clarify_request: ClarifyRequest):
+    """
+    확인 질문 응답 처리 - 보관된 파싱 결과에 선택지를 적용 (모델 재실행 없음)
+    """
+    pending = clarification_store.get(clarify_request.clarificationId)
+    if pending is None:
+        raise HTTPException(status_code=404, detail="확인 요청을 찾을 수 없거나 만료되었습니다")
+    if clarify_request.option not in pending['options']:
+        raise HTTPException(status_code=422, detail=f"선택지는 {', '.join(pending['options'])} 중 하나여야 합니다")
+    try:
+        parsed_data = apply_clarification(pending, clarify_request.option)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    # 다른 워커가 같은 질문에 먼저 응답했으면 저장이 두 번 되지 않도록
+    if not clarification_store.resolve(clarify_request.clarificationId):
+        raise HTTPException(status_code=404, detail="확인 요청을 찾을 수 없거나 만료되었습니다")
+    print(f"[확인 응답] {clarify_request.option}")
+
+    # 카테고리로 일정을 골랐는데 시간이 애매하면 한 번 더 확인
+    hour = detect_ambiguous_hour(parsed_data) if pending.get('ambiguous_time') is None else None
+    if hour is not None:
+        response = build_clarification_response({
+            'raw_response': pending['raw_response'],
+            'parsed_data': parsed_data,
+            'clarification_question': f"{hour}시가 오전인가요, 오후인가요?",
+            'clarification_options': ["오전", "오후"],
+            'ambiguous_time': hour,
+        }, pending['duplicate_count'])
+    else:
+        await run_in_threadpool(save_extracted_records, parsed_data)
+        response = build_completed_response(parsed_data, pending['raw_response'], pending['duplicate_count'])
+    return encode_response(http_request, response)
+
+
+@app.get("/api/images/{digest}")
+async def get_image(digest: str):
+    """contextData에서 분리 저장된 이미지(Base64 데이터 URL)를 해시로 조회"""
+    if not re.fullmatch(r'[0-9a-f]{64}', digest):
+        raise HTTPException(status_code=400, detail="잘못된 이미지 해시입니다")
+    data = await run_in_threadpool(image_store.read, digest)
+    if data is None:
+        raise HTTPException(status_code=404, detail="이미지를 찾을 수 없습니다")
+    return Response(content=data, media_type="text/plain")
+
+
+def require_record_store() -> RecordStore:
+    if record_store is None:
+        raise HTTPException(status_code=503, detail="서버 저장소가 비활성화되어 있습니다 (RECORD_STORE_PATH 미설정)")
+    # 다른 워커가 쓴 레코드가 이 워커의 인덱스 조회 결과에 바로 보이도록 (변경 없으면 PRAGMA 한 번)
+    record_store.refresh_if_changed()
+    return record_store
+
+
+@app.get("/api/records/{kind}")
+def list_records(kind: RecordKind, start: Optional[str] = None, end: Optional[str] = None,
+                 type: Optional[str] = None, category: Optional[str] = None, group: Optional[str] = None,
+                 limit: int = 100, offset: int = 0):
+    """레코드 조회 (날짜 범위 YYYY-MM-DD, 종류/카테고리/그룹 필터)"""
+    store = require_record_store()
+    return store.query(kind, start=start, end=end, type=type, category=category, group=group,
+                       limit=min(limit, 1000), offset=offset)
+
+
+@app.get("/api/records/{kind}/{record_id}")
+def get_record(kind: RecordKind, record_id: str):
+    record = require_record_store().get(kind, record_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="레코드를 찾을 수 없습니다")
+    return record
+
+
+@app.post("/api/records/{kind}")
+def create_records(kind: RecordKind, payload: Union[Dict[str, Any], List[Dict[str, Any]]]):
+    """레코드 추가 (배열로 보내면 일괄 추가 - LocalStorage 데이터 이전용)"""
+    store = require_record_store()
+    try:
+        if isinstance(payload, list):
+            return store.add_many(kind, payload)
+        return store.add(kind, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"레코드 형식 오류: {str(e)}")
+
+
+@app.patch("/api/records/{kind}/{record_id}")
+def update_record(kind: RecordKind, record_id: str, fields: Dict[str, Any]):
+    """일부 필드 수정 (DataModification의 fieldsToUpdate 형태)"""
+    store = require_record_store()
+    try:
+        record = store.update(kind, record_id, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"레코드 형식 오류: {str(e)}")
+    if record is None:
+        raise HTTPException(status_code=404, detail="레코드를 찾을 수 없습니다")
+    return record
+
+
+@app.delete("/api/records/{kind}/{record_id}")
+def delete_record(kind: RecordKind, record_id: str):
+    record = require_record_store().delete(kind, record_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="레코드를 찾을 수 없습니다")
+    return record
+
+
+@app.get("/api/analytics/expenses")
+def expense_analytics(start: Optional[str] = None, end: Optional[str] = None,
+                      group_by: Literal['day', 'month', 'category', 'type'] = 'month',
+                      type: Optional[Literal['expense', 'income']] = None):
+    """가계부 기간별 집계 (증분 집계 버킷 기반, 원본 행 스캔 없음)"""
+    require_record_store()
+    # 요청 날짜만 422로 검증 (집계 데이터 문제는 클라이언트 오류가 아님)
+    try:
+        for value in (start, end):
+            if value is not None:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise HTTPException(status_code=422, detail="날짜는 YYYY-MM-DD 형식이어야 합니다")
+    groups = expense_rollups.summarize(start, end, group_by, type)
+    return {'start': start, 'end': end, 'groupBy': group_by, 'groups': groups}
+
+
+@app.get("/api/analytics/budget")
+def budget_status(monthlyLimit: float, month: Optional[str] = None):
+    """해당 월(기본: 이번 달, KST) 지출이 월 예산을 넘었는지 확인"""
+    require_record_store()
+    month = month or current_kst().strftime('%Y-%m')
+    return expense_rollups.budget_status(month, monthlyLimit)
+
+
+@app.get("/api/calendar")
+def calendar_range(start: str, end: str, limit: int = 500):
+    """기간 내 일정 조회 (반복 일정은 구간 안에서만 전개, dday는 오늘 기준 남은 일수)"""
+    require_record_store()
+    try:
+        occurrences = calendar_index.occurrences(_parse_day(start), _parse_day(end))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="날짜는 YYYY-MM-DD 형식이어야 합니다")
+    return list(itertools.islice(occurrences, min(limit, 5000)))
+
+
+@app.post("/api/calendar/conflicts")
+def calendar_conflicts(item: ScheduleRecord):
+    """새 일정(반복 포함)과 시간이 겹치는 기존 일정 확인"""
+    require_record_store()
+    conflicts = calendar_index.conflicts(item.model_dump())
+    return {'hasConflict': bool(conflicts), 'conflicts': conflicts}
+
+
+@app.get("/api/notifications/settings")
+def get_notification_settings():
+    """알림 설정 조회"""
+    return notification_scheduler.settings
+
+
+@app.put("/api/notifications/settings")
+def update_notification_settings(settings: NotificationSettings):
+    """알림 설정 변경 (예산 한도가 바뀌면 이번 달 지출을 바로 다시 확인)"""
+    require_record_store()
+    notification_scheduler.update_settings(settings)
+    return notification_scheduler.settings
+
+
+@app.get("/api/notifications/due")
+def pull_notifications():
+    """발생한 알림(AppNotification 형태)을 가져감 - 한 번 가져간 알림은 다시 반환하지 않음"""
+    require_record_store()
+    return notification_scheduler.pull()
+
+
+@app.get("/api/search")
+def search_records(q: str, kinds: Optional[str] = None, fields: Optional[str] = None,
+                   start: Optional[str] = None, end: Optional[str] = None, limit: int = 20):
+    """
+    개인 데이터 통합 검색 (연락처 이름/전화/이메일, 일정 제목, 가계부 항목, 메모 본문)
+    kinds/fields는 쉼표로 구분, start/end(YYYY-MM-DD)는 날짜가 있는 레코드에만 적용
+    """
+    require_record_store()
+    kind_list = kinds.split(',') if kinds else None
+    field_list = fields.split(',') if fields else None
+    if kind_list and any(kind not in SEARCH_FIELDS for kind in kind_list):
+        raise HTTPException(status_code=422, detail=f"kinds는 {', '.join(SEARCH_FIELDS)} 중에서 선택하세요")
+    if field_list and any(field not in SEARCH_FIELD_CODES for field in field_list):
+        raise HTTPException(status_code=422, detail=f"fields는 {', '.join(SEARCH_FIELD_CODES)} 중에서 선택하세요")
+
+    started = time.perf_counter()
+    results = search_index.search(q, kind_list, field_list, start, end, min(limit, 200))
+    return {
+        'query': q,
+        'results': results,
+        'tookMs': round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token or '', ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
+
+
+class ProfileRequest(BaseModel):
+    count: int = Field(default=10, ge=1, le=1000)
+    mode: Literal['cprofile', 'stack'] = 'cprofile'
+    torch: bool = False             # model.generate를 PyTorch 프로파일러로 감쌈
+    intervalMs: float = Field(default=5.0, gt=0)  # stack 모드 샘플링 간격
+
+
+@app.post("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def start_profiling(profile_request: ProfileRequest):
+    """다음 N개의 /api/process 호출 프로파일링 시작 (진행 중인 세션은 대체됨)"""
+    session = request_profiler.arm(
+        profile_request.count, profile_request.mode, profile_request.torch, profile_request.intervalMs
+    )
+    return session.summary()
+
+
+@app.delete("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def stop_profiling():
+    request_profiler.disarm()
+    return {"armed": False}
+
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    return {"armed": request_profiler.armed, "sessions": request_profiler.sessions()}
+
+
+@app.get("/api/admin/profile/{session_id}", dependencies=[Depends(require_admin)])
+async def download_profile(session_id: str, format: Literal['pstats', 'collapsed', 'torch'] = 'pstats'):
+    """
+    프로파일 결과 다운로드
+    - pstats: cProfile 결과 (snakeviz, python -m pstats)
+    - collapsed: 스택 샘플링 결과 (flamegraph.pl, speedscope)
+    - torch: model.generate 연산자별 타이밍 표
+    """
+    session = request_profiler.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="프로파일 세션을 찾을 수 없습니다")
+
+    if format == 'pstats':
+        if not session.profiles:
+            raise HTTPException(status_code=404, detail="cProfile 결과가 없습니다")
+        content = await run_in_threadpool(RequestProfiler.export_pstats, session)
+        media_type = "application/octet-stream"
+    elif format == 'collapsed':
+        if not session.stacks:
+            raise HTTPException(status_code=404, detail="스택 샘플링 결과가 없습니다")
+        content = RequestProfiler.export_collapsed(session)
+        media_type = "text/plain"
+    else:
+        if not session.torch_tables:
+            raise HTTPException(status_code=404, detail="PyTorch 프로파일 결과가 없습니다")
+        content = '\n\n'.join(session.torch_tables).encode()
+        media_type = "text/plain"
+
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="profile-{session_id}.{format}"'}
+    )
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """운영 지표 (알림/대시보드 수집용)"""
+    return {
+        "admission": admission.snapshot(),
+        "tenants": admission.tenant_snapshot(),
+        "generation_cache": generation_cache.snapshot() if generation_cache else None,
+        "record_store": record_store.snapshot() if record_store else None,
+        "frozen_clock": FROZEN_CLOCK_ENABLED,
+        "extracted_records": extracted_record_counters,
+        "dedup_index_size": len(dedup_index),
+        "image_store": image_store.snapshot(),
+        "search_index": search_index.snapshot(),
+        "clarification_store": clarification_store.snapshot(),
+        "escalation": escalation_client.snapshot(),
+        "router": learned_router.snapshot(),
+        "notifications": notification_scheduler.snapshot(),
+        "template_cache": template_cache.snapshot() if template_cache else None,
+        "captured_requests": traffic_recorder.captured
+    }
+
+
 @app.get("/api/health")
 async def health_check():
     """서버 상태 확인"""
     return {
         "status": "healthy",
         "model": "local-lora-gpt2",
-        "adapter_path": lora_adapter_path
+        "adapter_path": lora_adapter_path,
+        "draft_model": DRAFT_MODEL_NAME if use_assisted_decoding() else None,
+        "cpu_layout": cpu_layout
     }
 
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    print("\n🚀 LifeONE Local Model Server Starting...")
-    print(f"📍 Server will run on: http://localhost:8000")
-    print(f"🤖 Model: GPT-2 + LoRA Fine-tuned")
-    print(f"📁 Adapter path: {lora_adapter_path}\n")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    parser = argparse.ArgumentParser(description="LifeONE 로컬 모델 서버")
+    parser.add_argument("--fd", type=int, default=None, help="launcher.py가 넘겨준 리스닝 소켓 fd")
+    args = parser.parse_args()
+
+    if args.fd is not None:
+        # launcher.py 워커 모드: 부모가 연 소켓을 공유
+        uvicorn.run(app, fd=args.fd)
+    else:
+        print("\n🚀 LifeONE Local Model Server Starting...")
+        print(f"📍 Server will run on: http://localhost:8000")
+        print(f"🤖 Model: GPT-2 + LoRA Fine-tuned")
+        print(f"📁 Adapter path: {lora_adapter_path}\n")
+        uvicorn.run(app, host="0.0.0.0", port=8000)
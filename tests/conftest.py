@@ -0,0 +1,57 @@
+"""
+server.py 테스트 공통 설정
+서버 모듈은 불러올 때 환경 변수로 저장소/캐시 경로를 정하므로, import 전에 임시 디렉터리로 지정
+(모델은 server.py와 같이 저장소 루트의 ./lora_finetuned에서 읽으므로 루트에서 pytest 실행)
+"""
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TEST_DIR = tempfile.mkdtemp(prefix="lifeone-test-")
+os.environ.update({
+    "RECORD_STORE_PATH": os.path.join(TEST_DIR, "records.sqlite3"),
+    "IMAGE_STORE_DIR": os.path.join(TEST_DIR, "image_store"),
+    "GENERATION_CACHE_PATH": "",
+    "ROUTER_MODE": "off",
+    "ROUTING_LOG_PATH": "",
+    "CAPTURE_PATH": "",
+    "ESCALATION_URL": "",
+})
+
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def model_output(monkeypatch):
+    """
+    모델 생성을 고정 응답으로 대체. 반환된 함수로 응답(dict면 JSON으로 직렬화)을 지정하고,
+    모델에 전달된 입력(구간)은 .texts에 쌓임
+    """
+    class ModelOutput:
+        def __init__(self):
+            self.response = ""
+            self.texts = []
+
+        def __call__(self, response):
+            self.response = json.dumps(response, ensure_ascii=False) if isinstance(response, dict) else response
+
+        def generate(self, texts, current_time):
+            self.texts.extend(texts)
+            return [self.response for _ in texts]
+
+    output = ModelOutput()
+    monkeypatch.setattr(server, "generate_responses", output.generate)
+    return output
@@ -0,0 +1,75 @@
+"""추론 부하 제어 (user-028, user-043)"""
+import asyncio
+
+import pytest
+
+import server
+
+
+def make_controller():
+    return server.AdmissionController(1, 8, 8, 40, 4, 2)
+
+
+async def hold(controller, tenant, release, order):
+    async with controller.slot("입력", tenant):
+        order.append(tenant)
+        await release.wait()
+
+
+def test_waiter_cancelled_in_same_iteration_is_skipped():
+    async def scenario():
+        controller = make_controller()
+        release, done = asyncio.Event(), asyncio.Event()
+        done.set()
+        order = []
+        holder = asyncio.create_task(hold(controller, "a", release, order))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(hold(controller, "b", done, order))
+        waiting = asyncio.create_task(hold(controller, "c", done, order))
+        await asyncio.sleep(0)
+        assert controller.queued == 2
+
+        # holder가 슬롯을 넘기는 시점에 b는 이미 취소됐지만 except 블록은 아직 실행 전
+        release.set()
+        cancelled.cancel()
+        await asyncio.gather(holder, waiting)
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return controller, order
+
+    controller, order = asyncio.run(scenario())
+    assert order == ["a", "c"]
+    assert controller.in_flight == 0 and controller.queued == 0
+
+
+def test_slot_handed_then_cancelled_is_passed_on():
+    async def scenario():
+        controller = make_controller()
+        release, done = asyncio.Event(), asyncio.Event()
+        done.set()
+        order = []
+        holder = asyncio.create_task(hold(controller, "a", release, order))
+        await asyncio.sleep(0)
+        handed = asyncio.create_task(hold(controller, "b", done, order))
+        waiting = asyncio.create_task(hold(controller, "c", done, order))
+        await asyncio.sleep(0)
+
+        release.set()
+        await asyncio.sleep(0)  # holder가 b에게 슬롯을 넘김
+        handed.cancel()
+        await asyncio.gather(holder, waiting)
+        with pytest.raises(asyncio.CancelledError):
+            await handed
+        return controller, order
+
+    controller, order = asyncio.run(scenario())
+    assert order == ["a", "c"]
+    assert controller.in_flight == 0 and controller.queued == 0
+
+
+def test_request_class_header_needs_trusted_tenant(monkeypatch):
+    pasted = "\n".join(["점심 8000원"] * 5)
+    assert server.classify_request(pasted, "interactive", "user:anyone") == "bulk"
+    assert server.classify_request("점심 8000원", "bulk", "user:anyone") == "bulk"
+    monkeypatch.setattr(server, "REQUEST_CLASS_TRUSTED_TENANTS", {"user:importer"})
+    assert server.classify_request(pasted, "interactive", "user:importer") == "interactive"
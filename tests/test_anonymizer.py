@@ -0,0 +1,59 @@
+"""캡처/라우팅 로그 가명 처리 (user-039, user-044)"""
+import re
+from datetime import date, datetime
+
+import pytest
+
+import server
+
+CURRENT_TIME = {'date': '2024-03-04', 'time': '09:00', 'datetime': '2024-03-04 09:00', 'weekday': '월'}
+EXACT_FIELDS = ('category', 'type', 'group', 'date', 'time')
+
+
+def shape(value, key=None):
+    """숫자와 한글 음절을 자리표시로 바꾼 파싱 결과 (카테고리/유형/날짜 등은 그대로 비교)"""
+    if isinstance(value, dict):
+        return {k: shape(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [shape(v) for v in value]
+    if isinstance(value, str) and key not in EXACT_FIELDS:
+        return re.sub(r'[가-힣]', '가', re.sub(r'\d', '0', value))
+    return value
+
+
+@pytest.mark.parametrize("text", [
+    "김민수 번호 010-1234-5678 저장해줘",
+    "연락처에 이영희 01098765432 추가해줘",
+    "박철수 010 1111 2222 전화번호 저장",
+    "연락처 김철수 kim@test.com 010-2222-3333 저장",
+    "메모 계좌번호 110123456789 기록해줘",
+    "오늘 점심 김밥 5000원 먹었어",
+    "내일 3시 홍길동이랑 회의 있어",
+])
+def test_parse_result_is_unchanged_by_anonymization(text):
+    anonymized = server.TextAnonymizer("salt").anonymize(text)
+    before = server.fallback_text_parsing(text, CURRENT_TIME)
+    after = server.fallback_text_parsing(anonymized, CURRENT_TIME)
+    assert shape(after) == shape(before)
+
+
+def test_keywords_kept_and_names_replaced():
+    anonymized = server.TextAnonymizer("salt").anonymize("김민수 번호 010-1234-5678 저장해줘")
+    assert "번호" in anonymized and "저장해줘" in anonymized
+    assert "김민수" not in anonymized and "1234-5678" not in anonymized
+
+
+def test_unformatted_phone_is_replaced_once():
+    anonymizer = server.TextAnonymizer("salt")
+    anonymized = anonymizer.anonymize("연락처 01012345678")
+    phone = anonymized.split()[-1]
+    assert len(phone) == 11 and phone.startswith("010") and phone != "01012345678"
+    assert anonymizer.anonymize("연락처 01012345678") == anonymized
+
+
+def test_notification_day_follows_frozen_clock():
+    token = server.frozen_now.set(server.KST.localize(datetime(2024, 1, 2, 10, 0)))
+    try:
+        assert server.NotificationScheduler._today() == date(2024, 1, 2)
+    finally:
+        server.frozen_now.reset(token)
@@ -0,0 +1,92 @@
+"""일정 날짜 인덱스와 반복 일정 (user-033)"""
+import json
+import threading
+from datetime import date
+
+import pytest
+
+import server
+
+
+def run_with_timeout(fn, *args, seconds=5):
+    """무한 루프 회귀를 테스트 실패로 잡기 위해 별도 스레드에서 실행"""
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('value', fn(*args)), daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert not thread.is_alive(), f"{fn.__name__}이(가) {seconds}초 안에 끝나지 않음"
+    return result.get('value')
+
+
+def test_weekly_and_monthly_expansion():
+    weekly = server.RecurrenceRule(freq="weekly", weekdays=[0, 2])
+    days = list(server.iter_occurrences(weekly, date(2024, 1, 1), date(2024, 1, 1), date(2024, 1, 14)))
+    assert days == [date(2024, 1, 1), date(2024, 1, 3), date(2024, 1, 8), date(2024, 1, 10)]
+
+    monthly = server.RecurrenceRule(freq="monthly", monthDay=31)
+    days = list(server.iter_occurrences(monthly, date(2024, 1, 31), date(2024, 1, 1), date(2024, 5, 31)))
+    assert days == [date(2024, 1, 31), date(2024, 3, 31), date(2024, 5, 31)]
+
+    limited = server.RecurrenceRule(freq="daily", count=3)
+    assert len(list(server.iter_occurrences(limited, date(2024, 1, 1), date(2024, 1, 1), date(2024, 12, 31)))) == 3
+
+
+def test_rule_with_no_possible_occurrence_terminates():
+    never = server.RecurrenceRule(freq="monthly", interval=12, monthDay=31)
+    assert run_with_timeout(server.next_occurrence, never, date(2024, 2, 1), date(2024, 2, 1)) is None
+    leap = server.RecurrenceRule(freq="yearly", month=2, monthDay=29)
+    assert run_with_timeout(server.next_occurrence, leap, date(2024, 2, 29), date(2024, 3, 1)) == date(2028, 2, 29)
+
+
+@pytest.mark.parametrize("fields", [{"monthDay": 35}, {"month": 13}, {"weekdays": [7]}, {"count": 0}])
+def test_invalid_rules_are_rejected(fields):
+    with pytest.raises(ValueError):
+        server.RecurrenceRule(freq="monthly", **fields)
+
+
+@pytest.mark.parametrize("text", ["매월 35일 회의 있어", "매년 13월 1일 기념일 있어", "매년 2월 30일 회의 있어"])
+def test_impossible_recurrence_phrases_do_not_hang(text):
+    result = run_with_timeout(server.fallback_text_parsing, text, server.get_current_kst_datetime())
+    assert all("recurrence" not in item for item in result["schedule"])
+
+
+def test_recurring_phrase_is_captured():
+    result = server.fallback_text_parsing("매주 월요일 10시 팀 회의 있어", server.get_current_kst_datetime())
+    assert result["schedule"][0]["recurrence"]["weekdays"] == [0]
+
+
+def test_range_query_merges_single_and_recurring():
+    index = server.CalendarIndex()
+    index.rebuild([
+        {"id": "a", "title": "단발", "date": "2024-01-03", "time": "09:00"},
+        {"id": "b", "title": "주간", "date": "2024-01-01", "time": "10:00",
+         "recurrence": {"freq": "weekly", "interval": 1, "weekdays": [0]}},
+    ])
+    found = [(item["title"], item["date"]) for item in index.occurrences(date(2024, 1, 1), date(2024, 1, 8))]
+    assert found == [("주간", "2024-01-01"), ("단발", "2024-01-03"), ("주간", "2024-01-08")]
+
+    conflicts = index.conflicts({"title": "새 일정", "date": "2024-01-15", "time": "10:30"})
+    assert [item["title"] for item in conflicts] == ["주간"]
+
+
+def test_conflict_endpoint_rejects_invalid_rule(client):
+    response = client.post("/api/calendar/conflicts", json={
+        "title": "잘못된 규칙", "date": "2024-01-01", "time": "10:00",
+        "recurrence": {"freq": "monthly", "monthDay": 35},
+    })
+    assert response.status_code == 422
+
+
+def test_stored_invalid_rule_does_not_break_rebuild(tmp_path):
+    store = server.RecordStore(str(tmp_path / "records.sqlite3"))
+    store._conn.execute(
+        'INSERT INTO schedule (id, title, date, time, recurrence) VALUES (?, ?, ?, ?, ?)',
+        ("bad", "예전 규칙", "2024-01-01", "10:00", json.dumps({"freq": "monthly", "monthDay": 35})),
+    )
+    store._conn.commit()
+
+    records = run_with_timeout(lambda: list(store.iter_all("schedule")))
+    assert records[0]["recurrence"] is None
+    index = server.CalendarIndex()
+    index.rebuild(records)
+    assert [item["id"] for item in index.occurrences(date(2024, 1, 1), date(2024, 1, 31))] == ["bad"]
@@ -0,0 +1,65 @@
+"""확인 질문 보관소와 /api/clarify (user-037)"""
+import server
+
+
+def test_pending_clarification_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "clarifications.sqlite3")
+    worker_a = server.ClarificationStore(path, 600, 100)
+    worker_b = server.ClarificationStore(path, 600, 100)
+
+    clarification_id = worker_a.put({'parsed_data': {'schedule': []}, 'options': ['오전', '오후']})
+    assert worker_b.get(clarification_id)['options'] == ['오전', '오후']
+    assert worker_b.resolve(clarification_id) is True
+    assert worker_a.resolve(clarification_id) is False
+    assert worker_a.get(clarification_id) is None
+
+
+def test_expiry_and_eviction(tmp_path):
+    expired = server.ClarificationStore(':memory:', 0, 100)
+    assert expired.get(expired.put({'options': []})) is None
+
+    bounded = server.ClarificationStore(':memory:', 600, 2)
+    first = bounded.put({'n': 1})
+    bounded.put({'n': 2})
+    bounded.put({'n': 3})
+    assert bounded.get(first) is None
+    assert bounded.snapshot()['pending'] == 2
+
+
+def ambiguous_result(options):
+    return {
+        'raw_response': '{}',
+        'parsed_data': {
+            'contacts': [{'name': '김민수', 'phone': '010-1111-2222'}],
+            'schedule': [{'title': '김민수 미팅', 'date': '2024-01-02'}],
+            'expenses': [], 'diary': [],
+        },
+        'clarification_question': '어디에 저장할까요?',
+        'clarification_options': options,
+    }
+
+
+def test_unknown_model_options_are_dropped(client):
+    response = server.build_clarification_response(ambiguous_result(['연락처', '어딘가']), 0)
+    assert response.clarificationOptions == ['연락처']
+
+    rejected = client.post("/api/clarify", json={'clarificationId': response.clarificationId, 'option': '어딘가'})
+    assert rejected.status_code == 422
+
+    accepted = client.post("/api/clarify", json={'clarificationId': response.clarificationId, 'option': '연락처'})
+    assert accepted.status_code == 200
+    assert accepted.json()['dataExtraction']['schedule'] == []
+
+
+def test_options_fall_back_to_parsed_categories():
+    response = server.build_clarification_response(ambiguous_result(['엉뚱한 선택지']), 0)
+    assert response.clarificationOptions == ['연락처', '일정']
+
+
+def test_stored_unknown_option_is_422_not_500(client):
+    clarification_id = server.clarification_store.put({
+        'parsed_data': ambiguous_result([])['parsed_data'], 'raw_response': '{}',
+        'ambiguous_time': None, 'options': ['어딘가'], 'duplicate_count': 0,
+    })
+    response = client.post("/api/clarify", json={'clarificationId': clarification_id, 'option': '어딘가'})
+    assert response.status_code == 422
@@ -0,0 +1,37 @@
+"""추출 레코드 중복 표시 (user-032)"""
+import server
+
+
+def test_index_counts_records_with_the_same_fingerprint():
+    index = server.DedupIndex()
+    expense = {"item": "국수", "amount": 5000.0, "date": "2024-01-01T12:00"}
+    index.on_change("expenses", None, expense)
+    index.on_change("expenses", None, dict(expense, id="other"))
+    assert index.contains("expenses", {"item": " 국수 ", "amount": 5000, "date": "2024-01-01"})
+
+    # 같은 지문이 하나 남아 있는 동안은 중복
+    index.on_change("expenses", expense, None)
+    assert index.contains("expenses", expense)
+    index.on_change("expenses", expense, dict(expense, amount=6000))
+    assert not index.contains("expenses", expense)
+
+
+def test_contact_without_phone_or_email_is_never_duplicate():
+    index = server.DedupIndex()
+    index.add("contacts", {"name": "김민수"})
+    assert len(index) == 0
+    assert not index.contains("contacts", {"name": "김민수"})
+
+
+def test_mark_duplicates_uses_context_and_earlier_records():
+    context = server.ContextData.model_validate({
+        "contacts": [{"name": "김민수", "phone": "010-1234-5678"}],
+    })
+    parsed = {
+        "contacts": [{"name": "민수", "phone": "01012345678"}],
+        "diary": [{"date": "2024-01-01", "entry": "중복 표시 테스트 메모"},
+                  {"date": "2024-01-02", "entry": "중복 표시 테스트 메모"}],
+    }
+    assert server.mark_duplicates(parsed, context) == 2
+    assert parsed["contacts"][0]["isDuplicate"] is True
+    assert [item["isDuplicate"] for item in parsed["diary"]] == [False, True]
@@ -0,0 +1,49 @@
+"""초안 모델 보조 디코딩 (user-040)"""
+from types import SimpleNamespace
+
+import server
+
+
+class RecordingModel:
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, input_ids=None, **kwargs):
+        self.calls.append(kwargs)
+        return [list(row) for row in input_ids]
+
+
+def fake_model(vocab_size):
+    return SimpleNamespace(config=SimpleNamespace(vocab_size=vocab_size), generation_config=SimpleNamespace(),
+                           eval=lambda: None)
+
+
+def test_draft_with_different_vocabulary_is_disabled(monkeypatch):
+    monkeypatch.setattr(server, "base_model", fake_model(50257))
+    monkeypatch.setattr(server.GPT2LMHeadModel, "from_pretrained", classmethod(lambda cls, name: fake_model(32000)))
+    assert server.load_draft_model("draft") is None
+    assert server.load_draft_model("") is None
+
+
+def test_draft_uses_heuristic_schedule(monkeypatch):
+    monkeypatch.setattr(server, "base_model", fake_model(50257))
+    monkeypatch.setattr(server.GPT2LMHeadModel, "from_pretrained", classmethod(lambda cls, name: fake_model(50257)))
+    draft = server.load_draft_model("draft")
+    assert draft.generation_config.num_assistant_tokens == server.DRAFT_NUM_TOKENS
+    assert draft.generation_config.num_assistant_tokens_schedule == "heuristic"
+
+
+def test_assistant_model_only_for_single_greedy_prompt(monkeypatch):
+    model, draft = RecordingModel(), object()
+    monkeypatch.setattr(server, "model", model)
+    monkeypatch.setattr(server, "draft_model", draft)
+    monkeypatch.setitem(server.GENERATION_PARAMS, "do_sample", False)
+    server._generate_batch(["하나"])
+    server._generate_batch(["하나", "둘"])
+    assert model.calls[0]["assistant_model"] is draft
+    assert "assistant_model" not in model.calls[1]
+
+    # 샘플링에서는 보조 디코딩 출력이 달라지므로 사용하지 않음
+    monkeypatch.setitem(server.GENERATION_PARAMS, "do_sample", True)
+    server._generate_batch(["하나"])
+    assert "assistant_model" not in model.calls[2]
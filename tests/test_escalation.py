@@ -0,0 +1,63 @@
+"""원격 모델 위임 응답 변환 (user-038)"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import server
+
+
+def run_escalation(monkeypatch, remote_body, text="내일 회의 일정을 금요일로 바꿔줘"):
+    """remote_body를 돌려주는 가짜 원격 모델로 escalate_or_fallback 실행"""
+    remote = FastAPI()
+    calls = []
+
+    @remote.post("/v1/process")
+    async def process(payload: dict):
+        calls.append(payload)
+        return remote_body
+
+    async def scenario():
+        client = server.EscalationClient("http://remote/v1/process", "", 4, 4, 1.0, 5.0, 0, 0.2, 1.0)
+        client._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=remote))
+        client._semaphore = asyncio.Semaphore(4)
+        monkeypatch.setattr(server, "escalation_client", client)
+        try:
+            return await server.escalate_or_fallback(server.ProcessRequest(text=text), "테스트")
+        finally:
+            await client.aclose()
+
+    return asyncio.run(scenario()), calls
+
+
+def test_modification_deletion_and_sources_pass_through(monkeypatch):
+    response, calls = run_escalation(monkeypatch, {
+        'answer': '변경했습니다',
+        'dataModification': {'schedule': [{'id': 's1', 'fieldsToUpdate': {'date': '2024-01-05'}}]},
+        'dataDeletion': {'diary': ['d1']},
+        'webSearchSources': [{'title': '출처', 'uri': 'https://example.com'}],
+        'usedModel': 'remote-model',
+    })
+    assert len(calls) == 1
+    assert response.canHandle is True
+    assert response.dataModification['schedule'][0]['fieldsToUpdate'] == {'date': '2024-01-05'}
+    assert response.dataModification['contacts'] == []
+    assert response.dataDeletion == {'contacts': [], 'schedule': [], 'expenses': [], 'diary': ['d1']}
+    assert response.webSearchSources[0]['uri'] == 'https://example.com'
+
+
+@pytest.mark.parametrize("body", [
+    {'answer': '', 'canHandle': False},
+    {'answer': '저장했습니다', 'dataExtraction': {'todos': [{'title': '할 일'}]}},
+])
+def test_unrepresentable_result_falls_back_to_client(monkeypatch, body):
+    response, _ = run_escalation(monkeypatch, body)
+    assert response.canHandle is False
+    assert response.usedModel == "gemini-fallback-required"
+
+
+def test_image_requests_are_not_escalated(monkeypatch):
+    response, calls = run_escalation(monkeypatch, {'answer': '지어낸 OCR 결과'}, text="이 영수증 가계부에 넣어줘")
+    assert calls == []
+    assert response.canHandle is False
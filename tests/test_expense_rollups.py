@@ -0,0 +1,76 @@
+"""가계부 증분 집계 (user-031)"""
+import server
+
+
+def expense(day, amount, record_type="expense", category="식비"):
+    return {"date": day, "item": "항목", "amount": amount, "type": record_type, "category": category}
+
+
+def test_rollups_follow_add_update_delete():
+    rollups = server.ExpenseRollups()
+    lunch = expense("2024-02-10", 9000)
+    rollups.on_change("expenses", None, lunch)
+    rollups.on_change("expenses", None, expense("2024-02-20", 3000, category="교통"))
+    rollups.on_change("expenses", None, expense("2024-03-01", 50000, "income", "급여"))
+    assert rollups.month_total("2024-02") == 12000
+
+    rollups.on_change("expenses", lunch, {**lunch, "amount": 10000})
+    assert rollups.month_total("2024-02") == 13000
+
+    by_category = rollups.summarize("2024-02-01", "2024-02-29", "category", "expense")
+    assert by_category["식비"]["expense"] == {"total": 10000, "count": 1}
+    assert by_category["교통"]["expense"] == {"total": 3000, "count": 1}
+
+    rollups.on_change("expenses", {**lunch, "amount": 10000}, None)
+    assert rollups.month_total("2024-02") == 3000
+
+
+def test_partial_month_ranges_use_day_buckets():
+    rollups = server.ExpenseRollups()
+    for day, amount in (("2024-01-31", 1), ("2024-02-01", 10), ("2024-02-15", 100), ("2024-03-01", 1000)):
+        rollups.on_change("expenses", None, expense(day, amount))
+    groups = rollups.summarize("2024-01-31", "2024-03-01", "month", "expense")
+    assert {month: group["expense"]["total"] for month, group in groups.items()} == {
+        "2024-01": 1, "2024-02": 110, "2024-03": 1000}
+
+
+def test_day_stays_in_default_range_while_other_type_remains():
+    rollups = server.ExpenseRollups()
+    salary = expense("2024-04-01", 100000, "income", "급여")
+    rollups.on_change("expenses", None, salary)
+    rollups.on_change("expenses", None, expense("2024-04-01", 5000))
+    rollups.on_change("expenses", None, expense("2024-04-10", 7000))
+
+    rollups.on_change("expenses", salary, None)
+    groups = rollups.summarize(group_by="day", record_type="expense")
+    assert groups["2024-04-01"]["expense"]["total"] == 5000
+
+
+def test_budget_status():
+    rollups = server.ExpenseRollups()
+    rollups.on_change("expenses", None, expense("2024-05-03", 120000))
+    status = rollups.budget_status("2024-05", 100000)
+    assert status["exceeded"] is True
+    assert status["remaining"] == -20000
+
+
+def test_process_feeds_rollups(client, model_output):
+    model_output({"expenses": [expense("2032-07-07", 4321)]})
+    client.post("/api/process", json={"text": "집계 테스트 4321원 지출"})
+    assert server.expense_rollups.month_total("2032-07") == 4321
+
+
+def test_unparsable_dates_are_left_out_of_the_default_range():
+    rollups = server.ExpenseRollups()
+    bad = expense("", 500)
+    rollups.rebuild([expense("2024-02-10", 9000), bad, expense("어제", 700)])
+    assert rollups.skipped == 2
+    assert list(rollups.summarize()) == ["2024-02"]
+
+    rollups.on_change("expenses", bad, {**bad, "date": "2024-02-11"})
+    assert rollups.summarize()["2024-02"]["expense"] == {"total": 9500, "count": 2}
+
+
+def test_analytics_rejects_only_bad_query_dates(client):
+    assert client.get("/api/analytics/expenses", params={"start": "어제"}).status_code == 422
+    assert client.get("/api/analytics/expenses").status_code == 200
@@ -0,0 +1,83 @@
+"""영속 생성 캐시와 시드 고정 생성 (user-029)"""
+import threading
+import time
+
+import server
+
+
+def test_cache_survives_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = server.GenerationCache(path, max_entries=100, memory_entries=10)
+    key = server.GenerationCache.make_key("오늘 국수 5000원", "2024-01-05", "adapter", {"do_sample": False})
+    cache.put(key, '{"expenses": []}')
+
+    reopened = server.GenerationCache(path, max_entries=100, memory_entries=10)
+    assert reopened.get(key) == '{"expenses": []}'
+
+
+def test_same_input_on_the_same_day_hits_regardless_of_minute(tmp_path, monkeypatch):
+    cache = server.GenerationCache(str(tmp_path / "cache.sqlite3"), max_entries=100, memory_entries=10)
+    monkeypatch.setattr(server, "generation_cache", cache)
+    monkeypatch.setitem(server.GENERATION_PARAMS, "do_sample", False)
+    generated = []
+
+    def fake_batch(prompts):
+        generated.extend(prompts)
+        return ['{"schedule": []}' for _ in prompts]
+
+    monkeypatch.setattr(server, "_generate_batch", fake_batch)
+    morning = {"datetime": "2024-01-05 09:00", "date": "2024-01-05", "weekday": "금요일"}
+    evening = {"datetime": "2024-01-05 21:37", "date": "2024-01-05", "weekday": "금요일"}
+    next_day = {"datetime": "2024-01-06 09:00", "date": "2024-01-06", "weekday": "토요일"}
+
+    server.generate_responses(["내일 3시 회의"], morning)
+    server.generate_responses(["내일 3시 회의"], evening)
+    assert len(generated) == 1
+    server.generate_responses(["내일 3시 회의"], next_day)
+    assert len(generated) == 2
+
+
+def test_seeded_generations_do_not_overlap(monkeypatch):
+    active = []
+    overlaps = []
+
+    class SlowModel:
+        def generate(self, input_ids=None, **kwargs):
+            active.append(1)
+            if len(active) > 1:
+                overlaps.append(len(active))
+            time.sleep(0.05)
+            active.pop()
+            return input_ids
+
+    monkeypatch.setattr(server, "model", SlowModel())
+    monkeypatch.setattr(server, "draft_model", None)
+    monkeypatch.setattr(server, "GENERATION_SEED", "7")
+    threads = [threading.Thread(target=server._generate_batch, args=(["안녕"],)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == []
+
+
+def test_seeded_sampling_caches_only_unbatched_generations(tmp_path, monkeypatch):
+    cache = server.GenerationCache(str(tmp_path / "cache.sqlite3"), max_entries=100, memory_entries=10)
+    monkeypatch.setattr(server, "generation_cache", cache)
+    monkeypatch.setitem(server.GENERATION_PARAMS, "do_sample", True)
+    monkeypatch.setattr(server, "GENERATION_SEED", "7")
+    monkeypatch.setattr(server, "count_tokens", lambda prompt: 10)
+    generated = []
+
+    def fake_batch(prompts):
+        generated.extend(prompts)
+        return ['{"schedule": []}' for _ in prompts]
+
+    monkeypatch.setattr(server, "_generate_batch", fake_batch)
+    now = {"datetime": "2024-01-05 09:00", "date": "2024-01-05", "weekday": "금요일"}
+
+    # 함께 배치된 결과는 혼자 생성할 때와 다를 수 있으므로 캐시하지 않음
+    server.generate_responses(["내일 3시 회의", "모레 회식"], now)
+    server.generate_responses(["내일 3시 회의"], now)
+    server.generate_responses(["내일 3시 회의"], now)
+    assert len(generated) == 3
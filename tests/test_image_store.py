@@ -0,0 +1,114 @@
+"""contextData 이미지 필드 분리 저장 (user-027)"""
+import json
+import os
+
+import msgpack
+import pytest
+
+import server
+
+IMAGE = "data:image/png;base64,iVBORw0KGgo/AAAANSUhEUgAA+/x=="
+
+
+def strip(body: bytes, chunk_size: int, store) -> bytes:
+    stripper = server.ImageFieldStripper(store)
+    out = bytearray()
+    for i in range(0, len(body), chunk_size):
+        out += stripper.feed(body[i:i + chunk_size])
+    out += stripper.close()
+    return bytes(out)
+
+
+def test_escaped_json_and_msgpack_store_the_same_image(tmp_path):
+    store = server.ImageStore(str(tmp_path), 1 << 20)
+    escaped = json.dumps({"expenses": [{"imageUrl": IMAGE}]}).replace("/", "\\/").encode()
+    assert b"\\/" in escaped
+
+    stripped = json.loads(strip(escaped, 7, store))
+    reference = stripped["expenses"][0]["imageUrl"]
+    assert reference == store.put(IMAGE.encode())
+    assert store.read(reference[len(server.IMAGE_REF_PREFIX):]) == IMAGE.encode()
+
+
+def test_chunk_boundaries_do_not_change_the_result(tmp_path):
+    store = server.ImageStore(str(tmp_path), 1 << 20)
+    body = json.dumps({"text": "영수증", "diary": [{"entry": "a\"b", "imageUrl": IMAGE + "é😀"}]},
+                      ensure_ascii=True).encode()
+    assert b"\\ud83d\\ude00" in body
+    expected = strip(body, len(body), store)
+    for chunk_size in range(1, 40):
+        assert strip(body, chunk_size, store) == expected
+    reference = json.loads(expected)["diary"][0]["imageUrl"]
+    value = store.read(reference[len(server.IMAGE_REF_PREFIX):])
+    assert value.decode() == IMAGE + "é😀"
+
+
+def test_unclosed_image_is_rejected_and_temp_file_removed(tmp_path):
+    store = server.ImageStore(str(tmp_path), 1 << 20)
+    stripper = server.ImageFieldStripper(store)
+    stripper.feed(b'{"imageUrl": "abc')
+    try:
+        stripper.close()
+        assert False, "닫히지 않은 문자열은 오류여야 함"
+    except ValueError:
+        pass
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("tmp-")]
+
+
+def test_store_evicts_least_recently_written_images(tmp_path):
+    store = server.ImageStore(str(tmp_path), 250)
+    first = store.put(b"a" * 100)
+    os.utime(store.path_for(first[len(server.IMAGE_REF_PREFIX):]), (1, 1))
+    second = store.put(b"b" * 100)
+    third = store.put(b"c" * 100)
+
+    assert store.read(first[len(server.IMAGE_REF_PREFIX):]) is None
+    assert store.read(second[len(server.IMAGE_REF_PREFIX):]) is not None
+    assert store.read(third[len(server.IMAGE_REF_PREFIX):]) is not None
+    assert store.snapshot()["bytes"] <= 250
+    assert store.evicted == 1
+
+
+def test_msgpack_images_are_served_by_reference(client):
+    context = {"diary": [{"date": "2024-01-01", "entry": "영수증 사진", "imageUrl": IMAGE}]}
+    request = server.ProcessRequest.model_validate(
+        msgpack.unpackb(msgpack.packb({"text": "x", "contextData": context}), object_hook=server._store_msgpack_image)
+    )
+    reference = request.contextData.diary[0].imageUrl
+    assert reference.startswith(server.IMAGE_REF_PREFIX)
+
+    response = client.get(f"/api/images/{reference[len(server.IMAGE_REF_PREFIX):]}")
+    assert response.status_code == 200
+    assert response.text == IMAGE
+
+
+def test_existing_image_is_not_rewritten(tmp_path):
+    store = server.ImageStore(str(tmp_path), 1 << 20)
+    reference = store.put(IMAGE.encode())
+    path = store.path_for(reference[len(server.IMAGE_REF_PREFIX):])
+    inode = os.stat(path).st_ino
+    assert strip(json.dumps({"imageUrl": IMAGE}).encode(), 5, store) == json.dumps({"imageUrl": reference}).encode()
+    assert os.stat(path).st_ino == inode
+    assert store.snapshot()["bytes"] == len(IMAGE)
+
+
+def test_image_size_limits(tmp_path):
+    store = server.ImageStore(str(tmp_path), 1 << 20)
+    with pytest.raises(server.PayloadTooLarge):
+        server.ImageFieldStripper(store, 100, 1000).feed(json.dumps({"imageUrl": "x" * 101}).encode())
+    # 하나씩은 상한 안이지만 요청 합계가 넘는 경우
+    stripper = server.ImageFieldStripper(store, 100, 150)
+    with pytest.raises(server.PayloadTooLarge):
+        stripper.feed(json.dumps([{"imageUrl": "a" * 80}, {"imageUrl": "b" * 80}]).encode())
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("tmp-")]
+
+
+def test_oversized_image_is_413(client, monkeypatch):
+    monkeypatch.setattr(server, "MAX_IMAGE_BYTES", 1000)
+    response = client.post("/api/process", json={"text": "x", "contextData": {
+        "diary": [{"date": "2024-01-01", "entry": "사진", "imageUrl": "x" * 5000}],
+    }})
+    assert response.status_code == 413
+    body = msgpack.packb({"text": "x", "contextData": {"diary": [{"entry": "사진", "imageUrl": "x" * 5000}]}})
+    response = client.post("/api/process", content=body, headers={"content-type": server.MSGPACK_MEDIA_TYPE})
+    assert response.status_code == 413
@@ -0,0 +1,16 @@
+"""멀티 워커 실행기 (user-036)"""
+import launcher
+
+
+def test_multiple_workers_share_a_clarification_store():
+    assert launcher.shared_store_env(3, {}) == {
+        'CLARIFICATION_STORE_PATH': launcher.DEFAULT_CLARIFICATION_STORE_PATH}
+    # 워커 하나이거나 저장 경로가 이미 있으면 그대로
+    assert launcher.shared_store_env(1, {}) == {}
+    assert launcher.shared_store_env(3, {'RECORD_STORE_PATH': '/data/records.sqlite3'}) == {}
+    assert launcher.shared_store_env(3, {'CLARIFICATION_STORE_PATH': '/data/clarify.sqlite3'}) == {}
+
+
+def test_explicitly_empty_path_only_warns(capsys):
+    assert launcher.shared_store_env(2, {'CLARIFICATION_STORE_PATH': ''}) == {}
+    assert "경고" in capsys.readouterr().out
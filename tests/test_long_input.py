@@ -0,0 +1,31 @@
+"""긴 입력 구간 분할 (user-045)"""
+import server
+
+CURRENT_TIME = {'date': '2024-03-04', 'time': '09:00', 'datetime': '2024-03-04 09:00', 'weekday': '월'}
+# 첫 문장의 날짜가 둘째 문장의 지출에 걸리는 약 250자 입력
+SHARED_DATE_TEXT = (
+    "내일 오전에는 회사 근처 카페에서 오랜만에 대학 동기들과 만나서 그동안 밀린 이야기를 천천히 나누고, "
+    "오후에는 다 같이 근처 공원을 산책하면서 다음 달 여행 계획도 함께 정하기로 했고 저녁에는 각자 집으로 "
+    "돌아가 쉬기로 했다. " * 2
+    + "그날 점심으로 먹은 칼국수 값 12000원은 내가 계산했으니 가계부에 지출로 꼭 기록해줘."
+)
+
+
+def test_input_within_budget_is_not_split(client, model_output, monkeypatch):
+    monkeypatch.setattr(server, "PROMPT_MAX_TOKENS", 2048)
+    assert len(SHARED_DATE_TEXT) > 250
+    model_output({"expenses": [{"date": "2024-03-05", "item": "칼국수", "amount": 12000, "type": "expense"}]})
+    response = client.post("/api/process", json={"text": SHARED_DATE_TEXT}).json()
+    assert model_output.texts == [SHARED_DATE_TEXT]
+    [expense] = response["dataExtraction"]["expenses"]
+    assert (expense["date"], expense["amount"]) == ("2024-03-05", 12000)
+
+
+def test_over_budget_input_is_split_into_packed_segments(monkeypatch):
+    prompt_tokens = server.count_tokens(server.build_extraction_prompt('', CURRENT_TIME))
+    monkeypatch.setattr(server, "PROMPT_MAX_TOKENS", prompt_tokens + 120)
+    segments = server.split_long_input(SHARED_DATE_TEXT, CURRENT_TIME)
+    assert len(segments) > 1
+    assert all(server.count_tokens(segment) <= 120 for segment in segments)
+    # 짧은 문장은 한도 안에서 이웃 문장과 같은 구간에 모임
+    assert len(segments) < len(server.split_sentences(SHARED_DATE_TEXT, 120, server.count_tokens))
@@ -0,0 +1,83 @@
+"""워커 여러 개가 같은 저장소를 쓸 때 인덱스 동기화와 알림 리더 (user-036)"""
+from datetime import date
+
+import server
+
+
+def open_worker(path):
+    """워커 하나 분량: 같은 DB 파일에 대한 별도 연결 + 그 워커의 메모리 인덱스"""
+    store = server.RecordStore(path)
+    calendar = server.CalendarIndex()
+    calendar.rebuild(store.iter_all('schedule'))
+    store.add_listener(calendar.on_change, rebuild=lambda s: calendar.rebuild(s.iter_all('schedule')))
+    return store, calendar
+
+
+def test_other_worker_writes_trigger_rebuild(tmp_path):
+    path = str(tmp_path / "records.sqlite3")
+    store_a, calendar_a = open_worker(path)
+    store_b, calendar_b = open_worker(path)
+
+    store_a.add('schedule', {'id': 's1', 'title': '회의', 'date': '2024-01-02', 'time': '10:00'})
+    assert [item['id'] for item in calendar_a.occurrences(date(2024, 1, 1), date(2024, 1, 31))] == ['s1']
+    assert list(calendar_b.occurrences(date(2024, 1, 1), date(2024, 1, 31))) == []
+
+    assert store_b.refresh_if_changed() is True
+    assert [item['id'] for item in calendar_b.occurrences(date(2024, 1, 1), date(2024, 1, 31))] == ['s1']
+    assert store_b.refresh_if_changed() is False
+
+    # 자기 쓰기는 변경 알림으로 반영되므로 재구성하지 않음
+    store_a.delete('schedule', 's1')
+    assert store_a.refresh_if_changed() is False
+    assert store_b.refresh_if_changed() is True
+    assert list(calendar_b.occurrences(date(2024, 1, 1), date(2024, 1, 31))) == []
+
+
+def make_scheduler(tmp_path):
+    shared = server.NotificationOutbox(str(tmp_path / "notifications.sqlite3"), 100)
+    return server.NotificationScheduler(100, shared, str(tmp_path / "notify.lock"))
+
+
+def test_only_one_worker_leads_notifications(tmp_path):
+    store = server.RecordStore(str(tmp_path / "records.sqlite3"))
+    today = server.NotificationScheduler._today().isoformat()
+    store.add('schedule', {'id': 's1', 'title': '오늘 일정', 'date': today})
+
+    leader, follower = make_scheduler(tmp_path), make_scheduler(tmp_path)
+    assert leader.try_lead(store) is True
+    assert follower.try_lead(store) is False
+    assert follower.leader is False
+
+    # 리더가 만든 알림을 다른 워커에서 가져가도 한 번만 전달
+    assert leader.fire_due() == 1
+    delivered = follower.pull()
+    assert [item['type'] for item in delivered] == ['calendar']
+    assert leader.pull() == [] and follower.pull() == []
+
+    # 내용이 그대로인 일정은 재구성해도 오늘 알림을 다시 보내지 않음
+    leader.refresh(store)
+    assert leader.fire_due() == 0
+
+
+def test_settings_are_shared_between_workers(tmp_path):
+    leader, follower = make_scheduler(tmp_path), make_scheduler(tmp_path)
+    settings = server.NotificationSettings(budget={'enabled': True, 'monthlyLimit': 1000})
+    follower.update_settings(settings)
+    assert leader.settings.budget.monthlyLimit == 1000
+
+
+def test_budget_alert_is_not_repeated_after_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(server.expense_rollups, 'month_total', lambda month, kind: 600)
+    settings = server.NotificationSettings(budget={'enabled': True, 'monthlyLimit': 1000})
+    store = server.RecordStore(str(tmp_path / "records.sqlite3"))
+    first = make_scheduler(tmp_path)
+    assert first.try_lead(store) is True
+    first.update_settings(settings)
+    assert len(first.pull()) == 2
+
+    # 리더 프로세스가 내려가고 다른 워커가 이어받아도 같은 달 같은 임계값은 다시 보내지 않음
+    first._leader_lock.close()
+    restarted = make_scheduler(tmp_path)
+    assert restarted.try_lead(store) is True
+    restarted.check_budget()
+    assert restarted.pull() == []
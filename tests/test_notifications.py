@@ -0,0 +1,83 @@
+"""서버 측 알림 스케줄러 (user-041)"""
+from datetime import timedelta
+
+import server
+
+
+def scheduler_with(records):
+    scheduler = server.NotificationScheduler(100)
+    scheduler.rebuild(records)
+    return scheduler
+
+
+def test_dday_alert_fires_at_kst_midnight():
+    today = server.NotificationScheduler._today()
+    event = today + timedelta(days=15)
+    scheduler = scheduler_with([{'id': 's1', 'title': '시험', 'date': event.isoformat(), 'isDday': True}])
+
+    assert scheduler.fire_due(server._kst_midnight(event - timedelta(days=10)) - 1) == 0
+    assert scheduler.fire_due(server._kst_midnight(event - timedelta(days=10))) == 1
+    [notification] = scheduler.pull()
+    assert notification['title'] == 'D-Day 알림' and "10일 남았습니다" in notification['message']
+    assert notification['relatedData'] == {'view': 'CALENDAR', 'date': event.isoformat()}
+
+
+def test_changed_or_deleted_records_leave_stale_entries():
+    today = server.NotificationScheduler._today()
+    record = {'id': 's1', 'title': '회의', 'date': (today + timedelta(days=3)).isoformat()}
+    scheduler = scheduler_with([record])
+    scheduler.on_change('schedule', record, None)
+
+    assert scheduler.fire_due(server._kst_midnight(today + timedelta(days=3))) == 0
+    assert scheduler.counters['stale_skipped'] == 1
+    assert scheduler.next_fire_at() is None
+
+
+def test_unparsable_record_is_skipped_not_fatal():
+    today = server.NotificationScheduler._today()
+    scheduler = scheduler_with([
+        {'id': 'bad', 'title': '상대 날짜', 'date': '내일'},
+        {'id': 'rule', 'title': '규칙 오류', 'date': today.isoformat(), 'recurrence': {'freq': 'hourly'}},
+        {'id': 'ok', 'title': '회의', 'date': today.isoformat()},
+    ])
+    assert scheduler.counters['invalid'] == 2
+    scheduler.on_change('schedule', None, {'id': 'bad2', 'title': '빈 날짜', 'date': ''})
+    assert scheduler.fire_due(server._kst_midnight(today)) == 1
+
+
+def test_fire_due_uses_the_request_clock():
+    frozen = server.KST.localize(server.datetime(2030, 6, 1, 9, 0))
+    token = server.frozen_now.set(frozen)
+    try:
+        scheduler = scheduler_with([{'id': 's1', 'title': '회의', 'date': '2030-06-01'}])
+        assert scheduler.fire_due() == 1
+        assert scheduler.pull()[0]['timestamp'].startswith('2030-06-01')
+    finally:
+        server.frozen_now.reset(token)
+
+
+def test_disabled_calendar_alerts_are_not_sent():
+    today = server.NotificationScheduler._today()
+    scheduler = scheduler_with([{'id': 's1', 'title': '회의', 'date': today.isoformat()}])
+    scheduler.update_settings(server.NotificationSettings(calendar={'enabled': False}))
+    assert scheduler.fire_due(server._kst_midnight(today)) == 0
+    assert scheduler.pull() == []
+
+
+def test_budget_thresholds_fire_once_per_month(monkeypatch):
+    monkeypatch.setattr(server.expense_rollups, 'month_total', lambda month, kind: 600)
+    scheduler = server.NotificationScheduler(100)
+    scheduler.update_settings(server.NotificationSettings(budget={'enabled': True, 'monthlyLimit': 1000}))
+    messages = [item['message'] for item in scheduler.pull()]
+    assert [message.split('한도의 ')[1][:3] for message in messages] == ['30%', '50%']
+
+    scheduler.check_budget()
+    assert scheduler.pull() == []
+
+
+def test_outbox_keeps_the_newest_notifications(tmp_path):
+    outbox = server.NotificationOutbox(str(tmp_path / "notifications.sqlite3"), 2)
+    outbox.push([{'id': '1'}, {'id': '2'}])
+    outbox.push([{'id': '3'}])
+    assert outbox.count() == 2
+    assert [item['id'] for item in outbox.pull()] == ['2', '3']
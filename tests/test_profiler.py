@@ -0,0 +1,50 @@
+"""관리자 전용 요청 프로파일링 (user-035)"""
+import pstats
+import tempfile
+
+import server
+
+ADMIN = {"x-admin-token": "test-admin"}
+
+
+def test_profiling_requires_admin_token(client, monkeypatch):
+    assert client.get("/api/admin/profile").status_code == 403
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "test-admin")
+    assert client.get("/api/admin/profile", headers={"x-admin-token": "wrong"}).status_code == 403
+    assert client.get("/api/admin/profile", headers=ADMIN).status_code == 200
+
+
+def test_next_request_is_profiled_then_disarmed(client, model_output, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "test-admin")
+    model_output({"expenses": [{"date": "2024-01-01", "item": "국수", "amount": 5000, "type": "expense"}]})
+    session = client.post("/api/admin/profile", json={"count": 1}, headers=ADMIN).json()
+
+    assert client.post("/api/process", json={"text": "오늘 국수 5000원 먹었어"}).status_code == 200
+    listing = client.get("/api/admin/profile", headers=ADMIN).json()
+    assert listing["armed"] is False
+    assert [item["completed"] for item in listing["sessions"] if item["id"] == session["id"]] == [1]
+
+    response = client.get(f"/api/admin/profile/{session['id']}", headers=ADMIN)
+    assert response.status_code == 200
+    with tempfile.NamedTemporaryFile(suffix=".pstats") as f:
+        f.write(response.content)
+        f.flush()
+        assert pstats.Stats(f.name).total_calls > 0
+    # cprofile 세션에는 스택 샘플이 없음
+    assert client.get(f"/api/admin/profile/{session['id']}", params={"format": "collapsed"},
+                      headers=ADMIN).status_code == 404
+
+
+def test_stack_sampling_collects_collapsed_stacks():
+    profiler = server.RequestProfiler()
+    session = profiler.arm(1, "stack", False, 1.0)
+
+    def busy():
+        total = 0
+        for i in range(3_000_000):
+            total += i
+        return total
+
+    assert profiler.call(busy) == sum(range(3_000_000))
+    assert session.stacks and any("busy" in stack for stack in session.stacks)
+    assert profiler.call(lambda: 1) == 1 and session.completed == 1
@@ -0,0 +1,67 @@
+"""서버 측 레코드 저장소와 /api/process 연동 (user-030)"""
+import json
+
+import server
+
+
+def test_crud_and_indexed_range_query(client):
+    created = client.post("/api/records/schedule", json=[
+        {"title": "저장소 테스트 A", "date": "2031-03-01", "time": "09:00"},
+        {"title": "저장소 테스트 B", "date": "2031-03-15"},
+        {"title": "저장소 테스트 C", "date": "2031-04-01"},
+    ]).json()
+    assert all(item["id"] for item in created)
+
+    march = client.get("/api/records/schedule", params={"start": "2031-03-01", "end": "2031-03-31"}).json()
+    assert [item["title"] for item in march] == ["저장소 테스트 A", "저장소 테스트 B"]
+
+    record_id = created[0]["id"]
+    assert client.patch(f"/api/records/schedule/{record_id}", json={"time": "10:00"}).json()["time"] == "10:00"
+    assert client.delete(f"/api/records/schedule/{record_id}").status_code == 200
+    assert client.get(f"/api/records/schedule/{record_id}").status_code == 404
+
+
+def test_invalid_record_is_422(client):
+    assert client.post("/api/records/expenses", json={"item": "금액 없음"}).status_code == 422
+
+
+def test_process_persists_extracted_records_once(client, model_output):
+    expense = {"date": "2031-05-02", "item": "저장소 칼국수", "amount": 8123, "type": "expense", "category": "식비"}
+    model_output({"expenses": [expense]})
+    before = server.record_store.count("expenses")
+
+    first = client.post("/api/process", json={"text": "오늘 저장소 칼국수 8123원 먹었어"}).json()
+    saved = first["dataExtraction"]["expenses"][0]
+    assert saved["isDuplicate"] is False
+    assert server.record_store.get("expenses", saved["id"])["item"] == "저장소 칼국수"
+    assert server.record_store.count("expenses") == before + 1
+
+    second = client.post("/api/process", json={"text": "오늘 저장소 칼국수 8123원 먹었어!"}).json()
+    assert second["dataExtraction"]["expenses"][0]["isDuplicate"] is True
+    assert server.record_store.count("expenses") == before + 1
+
+
+def test_cross_reference_searches_store_even_with_context(client, model_output):
+    server.record_store.add("contacts", {"name": "저장소민수", "phone": "010-7777-1234"})
+    model_output("")
+    response = client.post("/api/process", json={
+        "text": "연락처의 저장소민수를 메모에 저장해줘",
+        "contextData": {"contacts": [{"name": "다른사람", "phone": "010-0000-0000"}]},
+    }).json()
+    assert "010-7777-1234" in json.dumps(response["dataExtraction"], ensure_ascii=False)
+
+
+def test_unresolved_dates_are_rejected(client):
+    assert client.post("/api/records/schedule", json={"title": "날짜 없음", "date": "내일"}).status_code == 422
+    assert client.post("/api/records/expenses", json={"date": "", "item": "국수", "amount": 1,
+                                                      "type": "expense"}).status_code == 422
+    assert client.post("/api/records/diary", json={"date": "2031-02-30", "entry": "없는 날"}).status_code == 422
+
+
+def test_process_skips_records_with_unresolved_dates(client, model_output):
+    model_output({"schedule": [{"title": "저장소 상대날짜 회의", "date": "내일", "time": "15:00"}]})
+    before = server.record_store.count("schedule")
+    response = client.post("/api/process", json={"text": "내일 3시 저장소 상대날짜 회의"})
+    assert response.status_code == 200
+    assert server.record_store.count("schedule") == before
+    assert "id" not in response.json()["dataExtraction"]["schedule"][0]
@@ -0,0 +1,44 @@
+"""요청 크기 상한 (user-045)"""
+import msgpack
+import pydantic
+import pytest
+
+import server
+
+MSGPACK_HEADERS = {"content-type": server.MSGPACK_MEDIA_TYPE}
+
+
+def test_oversized_msgpack_is_rejected_by_content_length(client, monkeypatch):
+    monkeypatch.setattr(server, "MAX_MSGPACK_BYTES", 1024)
+    body = msgpack.packb({"text": "x" * 2048})
+    response = client.post("/api/process", content=body, headers=MSGPACK_HEADERS)
+    assert response.status_code == 413
+
+
+def test_oversized_msgpack_is_rejected_while_streaming(client, monkeypatch):
+    monkeypatch.setattr(server, "MAX_MSGPACK_BYTES", 1024)
+    chunks = iter([b"\x00" * 512] * 100)
+    response = client.post("/api/process", content=chunks, headers=MSGPACK_HEADERS)
+    assert response.status_code == 413
+
+
+def test_msgpack_within_limit_is_processed(client, model_output, monkeypatch):
+    monkeypatch.setattr(server, "MAX_MSGPACK_BYTES", 1024)
+    model_output({"expenses": [{"date": "2024-01-01", "item": "국수", "amount": 5000, "type": "expense"}]})
+    body = msgpack.packb({"text": "오늘 국수 5000원 먹었어", "contextData": {}})
+    response = client.post("/api/process", content=body, headers=MSGPACK_HEADERS)
+    assert response.status_code == 200
+
+
+def test_oversized_json_is_413(client, monkeypatch):
+    monkeypatch.setattr(server, "MAX_REQUEST_BYTES", 1024)
+    response = client.post("/api/process", json={"text": "hello", "contextData": {
+        "diary": [{"date": "2024-01-01", "entry": "x" * 2048}],
+    }})
+    assert response.status_code == 413
+
+
+def test_too_many_context_records_is_rejected():
+    diary = [{"date": "2024-01-01", "entry": ""}] * (server.MAX_CONTEXT_RECORDS + 1)
+    with pytest.raises(pydantic.ValidationError):
+        server.ProcessRequest.model_validate({"text": "hello", "contextData": {"diary": diary}})
@@ -0,0 +1,54 @@
+"""요청 모델 검증과 orjson/msgpack 인코딩 (user-026)"""
+import msgpack
+import orjson
+
+import server
+
+
+def test_context_records_keep_only_fields_the_server_reads():
+    request = server.ProcessRequest.model_validate({
+        "text": "오늘 국수 5000원",
+        "contextData": {
+            "expenses": [{"id": "e1", "date": "2024-01-01", "item": "국수", "amount": 5000,
+                          "type": "expense", "receiptItems": [1, 2, 3]}],
+            "contacts": [{"id": "c1", "name": "김민수", "phone": "010-1111-2222", "favorite": True}],
+        },
+    })
+    expense = request.contextData.expenses[0]
+    assert isinstance(expense, server.Expense)
+    assert (expense.item, expense.amount) == ("국수", 5000)
+    assert not hasattr(expense, "receiptItems")
+    assert request.contextData.contacts[0].phone == "010-1111-2222"
+    assert request.contextData.schedule == []
+
+
+def test_missing_context_defaults_to_empty():
+    request = server.ProcessRequest.model_validate_json(b'{"text": "hello"}')
+    assert request.contextData.diary == []
+
+
+def test_process_returns_orjson_by_default(client, model_output):
+    model_output({"expenses": [{"date": "2024-01-01", "item": "국수", "amount": 5000, "type": "expense"}]})
+    response = client.post("/api/process", json={"text": "오늘 국수 5000원 먹었어"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/json")
+    body = orjson.loads(response.content)
+    assert body["dataExtraction"]["expenses"][0]["amount"] == 5000
+
+
+def test_process_accepts_and_returns_msgpack(client, model_output):
+    model_output({"expenses": [{"date": "2024-01-01", "item": "라면", "amount": 3000, "type": "expense"}]})
+    response = client.post(
+        "/api/process",
+        content=msgpack.packb({"text": "오늘 라면 3000원 먹었어", "contextData": {}}),
+        headers={"content-type": server.MSGPACK_MEDIA_TYPE, "accept": server.MSGPACK_MEDIA_TYPE},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(server.MSGPACK_MEDIA_TYPE)
+    body = msgpack.unpackb(response.content)
+    assert body["dataExtraction"]["expenses"][0]["item"] == "라면"
+
+
+def test_invalid_request_is_422(client):
+    response = client.post("/api/process", json={"text": 1})
+    assert response.status_code == 422
@@ -0,0 +1,59 @@
+"""학습된 라우터와 라우팅 로그 (user-039)"""
+import json
+
+import pytest
+
+import router
+import server
+
+
+class FixedModel:
+    meta = {}
+
+    def __init__(self, prob):
+        self.prob = prob
+
+    def predict_proba(self, text):
+        return self.prob
+
+
+@pytest.mark.parametrize("text", ["영수증 사진 가계부에 저장해줘", "내일 회의 시간 3시로 변경해줘", "어제 메모 삭제해줘"])
+def test_active_router_cannot_override_hard_rules(text):
+    router = server.LearnedRouter(FixedModel(0.99), 'active', 0.5)
+    can_handle, reason, heuristic, prob = router.route(text)
+    assert can_handle is False and heuristic is False
+    assert reason == server.hard_routing_rule(text)
+
+
+def test_active_router_decides_other_requests():
+    assert server.LearnedRouter(FixedModel(0.99), 'active', 0.5).route("오늘 날씨 어때")[0] is True
+    assert server.LearnedRouter(FixedModel(0.01), 'active', 0.5).route("내일 회의 일정 추가해줘")[0] is False
+
+
+def test_routing_log_does_not_store_raw_personal_data(tmp_path):
+    path = tmp_path / "routing.jsonl"
+    log = server.RoutingLog(str(path), server.TextAnonymizer("salt"))
+    log.record("김민수 010-1234-5678 minsu@example.org 저장해줘", True, None, 'local_success')
+    log._file.close()
+
+    entry = json.loads(path.read_text(encoding='utf-8'))
+    assert entry['outcome'] == 'local_success'
+    for secret in ("김민수", "1234-5678", "minsu@example.org"):
+        assert secret not in entry['text']
+    assert entry['text'].endswith("저장해줘")
+
+
+def test_only_observed_outcomes_become_training_labels(client, tmp_path, monkeypatch):
+    path = tmp_path / "routing.jsonl"
+    monkeypatch.setattr(server, "routing_log", server.RoutingLog(str(path), server.TextAnonymizer("salt")))
+    client.post("/api/process", json={"text": "오늘 날씨 어때"})
+    client.post("/api/process", json={"text": "어제 메모 삭제해줘"})
+    server.routing_log._file.close()
+
+    outcomes = [json.loads(line)['outcome'] for line in path.read_text(encoding='utf-8').splitlines()]
+    assert outcomes == ['heuristic_remote', 'remote_hard']
+    # 휴리스틱 판단(과 이전 형식의 remote)은 학습 라벨이 되지 않음
+    with path.open('a', encoding='utf-8') as f:
+        f.write(json.dumps({'text': '이전 로그', 'outcome': 'remote'}) + "\n")
+    labels = dict(router.load_examples(str(path)))
+    assert list(labels.values()) == [0] and len(labels) == 1
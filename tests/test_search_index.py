@@ -0,0 +1,40 @@
+"""n-gram 통합 검색 색인 (user-034)"""
+import server
+
+
+def build_index():
+    index = server.NgramSearchIndex()
+    index.on_change('contacts', None, {'id': 'c1', 'name': '김민수', 'phone': '010-1234-5678'})
+    index.on_change('schedule', None, {'id': 's1', 'title': '김민수 미팅', 'date': '2024-03-10'})
+    index.on_change('schedule', None, {'id': 's2', 'title': '김민수 저녁', 'date': '2024-05-01'})
+    return index
+
+
+def test_partial_korean_match_and_field_filter():
+    index = build_index()
+    assert {item['id'] for item in index.search('민수')} == {'c1', 's1', 's2'}
+    assert [item['id'] for item in index.search('민수', fields=['name'])] == ['c1']
+    assert [item['id'] for item in index.search('5678')] == ['c1']
+
+
+def test_date_range_keeps_undated_records():
+    index = build_index()
+    found = {item['id'] for item in index.search('김민수', start='2024-03-01', end='2024-03-31')}
+    assert found == {'c1', 's1'}
+
+
+def test_removed_record_is_not_found():
+    index = build_index()
+    index.on_change('schedule', {'id': 's1'}, None)
+    assert 's1' not in {item['id'] for item in index.search('미팅')}
+
+
+def test_single_character_query_matches_last_and_only_character():
+    index = server.NgramSearchIndex()
+    index.on_change('contacts', None, {'id': 'c1', 'name': '김철'})
+    index.on_change('contacts', None, {'id': 'c2', 'name': '박'})
+    assert [item['id'] for item in index.search('철')] == ['c1']
+    assert [item['id'] for item in index.search('박')] == ['c2']
+
+    index.on_change('contacts', {'id': 'c2'}, None)
+    assert index.search('박') == []
@@ -0,0 +1,41 @@
+"""슬롯 템플릿 캐시 (user-042)"""
+import json
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def template_cache(monkeypatch):
+    cache = server.TemplateCache(100, 2, 0.0)
+    monkeypatch.setattr(server, "template_cache", cache)
+    return cache
+
+
+def test_disabled_by_default():
+    assert server.TEMPLATE_CACHE_ENABLED is False
+
+
+def test_same_structure_is_served_from_template(client, model_output, template_cache):
+    model_output("")
+    for text in ("오늘 국수 5000원 먹었어", "오늘 국수 6000원 먹었어"):
+        client.post("/api/process", json={"text": text})
+    response = client.post("/api/process", json={"text": "오늘 국수 3000원 먹었어"}).json()
+    assert "템플릿 캐시" in response["processingDetails"]
+    assert response["dataExtraction"]["expenses"][0]["amount"] == 3000
+    assert response["dataExtraction"]["expenses"][0]["item"] == "국수"
+
+
+def test_cross_reference_result_does_not_leak_to_other_users(client, model_output, template_cache):
+    model_output("")
+    text = "연락처의 한가람을 메모에 저장해줘"
+    alice = {"contacts": [{"id": "c1", "name": "한가람", "phone": "010-1111-2222"}]}
+    for _ in range(2):
+        response = client.post("/api/process", json={"text": text, "contextData": alice}).json()
+        assert "010-1111-2222" in json.dumps(response["dataExtraction"], ensure_ascii=False)
+
+    bob = client.post("/api/process", json={"text": text, "contextData": {}}, headers={"X-User-Id": "bob"}).json()
+    assert "010-1111-2222" not in json.dumps(bob, ensure_ascii=False)
+    assert template_cache.counters["learned"] == 0
+    assert template_cache.counters["hits"] == 0
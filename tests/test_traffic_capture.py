@@ -0,0 +1,74 @@
+"""트래픽 캡처와 재생용 contextData 합성 (user-044)"""
+import json
+
+import replay
+import server
+
+
+def test_capture_records_shape_without_content(tmp_path):
+    path = tmp_path / "capture.jsonl"
+    recorder = server.TrafficRecorder(str(path), "salt")
+    request = server.ProcessRequest.model_validate({
+        "text": "김민수 번호 010-1234-5678 저장해줘",
+        "contextData": {"contacts": [{"name": "이영희", "phone": "010-9999-8888"}] * 3},
+    })
+    recorder.record(request, "user-1", "bulk")
+    recorder._file.close()
+
+    [line] = path.read_text(encoding="utf-8").splitlines()
+    captured = json.loads(line)
+    assert "010-1234-5678" not in captured["text"] and "김민수" not in captured["text"]
+    assert "이영희" not in line and "user-1" not in line
+    assert captured["class"] == "bulk"
+    assert captured["context"]["contacts"][0] == 3
+
+
+def test_disabled_recorder_writes_nothing():
+    recorder = server.TrafficRecorder("", "salt")
+    recorder.record(server.ProcessRequest(text="hello"), "user-1", None)
+    assert not recorder.enabled and recorder.captured == 0
+
+
+def test_replay_context_matches_captured_shape():
+    context = replay.synthesize_context({"diary": [4, 400], "expenses": [2, 10]})
+    assert len(context["diary"]) == 4 and len(context["expenses"]) == 2
+    size = len(json.dumps(context["diary"], ensure_ascii=False).encode())
+    assert abs(size - 400) < 40
+    server.ProcessRequest.model_validate({"text": "hello", "contextData": context})
+
+
+def test_known_contacts_and_addressed_names_are_replaced():
+    anonymizer = server.TextAnonymizer("salt")
+    text = "내일 홍길동이랑 점심, 민수씨한테 연락하고 엄마한테 전화"
+    anonymized = anonymizer.anonymize(text, ["홍길동"])
+    assert "홍길동" not in anonymized and "민수" not in anonymized
+    assert "엄마한테" in anonymized and "내일" in anonymized
+    assert len(anonymized) == len(text)
+
+
+def test_capture_uses_request_contact_names(tmp_path):
+    path = tmp_path / "capture.jsonl"
+    recorder = server.TrafficRecorder(str(path), "salt")
+    request = server.ProcessRequest.model_validate({
+        "text": "박지성 생일 일정 추가해줘",
+        "contextData": {"contacts": [{"name": "박지성", "phone": "010-1111-2222"}]},
+    })
+    recorder.record(request, "user-1", None)
+    recorder._file.close()
+    assert "박지성" not in path.read_text(encoding="utf-8")
+
+
+def test_replay_ignores_server_assigned_ids():
+    first = {"dataExtraction": {"expenses": [{"id": "a1", "item": "국수", "isDuplicate": False}]}}
+    second = {"dataExtraction": {"expenses": [{"id": "b2", "item": "국수", "isDuplicate": True}]}}
+    assert replay.comparable(first) == replay.comparable(second)
+
+
+def test_replayed_requests_are_not_saved(model_output):
+    token = server.frozen_now.set(server.current_kst())
+    try:
+        parsed = {"expenses": [{"date": "2031-07-01", "item": "재생 국수", "amount": 1, "type": "expense"}]}
+        assert server.save_extracted_records(parsed) == 0
+        assert "id" not in parsed["expenses"][0]
+    finally:
+        server.frozen_now.reset(token)